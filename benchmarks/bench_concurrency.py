@@ -0,0 +1,100 @@
+"""Нагрузочный тест совместного режима: N процессов бронируют параллельно.
+
+Пример запуска:
+    python benchmarks/bench_concurrency.py --workers 8 --bookings 200 --cars 50
+
+По завершении проверяется, что ни один автомобиль не забронирован дважды
+на пересекающиеся даты.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car_rental import CarRentalSystem
+
+
+def _prepare(data_dir: str, cars: int, journal: bool):
+    """Создает папку данных с администратором и автомобилями"""
+    system = CarRentalSystem(data_dir=data_dir, journal=journal, shared=True)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    for n in range(cars):
+        system.add_car("Brand", f"Model {n}", 2020, 1000 + n)
+    system.close()
+
+
+def _worker(args) -> int:
+    """Выполняет серию бронирований от имени отдельного пользователя"""
+    data_dir, worker_id, bookings, cars, journal = args
+    rng = random.Random(worker_id)
+    system = CarRentalSystem(data_dir=data_dir, journal=journal, shared=True)
+    username = f"user{worker_id}"
+    system.register_user(username, "pass")
+    system.login(username, "pass")
+
+    today = date.today()
+    booked = 0
+    for _ in range(bookings):
+        start = today + timedelta(days=rng.randint(1, 365))
+        end = start + timedelta(days=rng.randint(1, 7))
+        if system.rent_car(rng.randint(1, cars), start.isoformat(), end.isoformat()) is not None:
+            booked += 1
+    system.close()
+    return booked
+
+
+def _check_overlaps(data_dir: str) -> int:
+    """Считает пары пересекающихся активных аренд одного автомобиля"""
+    system = CarRentalSystem(data_dir=data_dir)
+    by_car = {}
+    for rental in system.rentals:
+        if rental.status == "active":
+            by_car.setdefault(rental.car_id, []).append((rental.start_date, rental.end_date))
+    overlaps = 0
+    for periods in by_car.values():
+        periods.sort()
+        overlaps += sum(
+            1 for prev, cur in zip(periods, periods[1:]) if cur[0] <= prev[1]
+        )
+    system.close()
+    return overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--bookings", type=int, default=200, help="попыток брони на процесс")
+    parser.add_argument("--cars", type=int, default=50)
+    parser.add_argument("--journal", action="store_true", help="режим журнала")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="car_rental_bench_")
+    try:
+        _prepare(data_dir, args.cars, args.journal)
+        tasks = [(data_dir, n, args.bookings, args.cars, args.journal) for n in range(args.workers)]
+
+        started = time.perf_counter()
+        with Pool(args.workers) as pool:
+            booked = sum(pool.map(_worker, tasks))
+        elapsed = time.perf_counter() - started
+
+        attempts = args.workers * args.bookings
+        print(f"Процессов: {args.workers}, попыток: {attempts}, успешных броней: {booked}")
+        print(f"Время: {elapsed:.2f} с, {attempts / elapsed:.0f} операций/с")
+        overlaps = _check_overlaps(data_dir)
+        print(f"Пересекающихся аренд: {overlaps}")
+        sys.exit(1 if overlaps else 0)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Нагрузочный тест HTTP API: много одновременных keep-alive соединений.
+
+Пример запуска:
+    python benchmarks/bench_http.py --clients 2000 --requests 20
+
+Сервер и клиенты работают в одном цикле событий на одном ядре.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car_rental import CarRentalSystem
+from rental_server import RentalServer
+
+REQUEST = b"GET /cars/available HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+
+async def _client(host: str, port: int, requests: int) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    done = 0
+    try:
+        for _ in range(requests):
+            writer.write(REQUEST)
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            done += 1
+    finally:
+        writer.close()
+    return done
+
+
+async def _run(system: CarRentalSystem, clients: int, requests: int):
+    server = RentalServer(system)
+    host, port = await server.start("127.0.0.1", 0)
+    try:
+        started = time.perf_counter()
+        done = sum(await asyncio.gather(*(_client(host, port, requests) for _ in range(clients))))
+        elapsed = time.perf_counter() - started
+    finally:
+        await server.stop()
+    print(f"Соединений: {clients}, запросов: {done}")
+    print(f"Время: {elapsed:.2f} с, {done / elapsed:.0f} запросов/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20, help="запросов на соединение")
+    parser.add_argument("--cars", type=int, default=20)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="car_rental_bench_")
+    try:
+        system = CarRentalSystem(data_dir=data_dir, journal=True)
+        system.register_user("admin", "admin123", "admin")
+        system.login("admin", "admin123")
+        for n in range(args.cars):
+            system.add_car("Brand", f"Model {n}", 2020, 1000 + n)
+        asyncio.run(_run(system, args.clients, args.requests))
+        system.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
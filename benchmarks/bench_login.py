@@ -0,0 +1,76 @@
+"""Скорость входа: открытые пароли против хешей PBKDF2 и кеша проверок.
+
+Пример запуска:
+    python benchmarks/bench_login.py --users 20 --logins 200 --threads 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car_rental import CarRentalSystem, PasswordHasher, User
+
+
+class PlainTextHasher(PasswordHasher):
+    """Прежнее поведение: пароль сравнивается как есть"""
+    def hash(self, password: str) -> str:
+        return password
+
+    def is_hashed(self, stored: str) -> bool:
+        return True
+
+    def verify(self, username: str, password: str, stored: str) -> bool:
+        return stored == password
+
+
+def _measure(title: str, system: CarRentalSystem, users: int, logins: int, threads: int):
+    names = [f"user{n % users}" for n in range(logins)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(lambda name: system.authenticate(name, "password"), names))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    print(f"{title:<40} {logins / elapsed:>10.0f} входов/с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="car_rental_bench_")
+    try:
+        system = CarRentalSystem(data_dir=data_dir, journal=True,
+                                 password_iterations=args.iterations)
+
+        # До: пароли открытым текстом
+        system.users.extend(User(f"user{n}", "password") for n in range(args.users))
+        system._save_users()
+        system.hasher = PlainTextHasher()
+        _measure("Открытый текст (до)", system, args.users, args.logins, args.threads)
+
+        # После: хеши PBKDF2, сначала без кеша, затем с кешем
+        system.hasher = PasswordHasher(args.iterations, cache_size=0)
+        for user in system.users:
+            user.password = system.hasher.hash("password")
+        _measure("PBKDF2 без кеша, 1 поток", system, args.users, args.logins // 10, 1)
+        _measure(f"PBKDF2 без кеша, {args.threads} потоков", system, args.users,
+                 args.logins // 10, args.threads)
+        system.hasher.cache_size = 1024
+        _measure(f"PBKDF2 с кешем, {args.threads} потоков", system, args.users,
+                 args.logins, args.threads)
+        system.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
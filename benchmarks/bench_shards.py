@@ -0,0 +1,81 @@
+"""Пропускная способность бронирования в зависимости от числа шардов.
+
+Пример запуска:
+    python benchmarks/bench_shards.py --shards 1 2 4 8 --cars 2000 --bookings 50000
+
+Для каждого числа шардов создается ShardedRentalSystem (режим журнала),
+в него добавляются автомобили, а затем --clients потоков отправляют брони
+пачками по --batch через rent_cars. Печатается число броней в секунду и
+ускорение относительно первого варианта. Рост ограничен числом ядер:
+os.cpu_count() печатается вместе с результатом.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rental_shards import ShardedRentalSystem
+
+
+def run(shards: int, cars: int, bookings: int, clients: int, batch: int, seed: int) -> float:
+    data_dir = tempfile.mkdtemp(prefix="bench_shards_")
+    system = ShardedRentalSystem(data_dir, shards=shards, password_iterations=1000, journal=True)
+    try:
+        system.register_user("admin", "admin123", "admin")
+        session = system.start_session("admin", "admin123")
+        car_ids = [system.add_car("Kia", "Rio", 2020, 2000, session) for _ in range(cars)]
+
+        rng = random.Random(seed)
+        today = date.today()
+        requests = []
+        for _ in range(bookings):
+            start = today + timedelta(days=rng.randint(1, 365))
+            requests.append((rng.choice(car_ids), start.isoformat(),
+                             (start + timedelta(days=rng.randint(1, 3))).isoformat()))
+
+        def client(part):
+            for i in range(0, len(part), batch):
+                system.rent_cars(part[i:i + batch], session)
+
+        threads = [threading.Thread(target=client, args=(requests[n::clients],)) for n in range(clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return bookings / (time.perf_counter() - started)
+    finally:
+        system.close()
+        shutil.rmtree(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cars", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = {}
+    for shards in args.shards:
+        rate = run(shards, args.cars, args.bookings, args.clients, args.batch, args.seed)
+        results[shards] = {"bookings_per_s": round(rate)}
+    first = results[args.shards[0]]["bookings_per_s"]
+    for result in results.values():
+        result["speedup"] = round(result["bookings_per_s"] / first, 2)
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
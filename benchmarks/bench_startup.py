@@ -0,0 +1,60 @@
+"""Время запуска системы с JSON-снимком и с двоичным снимком.
+
+Пример запуска:
+    python benchmarks/bench_startup.py --cars 10000 --rentals 1000000
+
+Генерирует данные (benchmarks/datagen.py), переводит их в двоичный формат
+(rental_snapshot.py) и замеряет создание CarRentalSystem — загрузку
+автомобилей, пользователей и аренд с построением индексов — для обоих
+форматов, а также размеры файлов снимков.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_suite import _measure
+from car_rental import CarRentalSystem
+from datagen import generate
+from rental_snapshot import to_binary
+
+
+def run(data_dir: str, repeat: int) -> dict:
+    results = {}
+    for snapshot in ("json", "binary"):
+        extension = ".bin" if snapshot == "binary" else ".json"
+        timing = _measure(
+            lambda i: CarRentalSystem(data_dir=data_dir, snapshot=snapshot).close(), repeat
+        )
+        timing["bytes"] = sum(
+            os.path.getsize(os.path.join(data_dir, kind + extension)) for kind in ("cars", "rentals")
+        )
+        results[snapshot] = timing
+    results["speedup"] = round(results["json"]["median_ms"] / results["binary"]["median_ms"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cars", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rentals", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        generate(data_dir, args.cars, args.users, args.rentals, args.seed, iterations=1000)
+        to_binary(data_dir)
+        print(json.dumps(run(data_dir, args.repeat), indent=2))
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Набор замеров основных операций на синтетических данных.
+
+Пример запуска:
+    python benchmarks/bench_suite.py --cars 10000 --users 100000 --rentals 1000000 \
+        --output results.json --baseline benchmarks/baseline.json
+
+Данные создает benchmarks/datagen.py. Для каждой операции записываются
+минимальное, медианное и среднее время (мс). Результаты сохраняются в JSON;
+с --baseline медиана каждой операции сравнивается с сохраненной, и если она
+хуже больше чем на --threshold (по умолчанию 25%), операция отмечается как
+регрессия, а скрипт завершается с кодом 1. --save-baseline записывает
+текущий замер как новый эталон.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car_rental import Car, CarRentalSystem, Rental, User, iter_json_array
+from datagen import PASSWORD, generate
+
+
+def _measure(func: Callable[[int], object], repeat: int) -> Dict[str, float]:
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        times.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.mean(times), 3),
+    }
+
+
+def _fill_sqlite(data_dir: str, batch_size: int = 50000):
+    """Переносит сгенерированные JSON-файлы в базу SQLite пакетами"""
+    system = CarRentalSystem(data_dir=data_dir, storage="sqlite")
+    for name, model, add in (("cars.json", Car, system.storage.add_cars),
+                             ("users.json", User, system.storage.add_users),
+                             ("rentals.json", Rental, system.storage.add_rentals)):
+        batch = []
+        for data in iter_json_array(os.path.join(data_dir, name)):
+            batch.append(model.from_dict(data))
+            if len(batch) >= batch_size:
+                add(batch)
+                batch = []
+        add(batch)
+    system.close()
+
+
+def run_suite(data_dir: str, storage: str, cars: int, users: int, repeat: int,
+              seed: int, journal: bool = False) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed)
+    # Кеш запросов отключен, чтобы замерять сами запросы
+    system = CarRentalSystem(data_dir=data_dir, storage=storage, journal=journal, query_cache_size=0)
+    results = {}
+    try:
+        results["load_data"] = _measure(lambda i: system._load_data(), repeat)
+
+        # Каждый вход — новый пользователь, то есть с полной проверкой хеша
+        results["login"] = _measure(lambda i: system.login(f"user{i % max(users, 1)}", PASSWORD), repeat)
+        system.login("user0" if users else "admin", PASSWORD)
+
+        def window(i: int):
+            start = date.today() + timedelta(days=rng.randint(0, 60))
+            return start.isoformat(), (start + timedelta(days=rng.randint(1, 7))).isoformat()
+
+        results["get_available_cars"] = _measure(lambda i: system.get_available_cars(*window(i)), repeat)
+
+        # Новые аренды — далеко за пределами сгенерированной истории
+        far = date.today() + timedelta(days=3650)
+        booked: List[int] = []
+
+        def rent(i: int):
+            start = far + timedelta(days=3 * i)
+            if system.rent_car(rng.randint(1, cars), start.isoformat(),
+                               (start + timedelta(days=2)).isoformat()) is not None:
+                booked.append(i)
+
+        results["rent_car"] = _measure(rent, repeat)
+        results["get_user_rentals"] = _measure(lambda i: system.get_user_rentals(), repeat)
+
+        own = [rental.id for rental in system.get_user_rentals() if rental.status == "active"]
+        results["cancel_rental"] = _measure(
+            lambda i: system.cancel_rental(own[i]) if i < len(own) else None, min(repeat, len(own))
+        ) if own else None
+
+        for name in ("_save_cars", "_save_rentals", "_save_users"):
+            results[name] = _measure(lambda i: getattr(system, name)(), repeat)
+    finally:
+        system.close()
+    return {name: result for name, result in results.items() if result is not None}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Печатает сравнение с эталоном, возвращает список операций с регрессией"""
+    regressions = []
+    print(f"{'операция':<20} {'эталон, мс':>12} {'сейчас, мс':>12} {'изменение':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<20} {'—':>12} {result['median_ms']:>12.3f}")
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = "  РЕГРЕССИЯ"
+        print(f"{name:<20} {base['median_ms']:>12.3f} {result['median_ms']:>12.3f} "
+              f"{(ratio - 1) * 100:>+9.1f}%{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cars", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rentals", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--journal", action="store_true", help="режим журнала изменений")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=200000, help="итерации PBKDF2 в хешах")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="эталонный JSON для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат в --baseline")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="car_rental_bench_")
+    try:
+        started = time.perf_counter()
+        generate(data_dir, args.cars, args.users, args.rentals, args.seed, args.iterations)
+        if args.storage == "sqlite":
+            _fill_sqlite(data_dir)
+        print(f"Данные подготовлены за {time.perf_counter() - started:.1f} с")
+        results = run_suite(data_dir, args.storage, args.cars, args.users, args.repeat, args.seed,
+                            args.journal)
+    finally:
+        shutil.rmtree(data_dir)
+
+    report = {
+        "meta": {
+            "cars": args.cars, "users": args.users, "rentals": args.rentals,
+            "seed": args.seed, "storage": args.storage, "journal": args.journal, "repeat": args.repeat,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "date": date.today().isoformat(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Эталон записан в {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sizes = ("cars", "users", "rentals", "storage", "journal")
+        if any(baseline["meta"].get(key) != report["meta"][key] for key in sizes):
+            print("Внимание: размеры данных отличаются от эталона")
+        if compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print(f"{name:<20} медиана {result['median_ms']:>10.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
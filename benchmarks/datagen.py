@@ -0,0 +1,141 @@
+"""Детерминированный генератор данных для нагрузочных тестов.
+
+Пример запуска:
+    python benchmarks/datagen.py data_big --cars 10000 --users 100000 --rentals 1000000
+
+Файлы пишутся потоково в формате папки data (cars.json, users.json,
+rentals.json), поэтому история в миллионы аренд не держится в памяти.
+При одинаковых размерах, seed и дате отсчета (--today, по умолчанию
+сегодня) получаются одинаковые данные.
+
+Все пользователи (user0, user1, ...) и администратор admin получают пароль
+"password"; хеш вычисляется один раз и используется для всех записей.
+Аренды одного автомобиля идут подряд без пересечений: прошлые имеют
+статус completed или cancelled, будущие — active.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car_rental import PasswordHasher
+
+BRANDS = {
+    "Toyota": ["Camry", "Corolla", "RAV4"],
+    "Kia": ["Rio", "Ceed", "Sportage"],
+    "BMW": ["X3", "X5", "320"],
+    "Lada": ["Vesta", "Granta", "Niva"],
+    "Skoda": ["Octavia", "Rapid", "Kodiaq"],
+    "Hyundai": ["Solaris", "Creta", "Tucson"],
+}
+PASSWORD = "password"
+
+
+def iter_cars(count: int, seed: int) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    brands = sorted(BRANDS)
+    for car_id in range(1, count + 1):
+        brand = rng.choice(brands)
+        yield {
+            "id": car_id,
+            "brand": brand,
+            "model": rng.choice(BRANDS[brand]),
+            "year": rng.randint(2012, 2024),
+            "daily_price": float(rng.randrange(1500, 9000, 100)),
+            "available": True,
+        }
+
+
+def iter_users(count: int, password_hash: str) -> Iterator[Dict]:
+    yield {"username": "admin", "password": password_hash, "role": "admin"}
+    for n in range(count):
+        yield {"username": f"user{n}", "password": password_hash, "role": "customer"}
+
+
+def iter_rentals(count: int, cars: int, users: int, seed: int,
+                 today: date) -> Iterator[Dict]:
+    """История аренд: по каждому автомобилю цепочка непересекающихся периодов.
+
+    Цепочка начинается в прошлом, так что большая часть аренд завершена,
+    а последние (около 5%) приходятся на будущее и активны.
+    """
+    rng = random.Random(seed + 1)
+    per_car, extra = divmod(count, cars) if cars else (0, 0)
+    # Аренда вместе с промежутком до следующей занимает в среднем 6 дней
+    future_share = 0.05
+    rental_id = 0
+    for car_id in range(1, cars + 1):
+        length = per_car + (1 if car_id <= extra else 0)
+        if not length:
+            continue
+        price = float(1500 + (car_id * 37) % 7500)
+        day = today - timedelta(days=int(length * (1 - future_share) * 6))
+        for _ in range(length):
+            start = day + timedelta(days=rng.randint(0, 4))
+            end = start + timedelta(days=rng.randint(1, 5))
+            day = end + timedelta(days=1)
+            rental_id += 1
+            if start > today:
+                status = "active"
+            else:
+                status = "cancelled" if rng.random() < 0.1 else "completed"
+            yield {
+                "id": rental_id,
+                "car_id": car_id,
+                "username": f"user{rng.randrange(users)}" if users else "admin",
+                "start_date": start.isoformat(),
+                "end_date": end.isoformat(),
+                "total_price": (end - start).days * price,
+                "status": status,
+            }
+
+
+def write_array(path: str, records: Iterator[Dict]) -> int:
+    """Пишет JSON-массив по одной записи, возвращает их количество"""
+    count = 0
+    with open(path, "w") as f:
+        f.write("[")
+        for record in records:
+            f.write(("," if count else "") + "\n" + json.dumps(record))
+            count += 1
+        f.write("\n]")
+    return count
+
+
+def generate(data_dir: str, cars: int, users: int, rentals: int, seed: int = 42,
+             iterations: int = 200000, today: Optional[date] = None) -> Dict[str, int]:
+    """Создает папку данных заданного размера"""
+    os.makedirs(data_dir, exist_ok=True)
+    today = today or date.today()
+    password_hash = PasswordHasher(iterations).hash(PASSWORD)
+    return {
+        "cars": write_array(os.path.join(data_dir, "cars.json"), iter_cars(cars, seed)),
+        "users": write_array(os.path.join(data_dir, "users.json"), iter_users(users, password_hash)),
+        "rentals": write_array(os.path.join(data_dir, "rentals.json"),
+                               iter_rentals(rentals, cars, users, seed, today)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data_dir")
+    parser.add_argument("--cars", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rentals", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--today", type=date.fromisoformat, help="дата отсчета ГГГГ-ММ-ДД")
+    args = parser.parse_args()
+
+    counts = generate(args.data_dir, args.cars, args.users, args.rentals, args.seed,
+                      args.iterations, args.today)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,40 @@
+import hashlib
+import hmac
 import json
+import logging
+import mmap
 import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, date
-from typing import List, Dict, Optional
+from heapq import heapify, heappop, heappush
+from itertools import islice
+from typing import List, Dict, Optional, Iterator, Tuple, Set
+
+from rental_changes import ChangeFeed
+from rental_metrics import BYTES_BUCKETS, RECORDS_BUCKETS, metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+def to_ordinal(iso_date: str) -> int:
+    """Переводит дату ГГГГ-ММ-ДД в порядковый номер дня"""
+    return date.fromisoformat(iso_date).toordinal()
 
 class Car:
+    __slots__ = ('id', 'brand', 'model', 'year', 'daily_price', 'available')
+    
     def __init__(self, id: int, brand: str, model: str, year: int, daily_price: float, available: bool = True):
         self.id = id
         self.brand = brand
@@ -37,6 +68,8 @@ class Car:
         return f"{self.brand} {self.model} ({self.year}) - {self.daily_price} руб/день"
 
 class Rental:
+    __slots__ = ('id', 'car_id', 'username', 'start_date', 'end_date', 'total_price', 'status')
+    
     def __init__(self, id: int, car_id: int, username: str, start_date: str, end_date: str, total_price: float, status: str = "active"):
         self.id = id
         self.car_id = car_id
@@ -73,6 +106,8 @@ class Rental:
         return f"Аренда #{self.id}: с {self.start_date} по {self.end_date} - {self.total_price} руб."
 
 class User:
+    __slots__ = ('username', 'password', 'role')
+    
     def __init__(self, username: str, password: str, role: str = "customer"):
         self.username = username
         self.password = password
@@ -93,115 +128,2471 @@ class User:
             role=data['role']
         )
 
-class CarRentalSystem:
+class RentalTable:
+    """Компактное колоночное хранение истории аренд.
+
+    Каждое поле хранится в отдельном массиве array: id и car_id — целые,
+    даты — порядковые номера дней, стоимость — double, статус и имя
+    пользователя — индексы в таблицах строк. Одна аренда занимает
+    несколько десятков байт вместо объекта со строками, а сравнение
+    дат сводится к сравнению целых чисел.
+    """
     def __init__(self):
-        self.data_dir = "data"
-        self.cars_file = os.path.join(self.data_dir, "cars.json")
-        self.rentals_file = os.path.join(self.data_dir, "rentals.json")
-        self.users_file = os.path.join(self.data_dir, "users.json")
-        self.current_user: Optional[User] = None
+        self.ids = array('q')
+        self.car_ids = array('q')
+        self.user_codes = array('l')
+        self.starts = array('l')
+        self.ends = array('l')
+        self.prices = array('d')
+        self.status_codes = array('b')
+        self.usernames: List[str] = []
+        self.statuses: List[str] = []
+        self._user_index: Dict[str, int] = {}
+        self._status_index: Dict[str, int] = {}
+    
+    @staticmethod
+    def _intern(value: str, values: List[str], index: Dict[str, int]) -> int:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+    
+    def status_code(self, status: str) -> int:
+        """Код статуса в таблице (добавляет статус, если его еще нет)"""
+        return self._intern(status, self.statuses, self._status_index)
+    
+    def append(self, rental: Rental):
+        """Добавляет аренду в конец таблицы"""
+        self.ids.append(rental.id)
+        self.car_ids.append(rental.car_id)
+        self.user_codes.append(self._intern(rental.username, self.usernames, self._user_index))
+        self.starts.append(to_ordinal(rental.start_date))
+        self.ends.append(to_ordinal(rental.end_date))
+        self.prices.append(rental.total_price)
+        self.status_codes.append(self.status_code(rental.status))
+    
+    def append_dict(self, data: Dict):
+        """Добавляет аренду из словаря формата Rental.to_dict"""
+        self.append(Rental.from_dict(data))
+    
+    @classmethod
+    def from_rentals(cls, rentals) -> 'RentalTable':
+        table = cls()
+        for rental in rentals:
+            table.append(rental)
+        return table
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, i: int) -> Rental:
+        return Rental(
+            id=self.ids[i],
+            car_id=self.car_ids[i],
+            username=self.usernames[self.user_codes[i]],
+            start_date=date.fromordinal(self.starts[i]).isoformat(),
+            end_date=date.fromordinal(self.ends[i]).isoformat(),
+            total_price=self.prices[i],
+            status=self.statuses[self.status_codes[i]]
+        )
+    
+    def __iter__(self) -> Iterator[Rental]:
+        for i in range(len(self.ids)):
+            yield self[i]
+    
+    def to_dicts(self) -> Iterator[Dict]:
+        """Перебирает аренды в формате Rental.to_dict"""
+        for rental in self:
+            yield rental.to_dict()
+    
+    def busy_car_ids(self, start_date: str, end_date: str) -> Set[int]:
+        """Автомобили с активными арендами, пересекающими период"""
+        start, end = to_ordinal(start_date), to_ordinal(end_date)
+        active = self._status_index.get("active")
+        if active is None:
+            return set()
+        starts, ends, codes, car_ids = self.starts, self.ends, self.status_codes, self.car_ids
+        return {
+            car_ids[i] for i in range(len(car_ids))
+            if codes[i] == active and starts[i] <= end and ends[i] >= start
+        }
+    
+    def nbytes(self) -> int:
+        """Объем памяти, занятый массивами столбцов"""
+        columns = (self.ids, self.car_ids, self.user_codes, self.starts,
+                   self.ends, self.prices, self.status_codes)
+        return sum(column.itemsize * len(column) for column in columns)
+
+class CarSchedule:
+    """Интервальный индекс активных аренд одного автомобиля.
+
+    Интервалы [start, end] (порядковые номера дней, включительно) хранятся
+    отсортированными по дате начала и не пересекаются, поэтому проверка
+    пересечения сводится к одному бинарному поиску и сравнению целых.
+    """
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.rental_ids: List[int] = []
+    
+    def is_free(self, start: int, end: int) -> bool:
+        """Проверяет, что период не пересекается ни с одной арендой"""
+        i = bisect_right(self.starts, end)
+        return i == 0 or self.ends[i - 1] < start
+    
+    def add(self, rental: Rental):
+        """Добавляет аренду в индекс"""
+        start = to_ordinal(rental.start_date)
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, to_ordinal(rental.end_date))
+        self.rental_ids.insert(i, rental.id)
+    
+    def remove(self, rental: Rental) -> bool:
+        """Удаляет аренду из индекса"""
+        start = to_ordinal(rental.start_date)
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.rental_ids[i] == rental.id:
+                del self.starts[i]
+                del self.ends[i]
+                del self.rental_ids[i]
+                return True
+            i += 1
+        return False
+    
+    def __len__(self) -> int:
+        return len(self.starts)
+
+class OccupancyCalendar:
+    """Битовые карты занятости автомобилей на скользящем горизонте дней.
+
+    Бит i карты автомобиля (обычное int) означает, что день origin + i
+    занят активной арендой. Проверка периода сводится к AND с маской,
+    а число занятых автомобилей по дням хранится счетчиками, которые
+    обновляются вместе с картами.
+    """
+    def __init__(self, horizon: int = 90, origin: Optional[int] = None):
+        self.horizon = horizon
+        self.origin = date.today().toordinal() if origin is None else origin
+        self.bitmaps: Dict[int, int] = {}
+        self.busy_counts = array('l', [0]) * horizon
+    
+    def covers(self, start: int, end: int) -> bool:
+        """Период [start, end] целиком внутри горизонта"""
+        return self.origin <= start and end < self.origin + self.horizon
+    
+    def mask(self, start: int, end: int) -> int:
+        """Маска дней периода [start, end], обрезанного по горизонту"""
+        low = max(start - self.origin, 0)
+        high = min(end - self.origin, self.horizon - 1)
+        if high < low:
+            return 0
+        return ((1 << (high - low + 1)) - 1) << low
+    
+    def add_car(self, car_id: int):
+        self.bitmaps.setdefault(car_id, 0)
+    
+    def add(self, rental: Rental):
+        """Отмечает дни аренды занятыми"""
+        bitmap = self.bitmaps.get(rental.car_id, 0)
+        added = self.mask(to_ordinal(rental.start_date), to_ordinal(rental.end_date)) & ~bitmap
+        self.bitmaps[rental.car_id] = bitmap | added
+        self._count(added, 1)
+    
+    def remove(self, rental: Rental):
+        """Освобождает дни аренды"""
+        bitmap = self.bitmaps.get(rental.car_id, 0)
+        removed = self.mask(to_ordinal(rental.start_date), to_ordinal(rental.end_date)) & bitmap
+        self.bitmaps[rental.car_id] = bitmap & ~removed
+        self._count(removed, -1)
+    
+    def _count(self, bits: int, delta: int):
+        counts = self.busy_counts
+        while bits:
+            low = bits & -bits
+            counts[low.bit_length() - 1] += delta
+            bits ^= low
+    
+    def is_free(self, car_id: int, start_date: str, end_date: str) -> bool:
+        return not self.bitmaps.get(car_id, 0) & self.mask(to_ordinal(start_date), to_ordinal(end_date))
+    
+    def free_cars(self, start_date: str, end_date: str) -> List[int]:
+        """id автомобилей, свободных весь период"""
+        mask = self.mask(to_ordinal(start_date), to_ordinal(end_date))
+        return [car_id for car_id, bitmap in self.bitmaps.items() if not bitmap & mask]
+    
+    def free_days(self, car_id: int) -> List[str]:
+        """Свободные дни автомобиля в пределах горизонта"""
+        bitmap = self.bitmaps.get(car_id, 0)
+        return [
+            date.fromordinal(self.origin + day).isoformat()
+            for day in range(self.horizon) if not bitmap >> day & 1
+        ]
+    
+    def utilization(self) -> List[Tuple[str, float]]:
+        """Доля занятых автомобилей парка по дням горизонта"""
+        fleet = len(self.bitmaps)
+        return [
+            (date.fromordinal(self.origin + day).isoformat(), count / fleet if fleet else 0.0)
+            for day, count in enumerate(self.busy_counts)
+        ]
+    
+    def average_utilization(self, start_date: str, end_date: str) -> float:
+        """Средняя доля занятых автомобилей за дни периода внутри горизонта"""
+        fleet = len(self.bitmaps)
+        low = max(to_ordinal(start_date) - self.origin, 0)
+        high = min(to_ordinal(end_date) - self.origin, self.horizon - 1)
+        if not fleet or high < low:
+            return 0.0
+        return sum(self.busy_counts[low:high + 1]) / (fleet * (high - low + 1))
+    
+    def first_free_window(self, car_id: int, days: int) -> Optional[str]:
+        """Первый день, с которого автомобиль свободен days дней подряд"""
+        if days <= 0 or days > self.horizon:
+            return None
+        # Бит остается установленным, только если за ним свободны все days дней:
+        # сдвиги удваиваются, поэтому нужно O(log days) операций
+        runs = ~self.bitmaps.get(car_id, 0) & ((1 << self.horizon) - 1)
+        covered = 1
+        while covered < days:
+            step = min(covered, days - covered)
+            runs &= runs >> step
+            covered += step
+        if not runs:
+            return None
+        return date.fromordinal(self.origin + (runs & -runs).bit_length() - 1).isoformat()
+    
+    def copy(self) -> "OccupancyCalendar":
+        calendar = OccupancyCalendar(self.horizon, self.origin)
+        calendar.bitmaps = dict(self.bitmaps)
+        calendar.busy_counts = array('l', self.busy_counts)
+        return calendar
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Читает JSON-массив из файла по одному элементу.
+
+    Файл читается блоками по chunk_size символов, элементы разбираются
+    json.JSONDecoder.raw_decode, поэтому в памяти одновременно находится
+    только текущий блок и один элемент, а не весь разобранный массив.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = ""
+        pos = 0
+        eof = False
         
-        self._initialize_data()
-        self._load_data()
+        def skip_whitespace():
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+        
+        skip_whitespace()
+        if buf[pos:pos + 1] != "[":
+            raise ValueError(f"{path}: ожидается JSON-массив")
+        pos += 1
+        
+        skip_whitespace()
+        if buf[pos:pos + 1] == "]":
+            return
+        
+        while True:
+            skip_whitespace()
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            
+            if not complete:
+                # Элемент обрывается на границе блока — дочитываем следующий
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            
+            yield item
+            pos = end
+            skip_whitespace()
+            separator = buf[pos:pos + 1]
+            pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"{path}: некорректный JSON-массив")
+
+class _IsoDates(dict):
+    """Строки ГГГГ-ММ-ДД по порядковому номеру дня, каждая вычисляется один раз"""
+    def __missing__(self, ordinal: int) -> str:
+        value = self[ordinal] = date.fromordinal(ordinal).isoformat()
+        return value
+
+class SnapshotFile:
+    """Двоичный снимок автомобилей или аренд.
+
+    Формат: заголовок, записи фиксированной длины struct и таблица строк.
+    Строковые поля (марка, модель, имя пользователя, статус) хранятся в
+    записи индексом в таблице строк, даты аренды — порядковым номером дня.
+    Файл открывается через mmap, записи разбираются из memoryview без
+    копирования по мере обращения: по индексу или перебором.
+    """
+    MAGIC = b"CRSNAP"
+    VERSION = 1
+    # magic, версия, вид записей, число записей, смещение таблицы строк
+    HEADER = struct.Struct("<6sH4sQQ")
+    KINDS = {
+        # id, марка, модель, год, цена за день, доступен
+        "cars": (b"CARS", struct.Struct("<qIIid?")),
+        # id, car_id, пользователь, начало, окончание, стоимость, статус
+        "rentals": (b"RENT", struct.Struct("<qqIiidI")),
+    }
+    LENGTH = struct.Struct("<I")
     
-    def _initialize_data(self):
+    def __init__(self, path: str, kind: str):
+        tag, self.record = self.KINDS[kind]
+        self.path = path
+        self.kind = kind
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, file_tag, self.count, strings_offset = self.HEADER.unpack_from(self._view)
+        if magic != self.MAGIC or version != self.VERSION or file_tag != tag:
+            self.close()
+            raise ValueError(f"{path}: не двоичный снимок ({kind})")
+        start = self.HEADER.size
+        self._records = self._view[start:start + self.count * self.record.size]
+        self.strings = self._read_strings(strings_offset)
+        self._dates = _IsoDates()
+    
+    def _read_strings(self, offset: int) -> List[str]:
+        (count,) = self.LENGTH.unpack_from(self._view, offset)
+        offset += self.LENGTH.size
+        strings = []
+        for _ in range(count):
+            (length,) = self.LENGTH.unpack_from(self._view, offset)
+            offset += self.LENGTH.size
+            strings.append(str(self._view[offset:offset + length], 'utf-8'))
+            offset += length
+        return strings
+    
+    def _decode(self, fields):
+        strings = self.strings
+        if self.kind == "cars":
+            car_id, brand, model, year, daily_price, available = fields
+            return Car(car_id, strings[brand], strings[model], year, daily_price, available)
+        rental_id, car_id, username, start, end, total_price, status = fields
+        return Rental(rental_id, car_id, strings[username], self._dates[start], self._dates[end],
+                      total_price, strings[status])
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, i: int):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self._decode(self.record.unpack_from(self._records, i * self.record.size))
+    
+    def __iter__(self):
+        # Тот же разбор, что в _decode, но без вызова функции на каждую запись
+        strings, dates = self.strings, self._dates
+        records = self.record.iter_unpack(self._records)
+        if self.kind == "cars":
+            for car_id, brand, model, year, daily_price, available in records:
+                yield Car(car_id, strings[brand], strings[model], year, daily_price, available)
+            return
+        for rental_id, car_id, username, start, end, total_price, status in records:
+            yield Rental(rental_id, car_id, strings[username], dates[start], dates[end],
+                         total_price, strings[status])
+    
+    def close(self):
+        # memoryview нужно освободить до закрытия mmap
+        for view in ("_records", "_view"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self._mmap.close()
+        self._file.close()
+    
+    def __enter__(self) -> "SnapshotFile":
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    @classmethod
+    def write(cls, path: str, kind: str, items) -> int:
+        """Записывает снимок через временный файл и атомарную замену, возвращает размер"""
+        tag, record = cls.KINDS[kind]
+        strings: List[str] = []
+        codes: Dict[str, int] = {}
+        
+        def code(value: str) -> int:
+            result = codes.get(value)
+            if result is None:
+                result = codes[value] = len(strings)
+                strings.append(value)
+            return result
+        
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, tag, 0, 0))
+            count = 0
+            buffer = bytearray()
+            for item in items:
+                if kind == "cars":
+                    buffer += record.pack(item.id, code(item.brand), code(item.model), item.year,
+                                          item.daily_price, item.available)
+                else:
+                    buffer += record.pack(item.id, item.car_id, code(item.username),
+                                          to_ordinal(item.start_date), to_ordinal(item.end_date),
+                                          item.total_price, code(item.status))
+                count += 1
+                if len(buffer) >= 1 << 20:
+                    f.write(buffer)
+                    buffer.clear()
+            f.write(buffer)
+            
+            strings_offset = f.tell()
+            f.write(cls.LENGTH.pack(len(strings)))
+            for value in strings:
+                data = value.encode('utf-8')
+                f.write(cls.LENGTH.pack(len(data)))
+                f.write(data)
+            size = f.tell()
+            
+            # Заголовок с итоговыми числами записывается последним
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, tag, count, strings_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return size
+
+class Storage:
+    """Интерфейс хранилища данных системы проката.
+
+    CarRentalSystem обращается к данным только через эти методы, поэтому
+    способ хранения (JSON-файлы, SQLite) выбирается при создании системы.
+    Методы изменения данных потокобезопасны; проверку и последующее
+    изменение нужно выполнять внутри transaction().
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+    
+    def initialize(self):
+        """Создает файлы или схему хранилища, если их нет"""
+    
+    def load(self):
+        """Подготавливает хранилище к работе после запуска"""
+    
+    @contextmanager
+    def transaction(self):
+        """Критическая секция «проверка — изменение»"""
+        with self.lock:
+            yield
+    
+    def car_transaction(self, car_id: int):
+        """Критическая секция «проверка — изменение» для аренд одного автомобиля"""
+        return self.transaction()
+    
+    def cars_transaction(self, car_ids):
+        """Критическая секция «проверка — изменение» для аренд нескольких автомобилей"""
+        return self.transaction()
+    
+    def deferred_writes(self):
+        """Группа изменений, которая записывается на диск один раз в конце"""
+        return self.transaction()
+    
+    def refresh(self):
+        """Подхватывает изменения, сделанные другими процессами"""
+    
+    def data_version(self) -> int:
+        """Счетчик изменений данных другими процессами (для кешей поверх хранилища)"""
+        return 0
+    
+    def compact(self):
+        """Сворачивает накопленные изменения (если хранилище это поддерживает)"""
+    
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+    
+    @property
+    def cars(self) -> List[Car]:
+        raise NotImplementedError
+    
+    @property
+    def rentals(self) -> List[Rental]:
+        raise NotImplementedError
+    
+    @property
+    def users(self) -> List[User]:
+        raise NotImplementedError
+    
+    def get_user(self, username: str) -> Optional[User]:
+        raise NotImplementedError
+    
+    def add_user(self, user: User):
+        raise NotImplementedError
+    
+    def update_user(self, user: User):
+        """Сохраняет измененные пароль и роль пользователя"""
+        raise NotImplementedError
+    
+    def get_car(self, car_id: int) -> Optional[Car]:
+        raise NotImplementedError
+    
+    def next_car_id(self) -> int:
+        raise NotImplementedError
+    
+    def add_car(self, car: Car):
+        raise NotImplementedError
+    
+    def get_rental(self, rental_id: int) -> Optional[Rental]:
+        raise NotImplementedError
+    
+    def next_rental_id(self) -> int:
+        raise NotImplementedError
+    
+    def add_rental(self, rental: Rental):
+        raise NotImplementedError
+    
+    def next_rental_ids(self, count: int) -> List[int]:
+        """Резервирует count идущих подряд id аренд (вызывается внутри транзакции)"""
+        first = self.next_rental_id()
+        return list(range(first, first + count))
+    
+    def set_rental_status(self, rental: Rental, status: str):
+        raise NotImplementedError
+    
+    # Пакетные операции: хранилища переопределяют их, чтобы сохранять
+    # данные один раз на пакет, а не на каждую запись
+    
+    def add_users(self, users: List[User]):
+        for user in users:
+            self.add_user(user)
+    
+    def add_cars(self, cars: List[Car]):
+        for car in cars:
+            self.add_car(car)
+    
+    def add_rentals(self, rentals: List[Rental]):
+        for rental in rentals:
+            self.add_rental(rental)
+    
+    def user_rentals(self, username: str) -> List[Rental]:
+        raise NotImplementedError
+    
+    def is_car_free(self, car_id: int, start_date: str, end_date: str) -> bool:
+        raise NotImplementedError
+    
+    def available_cars(self, start_date: str, end_date: str) -> List[Car]:
+        raise NotImplementedError
+    
+    def occupancy_calendar(self, horizon: int = 90) -> OccupancyCalendar:
+        """Календарь занятости парка на horizon дней начиная с сегодняшнего"""
+        calendar = OccupancyCalendar(horizon)
+        for car in self.cars:
+            calendar.add_car(car.id)
+        today = date.today().isoformat()
+        for rental, _ in self.iter_rentals_with_cars(status="active"):
+            if rental.end_date >= today:
+                calendar.add(rental)
+        return calendar
+    
+    def fleet_utilization(self, start_date: str, end_date: str) -> float:
+        """Средняя загрузка парка в период (в пределах 90 дней вперед)"""
+        return self.occupancy_calendar().average_utilization(start_date, end_date)
+    
+    # Порядок выдачи search_available: поле автомобиля, "-" — по убыванию
+    SEARCH_SORTS = {"id": "id", "price": "daily_price", "year": "year"}
+    
+    def search_available(self, start_date: str, end_date: str, brand: Optional[str] = None,
+                         max_price: Optional[float] = None, min_year: Optional[int] = None,
+                         sort: str = "id", limit: int = 50, offset: int = 0) -> List[Car]:
+        """Страница свободных в период автомобилей с фильтрами и сортировкой"""
+        field, reverse = self.SEARCH_SORTS[sort.lstrip("-")], sort.startswith("-")
+        cars = [
+            car for car in self.available_cars(start_date, end_date)
+            if (brand is None or car.brand.lower() == brand.lower())
+            and (max_price is None or car.daily_price <= max_price)
+            and (min_year is None or car.year >= min_year)
+        ]
+        cars.sort(key=lambda car: (getattr(car, field), car.id), reverse=reverse)
+        return cars[offset:offset + limit]
+    
+    def iter_rentals_with_cars(self, username: Optional[str] = None,
+                               status: Optional[str] = None) -> Iterator[Tuple[Rental, Optional[Car]]]:
+        """Перебирает аренды (все или одного пользователя) вместе с их автомобилями"""
+        raise NotImplementedError
+    
+    def archive_rentals(self, rentals: List[Rental]) -> int:
+        """Переносит завершенные аренды из рабочего набора в архив"""
+        return 0
+    
+    def iter_archived_rentals(self) -> Iterator[Rental]:
+        """Перебирает аренды из архива"""
+        return iter(())
+    
+    def save_cars(self):
+        """Сохраняет список автомобилей целиком"""
+    
+    def save_rentals(self):
+        """Сохраняет список аренд целиком"""
+    
+    def save_users(self):
+        """Сохраняет список пользователей целиком"""
+
+class JsonStorage(Storage):
+    """Хранилище в JSON-файлах: все данные держатся в памяти.
+
+    Поиск по ключу идет через словари-индексы (username, id автомобиля,
+    id аренды, аренды пользователя), которые обновляются при загрузке и
+    каждом изменении; новые id выдаются счетчиками без обхода списков.
+
+    В режиме журнала каждое изменение дописывается одной строкой JSON
+    в journal.jsonl, а файлы данных служат снимком и перезаписываются
+    только при компактификации (раз в compact_every записей).
+
+    Файлы разбираются потоково, объекты и индексы строятся по мере чтения.
+    С lazy_rentals=True файл аренд читается только при первом обращении
+    к арендам (бронирование, отчеты), а не при запуске.
+
+    С shared=True одну папку данных могут использовать несколько процессов:
+    изменения выполняются под блокировкой fcntl на файле .lock, в котором
+    хранится счетчик версий. Если версия изменилась с момента загрузки,
+    данные перечитываются перед проверкой и изменением.
+
+    Занятость парка на CALENDAR_HORIZON дней вперед дополнительно хранится
+    битовыми картами (OccupancyCalendar), которые обновляются при каждой
+    аренде и отмене и перестраиваются при смене дня.
+
+    С snapshot="binary" снимки автомобилей и аренд пишутся в двоичном
+    формате SnapshotFile (файлы .bin) вместо JSON; пользователи и журнал
+    остаются в JSON.
+    """
+    CALENDAR_HORIZON = 90
+    
+    def __init__(self, cars_file: str, rentals_file: str, users_file: str,
+                 journal_file: str, journal: bool = False, compact_every: int = 1000,
+                 lazy_rentals: bool = False, shared: bool = False, snapshot: str = "json"):
+        super().__init__()
+        if snapshot not in ("json", "binary"):
+            raise ValueError(f"Неизвестный формат снимка: {snapshot}")
+        self.snapshot = snapshot
+        self.cars_file = cars_file
+        self.rentals_file = rentals_file
+        self.users_file = users_file
+        self.journal_file = journal_file
+        self.journal = journal
+        self.compact_every = compact_every
+        self._journal_handle = None
+        self._journal_size = 0
+        # Внутри deferred_writes записи копятся здесь до конца группы
+        self._deferred_journal: Optional[List[Tuple[str, int]]] = None
+        self._deferred_saves: Optional[Dict] = None
+        self._cars: List[Car] = []
+        self._rentals: List[Rental] = []
+        self._users: List[User] = []
+        self.schedules: Dict[int, CarSchedule] = {}
+        self.calendar: Optional[OccupancyCalendar] = None
+        self._users_by_name: Dict[str, User] = {}
+        self._cars_by_id: Dict[int, Car] = {}
+        self._cars_by_brand: Dict[str, List[Car]] = {}
+        self._sorted_cars: Dict[str, Optional[List[Tuple]]] = {"id": None, "price": None, "year": None}
+        self._rentals_by_id: Dict[int, Rental] = {}
+        self._rentals_by_user: Dict[str, List[Rental]] = {}
+        self._next_car_id = 1
+        self._next_rental_id = 1
+        self.lazy_rentals = lazy_rentals
+        self._rentals_loaded = False
+        # Архив завершенных аренд: файлы по месяцам окончания и meta.json
+        # с последним выданным id, чтобы id архивных аренд не выдавались снова
+        self.archive_dir = os.path.join(os.path.dirname(rentals_file), "archive")
+        self._archive_next_id = 1
+        self.shared = shared
+        self.lock_file = os.path.join(os.path.dirname(cars_file), ".lock")
+        self._lock_handle = None
+        self._version = 0
+        self._transaction_depth = 0
+        self._car_locks: Dict[int, threading.Lock] = {}
+        if shared and fcntl is None:
+            raise RuntimeError("Совместный режим требует поддержки fcntl")
+    
+    @property
+    def cars(self) -> List[Car]:
+        return self._cars
+    
+    @property
+    def rentals(self) -> List[Rental]:
+        self._ensure_rentals()
+        return self._rentals
+    
+    @property
+    def users(self) -> List[User]:
+        return self._users
+    
+    def initialize(self):
         """Создает директорию и файлы данных, если они не существуют"""
-        os.makedirs(self.data_dir, exist_ok=True)
+        for path, kind in ((self.cars_file, "cars"), (self.rentals_file, "rentals"),
+                           (self.users_file, "users")):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if os.path.exists(path):
+                continue
+            if self.snapshot == "binary" and kind != "users":
+                SnapshotFile.write(path, kind, [])
+            else:
+                with open(path, 'w') as f:
+                    json.dump([], f)
+    
+    def load(self):
+        """Загружает данные из файлов"""
+        if not self.shared:
+            self._load()
+            return
         
-        if not os.path.exists(self.cars_file):
-            with open(self.cars_file, 'w') as f:
-                json.dump([], f)
+        with self.lock:
+            fcntl.flock(self._get_lock_handle(), fcntl.LOCK_SH)
+            try:
+                self._version = self._read_version()
+                self._load()
+            finally:
+                fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+    
+    def _get_lock_handle(self):
+        if self._lock_handle is None:
+            self._lock_handle = open(self.lock_file, 'a+')
+        return self._lock_handle
+    
+    def _read_version(self) -> int:
+        self._lock_handle.seek(0)
+        return int(self._lock_handle.read() or 0)
+    
+    @contextmanager
+    def transaction(self):
+        """Изменение данных под блокировкой: в совместном режиме — и между процессами"""
+        with self.lock:
+            # Вложенная транзакция работает под блокировкой внешней
+            if not self.shared or self._transaction_depth:
+                yield
+                return
+            
+            handle = self._get_lock_handle()
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            self._transaction_depth = 1
+            try:
+                version = self._read_version()
+                if version != self._version:
+                    self._load()
+                yield
+                # Версия увеличивается и при неудачной попытке — лишняя
+                # перезагрузка у соседей дешевле, чем пропущенное изменение
+                self._version = version + 1
+                handle.seek(0)
+                handle.truncate()
+                handle.write(str(self._version))
+                handle.flush()
+            finally:
+                self._transaction_depth = 0
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    
+    @contextmanager
+    def car_transaction(self, car_id: int):
+        """Изменение аренд автомобиля под его собственной блокировкой.
+
+        В пределах процесса брони разных автомобилей не ждут друг друга:
+        общая блокировка берется только на время записи внутри add_rental.
+        """
+        with self._car_lock(car_id):
+            if self.shared:
+                with self.transaction():
+                    yield
+            else:
+                yield
+    
+    @contextmanager
+    def cars_transaction(self, car_ids):
+        """Изменение аренд нескольких автомобилей под их блокировками.
+
+        Блокировки берутся в порядке возрастания id, поэтому два пакета
+        с пересекающимися наборами автомобилей не блокируют друг друга навечно.
+        """
+        with ExitStack() as stack:
+            for car_id in sorted(set(car_ids)):
+                stack.enter_context(self._car_lock(car_id))
+            if self.shared:
+                stack.enter_context(self.transaction())
+            yield
+    
+    @contextmanager
+    def deferred_writes(self):
+        """Изменения группы копятся в памяти и записываются одним разом в конце.
+
+        В режиме журнала записи группы дописываются одной записью с одним
+        fsync, без журнала каждый затронутый файл перезаписывается один раз.
+        Изменения других потоков, сделанные за время группы, записываются
+        вместе с ней. В совместном режиме группа целиком выполняется под
+        межпроцессной блокировкой, поэтому ее ведут из одного потока.
+        """
+        with self.lock:
+            nested = self._deferred_saves is not None
+            if not nested:
+                self._deferred_journal, self._deferred_saves = [], {}
+        if nested:
+            yield
+            return
         
-        if not os.path.exists(self.rentals_file):
-            with open(self.rentals_file, 'w') as f:
-                json.dump([], f)
+        with ExitStack() as stack:
+            if self.shared:
+                # Другие процессы ждут конца группы: до записи они бы ее не увидели
+                stack.enter_context(self.transaction())
+            try:
+                yield
+            finally:
+                with self.lock:
+                    journal, saves = self._deferred_journal, self._deferred_saves
+                    self._deferred_journal = self._deferred_saves = None
+                    if journal:
+                        self._write_journal("".join(text for text, _ in journal),
+                                            sum(count for _, count in journal))
+                    for save in saves:
+                        save()
+    
+    def _car_lock(self, car_id: int) -> threading.Lock:
+        lock = self._car_locks.get(car_id)
+        if lock is None:
+            with self.lock:
+                lock = self._car_locks.setdefault(car_id, threading.Lock())
+        return lock
+    
+    def data_version(self) -> int:
+        return self._version
+    
+    def refresh(self):
+        """Перечитывает данные, если их изменил другой процесс"""
+        if not self.shared:
+            return
         
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump([], f)
+        with self.lock:
+            handle = self._get_lock_handle()
+            fcntl.flock(handle, fcntl.LOCK_SH)
+            try:
+                version = self._read_version()
+                if version != self._version:
+                    self._load()
+                    self._version = version
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
     
-    def _load_data(self):
-        """Загружает данные из файлов"""
-        with open(self.cars_file, 'r') as f:
-            self.cars = [Car.from_dict(car) for car in json.load(f)]
+    def _load(self):
+        # Файл журнала мог быть удален компактификацией в другом процессе
+        self._close_journal()
+        
+        self._cars = []
+        self._index_cars()
+        for car in self._iter_snapshot(self.cars_file, "cars"):
+            self._insert_car(car)
+        
+        self._users = []
+        self._index_users()
+        for data in iter_json_array(self.users_file):
+            self._insert_user(User.from_dict(data))
+        
+        self._archive_next_id = self._read_archive_next_id()
+        self._rentals_loaded = False
+        if not self.lazy_rentals:
+            self._load_rentals()
+        
+        self._journal_size = self._replay_journal(repair=True)
+        if self._journal_size and not self.journal:
+            # Журнал остался от запуска в режиме журнала — переносим его в снимок
+            self.compact()
+        
+        if self._rentals_loaded:
+            self._build_schedules()
+    
+    def _load_rentals(self):
+        """Загружает аренды из файла"""
+        self._rentals = []
+        self._index_rentals()
+        for rental in self._iter_snapshot(self.rentals_file, "rentals"):
+            self._insert_rental(rental)
+        self._rentals_loaded = True
+    
+    def _iter_snapshot(self, path: str, kind: str) -> Iterator:
+        """Перебирает автомобили или аренды из файла снимка"""
+        if self.snapshot == "binary":
+            with SnapshotFile(path, kind) as snapshot:
+                yield from snapshot
+            return
+        factory = Car.from_dict if kind == "cars" else Rental.from_dict
+        for data in iter_json_array(path):
+            yield factory(data)
+    
+    def _ensure_rentals(self):
+        """Загружает отложенные аренды при первом обращении"""
+        if self._rentals_loaded:
+            return
+        with self.lock:
+            if self._rentals_loaded:
+                return
+            self._load_rentals()
+            # Записи журнала об автомобилях и пользователях уже применены,
+            # повторный проход добавит только пропущенные записи об арендах
+            self._replay_journal()
+            self._build_schedules()
+    
+    def _replay_journal(self, repair: bool = False) -> int:
+        """Применяет записи журнала поверх загруженного снимка.
+
+        Повторное применение записи ничего не меняет, поэтому журнал, уже
+        вошедший в снимок (сбой между записью снимка и очисткой журнала),
+        безопасно проигрывается еще раз. Оборванная последняя строка
+        (сбой во время записи) пропускается, а с repair — и отрезается:
+        иначе следующая запись склеилась бы с ней и пропала при загрузке.
+        Поврежденная строка в середине журнала — ошибка, а не конец журнала.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        
+        count = 0
+        end = 0
+        
+        with open(self.journal_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"Поврежденная запись журнала {self.journal_file} (байт {end})") from None
+                end += len(line)
+                count += 1
+                op, data = entry['op'], entry['data']
+                
+                if op == "add_car" and data['id'] not in self._cars_by_id:
+                    self._insert_car(Car.from_dict(data))
+                elif op == "add_user" and data['username'] not in self._users_by_name:
+                    self._insert_user(User.from_dict(data))
+                elif op == "update_user" and data['username'] in self._users_by_name:
+                    user = self._users_by_name[data['username']]
+                    user.password, user.role = data['password'], data['role']
+                elif not self._rentals_loaded:
+                    continue
+                elif op == "add_rental" and data['id'] not in self._rentals_by_id:
+                    self._insert_rental(Rental.from_dict(data))
+                elif op == "update_rental" and data['id'] in self._rentals_by_id:
+                    self._rentals_by_id[data['id']].status = data['status']
+        
+        if repair and os.path.getsize(self.journal_file) > end:
+            # В совместном режиме загрузка идет под блокировкой: чужой записи в процессе нет
+            os.truncate(self.journal_file, end)
+        return count
+    
+    def _append_journal(self, op: str, records: List[Dict]):
+        """Дописывает записи в журнал и сбрасывает их на диск одним fsync"""
+        text = "".join(json.dumps({'op': op, 'data': data}) + "\n" for data in records)
+        if self._deferred_journal is not None:
+            self._deferred_journal.append((text, len(records)))
+            return
+        self._write_journal(text, len(records))
+    
+    def _write_journal(self, text: str, count: int):
+        if self._journal_handle is None:
+            self._journal_handle = open(self.journal_file, 'a')
+        self._journal_handle.write(text)
+        self._journal_handle.flush()
+        os.fsync(self._journal_handle.fileno())
+        metrics.observe("storage_write_bytes", len(text), BYTES_BUCKETS, file="journal.jsonl")
+        
+        self._journal_size += count
+        if self._journal_size >= self.compact_every:
+            self.compact()
+    
+    def _record(self, op: str, data: Dict, save):
+        """Сохраняет изменение: в журнал или полной перезаписью файла"""
+        self._record_many(op, [data], save)
+    
+    def _record_many(self, op: str, records: List[Dict], save):
+        """Сохраняет пакет однотипных изменений за одну запись на диск"""
+        if not records:
+            return
+        if self.journal:
+            self._append_journal(op, records)
+        elif self._deferred_saves is not None:
+            self._deferred_saves[save] = True
+        else:
+            save()
+    
+    def compact(self):
+        """Записывает снимок всех данных и очищает журнал"""
+        self.save_cars()
+        self.save_rentals()
+        self.save_users()
+        
+        self._close_journal()
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._journal_size = 0
+    
+    def _close_journal(self):
+        if self._journal_handle is not None:
+            self._journal_handle.close()
+            self._journal_handle = None
+    
+    def close(self):
+        """Закрывает файлы журнала и блокировки"""
+        self._close_journal()
+        if self._lock_handle is not None:
+            self._lock_handle.close()
+            self._lock_handle = None
+    
+    def _index_cars(self):
+        """Перестраивает индекс автомобилей по id"""
+        cars_by_brand: Dict[str, List[Car]] = {}
+        for car in self._cars:
+            cars_by_brand.setdefault(car.brand.lower(), []).append(car)
+        self._cars_by_id = {car.id: car for car in self._cars}
+        self._cars_by_brand = cars_by_brand
+        self._sorted_cars = dict.fromkeys(self._sorted_cars)
+        self.calendar = None
+        self._next_car_id = max(self._cars_by_id, default=0) + 1
+    
+    def _index_rentals(self):
+        """Перестраивает индексы аренд по id и по пользователю.
+
+        Индексы читаются и без общей блокировки, поэтому новые строятся
+        отдельно и подменяют старые одним присваиванием.
+        """
+        rentals_by_id: Dict[int, Rental] = {}
+        rentals_by_user: Dict[str, List[Rental]] = {}
+        for rental in self._rentals:
+            rentals_by_id[rental.id] = rental
+            rentals_by_user.setdefault(rental.username, []).append(rental)
+        self._rentals_by_id, self._rentals_by_user = rentals_by_id, rentals_by_user
+        self._next_rental_id = max(max(rentals_by_id, default=0) + 1, self._archive_next_id)
+    
+    def _index_users(self):
+        """Перестраивает индекс пользователей по имени"""
+        self._users_by_name = {user.username: user for user in self._users}
+    
+    def _insert_car(self, car: Car):
+        self._cars.append(car)
+        self._cars_by_id[car.id] = car
+        self._cars_by_brand.setdefault(car.brand.lower(), []).append(car)
+        for sort, index in self._sorted_cars.items():
+            if index is not None:
+                insort(index, (getattr(car, self.SEARCH_SORTS[sort]), car.id))
+        if self.calendar is not None:
+            self.calendar.add_car(car.id)
+        self._next_car_id = max(self._next_car_id, car.id + 1)
+    
+    def _sorted_index(self, sort: str) -> List[Tuple]:
+        """Список (значение поля, id) по возрастанию; строится при первом поиске"""
+        index = self._sorted_cars[sort]
+        if index is None:
+            field = self.SEARCH_SORTS[sort]
+            index = self._sorted_cars[sort] = sorted((getattr(car, field), car.id) for car in self._cars)
+        return index
+    
+    def _insert_rental(self, rental: Rental):
+        self._rentals.append(rental)
+        self._rentals_by_id[rental.id] = rental
+        self._rentals_by_user.setdefault(rental.username, []).append(rental)
+        self._next_rental_id = max(self._next_rental_id, rental.id + 1)
+    
+    def _insert_user(self, user: User):
+        self._users.append(user)
+        self._users_by_name[user.username] = user
+    
+    def _build_schedules(self):
+        """Строит интервальные индексы по активным арендам, которые еще не завершились.
+
+        Бронирование проверяет индекс под блокировкой автомобиля, без общей:
+        новый словарь заполняется отдельно и подменяет старый целиком, чтобы
+        проверка не увидела его пустым или заполненным наполовину.
+        """
+        today = date.today().isoformat()
+        schedules: Dict[int, CarSchedule] = {}
+        active = sorted(
+            (rental for rental in self._rentals
+             if rental.status == "active" and rental.end_date >= today),
+            key=lambda rental: rental.start_date
+        )
+        for rental in active:
+            schedule = schedules.get(rental.car_id)
+            if schedule is None:
+                schedule = schedules[rental.car_id] = CarSchedule()
+            schedule.add(rental)
+        self.schedules = schedules
+        self.calendar = None
+    
+    def _current_calendar(self) -> OccupancyCalendar:
+        """Календарь занятости на сегодня: строится при первом обращении и раз в сутки"""
+        self._ensure_rentals()
+        calendar = self.calendar
+        if calendar is None or calendar.origin != date.today().toordinal():
+            calendar = OccupancyCalendar(self.CALENDAR_HORIZON)
+            for car in self._cars:
+                calendar.add_car(car.id)
+            for schedule in self.schedules.values():
+                for i in range(len(schedule)):
+                    calendar.add(self._rentals_by_id[schedule.rental_ids[i]])
+            self.calendar = calendar
+        return calendar
+    
+    def _get_schedule(self, car_id: int) -> CarSchedule:
+        """Возвращает интервальный индекс автомобиля, создавая его при необходимости"""
+        schedule = self.schedules.get(car_id)
+        if schedule is None:
+            schedule = self.schedules[car_id] = CarSchedule()
+        return schedule
+    
+    def _write_json(self, path: str, records: List[Dict]):
+        """Записывает файл целиком через временный файл и атомарную замену"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+        metrics.observe("storage_write_bytes", size, BYTES_BUCKETS, file=os.path.basename(path))
+    
+    def _write_snapshot(self, path: str, kind: str, items: List):
+        """Записывает снимок автомобилей или аренд в выбранном формате"""
+        if self.snapshot == "binary":
+            size = SnapshotFile.write(path, kind, items)
+            metrics.observe("storage_write_bytes", size, BYTES_BUCKETS, file=os.path.basename(path))
+        else:
+            self._write_json(path, [item.to_dict() for item in items])
+    
+    def _read_archive_next_id(self) -> int:
+        path = os.path.join(self.archive_dir, "meta.json")
+        if not os.path.exists(path):
+            return 1
+        with open(path, 'r') as f:
+            return json.load(f)['last_rental_id'] + 1
+    
+    def archive_rentals(self, rentals: List[Rental]) -> int:
+        """Дописывает аренды в файлы архива по месяцам и убирает их из рабочего набора.
+
+        Архив дописывается и сбрасывается на диск до перезаписи снимка: при
+        сбое между этими шагами аренда окажется в обоих местах, а не
+        потеряется; повторы в архиве отбрасывает iter_archived_rentals.
+        """
+        self._ensure_rentals()
+        if not rentals:
+            return 0
+        with self.lock:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            by_month: Dict[str, List[Rental]] = {}
+            for rental in rentals:
+                by_month.setdefault(rental.end_date[:7], []).append(rental)
+            for month, month_rentals in by_month.items():
+                path = os.path.join(self.archive_dir, f"rentals-{month}.jsonl")
+                with open(path, 'a') as f:
+                    f.write("".join(json.dumps(rental.to_dict()) + "\n" for rental in month_rentals))
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            self._archive_next_id = max(self._archive_next_id, self._next_rental_id)
+            self._write_json(os.path.join(self.archive_dir, "meta.json"),
+                             {'last_rental_id': self._archive_next_id - 1})
+            
+            archived = {rental.id for rental in rentals}
+            self._rentals = [rental for rental in self._rentals if rental.id not in archived]
+            self._index_rentals()
+            self._build_schedules()
+            # Записи журнала об архивных арендах вернули бы их при загрузке,
+            # поэтому журнал сворачивается в снимок
+            if self.journal:
+                self.compact()
+            else:
+                self.save_rentals()
+        return len(archived)
+    
+    def iter_archived_rentals(self) -> Iterator[Rental]:
+        if not os.path.isdir(self.archive_dir):
+            return
+        seen: Set[int] = set()
+        for name in sorted(os.listdir(self.archive_dir)):
+            if not (name.startswith("rentals-") and name.endswith(".jsonl")):
+                continue
+            with open(os.path.join(self.archive_dir, name), 'r') as f:
+                for line in f:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        break
+                    if data['id'] not in seen:
+                        seen.add(data['id'])
+                        yield Rental.from_dict(data)
+    
+    # Списки cars/rentals/users доступны снаружи, и в них можно добавить
+    # запись напрямую, минуя индексы; сохранение списка такие записи
+    # обнаруживает по расхождению размеров и перестраивает индекс.
+    
+    def save_cars(self):
+        """Сохраняет данные об автомобилях"""
+        if len(self._cars_by_id) != len(self._cars):
+            self._index_cars()
+        self._write_snapshot(self.cars_file, "cars", self._cars)
+    
+    def save_rentals(self):
+        """Сохраняет данные об арендах"""
+        self._ensure_rentals()
+        if len(self._rentals_by_id) != len(self._rentals):
+            self._index_rentals()
+            self._build_schedules()
+        self._write_snapshot(self.rentals_file, "rentals", self._rentals)
+    
+    def save_users(self):
+        """Сохраняет данные о пользователях"""
+        if len(self._users_by_name) != len(self._users):
+            self._index_users()
+        self._write_json(self.users_file, [user.to_dict() for user in self._users])
+    
+    def get_user(self, username: str) -> Optional[User]:
+        return self._users_by_name.get(username)
+    
+    def add_user(self, user: User):
+        with self.lock:
+            self._insert_user(user)
+            self._record("add_user", user.to_dict(), self.save_users)
+    
+    def update_user(self, user: User):
+        with self.lock:
+            current = self._users_by_name.get(user.username)
+            if current is not None and current is not user:
+                current.password, current.role = user.password, user.role
+            self._record("update_user", user.to_dict(), self.save_users)
+    
+    def get_car(self, car_id: int) -> Optional[Car]:
+        return self._cars_by_id.get(car_id)
+    
+    def next_car_id(self) -> int:
+        with self.lock:
+            car_id = self._next_car_id
+            self._next_car_id += 1
+            return car_id
+    
+    def add_car(self, car: Car):
+        with self.lock:
+            self._insert_car(car)
+            self._record("add_car", car.to_dict(), self.save_cars)
+    
+    def get_rental(self, rental_id: int) -> Optional[Rental]:
+        self._ensure_rentals()
+        return self._rentals_by_id.get(rental_id)
+    
+    def next_rental_id(self) -> int:
+        self._ensure_rentals()
+        with self.lock:
+            rental_id = self._next_rental_id
+            self._next_rental_id += 1
+            return rental_id
+    
+    def next_rental_ids(self, count: int) -> List[int]:
+        self._ensure_rentals()
+        with self.lock:
+            first = self._next_rental_id
+            self._next_rental_id += count
+            return list(range(first, first + count))
+    
+    def add_rental(self, rental: Rental):
+        self._ensure_rentals()
+        with self.lock:
+            self._insert_rental(rental)
+            if rental.status == "active":
+                self._get_schedule(rental.car_id).add(rental)
+                if self.calendar is not None:
+                    self.calendar.add(rental)
+            self._record("add_rental", rental.to_dict(), self.save_rentals)
+    
+    def add_users(self, users: List[User]):
+        with self.lock:
+            for user in users:
+                self._insert_user(user)
+            self._record_many("add_user", [user.to_dict() for user in users], self.save_users)
+    
+    def add_cars(self, cars: List[Car]):
+        with self.lock:
+            for car in cars:
+                self._insert_car(car)
+            self._record_many("add_car", [car.to_dict() for car in cars], self.save_cars)
+    
+    def add_rentals(self, rentals: List[Rental]):
+        self._ensure_rentals()
+        today = date.today().isoformat()
+        with self.lock:
+            for rental in rentals:
+                self._insert_rental(rental)
+                if rental.status == "active" and rental.end_date >= today:
+                    self._get_schedule(rental.car_id).add(rental)
+                    if self.calendar is not None:
+                        self.calendar.add(rental)
+            try:
+                self._record_many("add_rental", [rental.to_dict() for rental in rentals], self.save_rentals)
+            except BaseException:
+                # Пакет не записан — убираем его и из памяти, чтобы не было броней без записи на диске
+                self._discard_rentals(rentals)
+                raise
+    
+    def _discard_rentals(self, rentals: List[Rental]):
+        discarded = {id(rental) for rental in rentals}
+        self._rentals = [rental for rental in self._rentals if id(rental) not in discarded]
+        for rental in rentals:
+            self._rentals_by_id.pop(rental.id, None)
+            user_rentals = self._rentals_by_user.get(rental.username, [])
+            if rental in user_rentals:
+                user_rentals.remove(rental)
+            if rental.car_id in self.schedules:
+                self.schedules[rental.car_id].remove(rental)
+        self.calendar = None
+    
+    def set_rental_status(self, rental: Rental, status: str):
+        self._ensure_rentals()
+        with self.lock:
+            if rental.status == "active":
+                if rental.car_id in self.schedules:
+                    self.schedules[rental.car_id].remove(rental)
+                if self.calendar is not None:
+                    self.calendar.remove(rental)
+            rental.status = status
+            self._record("update_rental", {'id': rental.id, 'status': rental.status}, self.save_rentals)
+    
+    def user_rentals(self, username: str) -> List[Rental]:
+        self._ensure_rentals()
+        return list(self._rentals_by_user.get(username, ()))
+    
+    def is_car_free(self, car_id: int, start_date: str, end_date: str) -> bool:
+        self._ensure_rentals()
+        schedule = self.schedules.get(car_id)
+        return schedule is None or schedule.is_free(to_ordinal(start_date), to_ordinal(end_date))
+    
+    def available_cars(self, start_date: str, end_date: str) -> List[Car]:
+        self._ensure_rentals()
+        start, end = to_ordinal(start_date), to_ordinal(end_date)
+        with self.lock:
+            calendar = self._current_calendar()
+        metrics.observe("storage_records_scanned", len(self._cars), RECORDS_BUCKETS,
+                        query="available_cars")
+        if calendar.covers(start, end):
+            # Внутри горизонта проверка автомобиля — одно AND битовой карты с маской
+            mask, bitmaps = calendar.mask(start, end), calendar.bitmaps
+            return [car for car in self._cars if not bitmaps.get(car.id, 0) & mask]
+        schedules = self.schedules
+        return [
+            car for car in self._cars
+            if car.id not in schedules or schedules[car.id].is_free(start, end)
+        ]
+    
+    def occupancy_calendar(self, horizon: int = 90) -> OccupancyCalendar:
+        if horizon != self.CALENDAR_HORIZON:
+            return super().occupancy_calendar(horizon)
+        with self.lock:
+            return self._current_calendar().copy()
+    
+    def fleet_utilization(self, start_date: str, end_date: str) -> float:
+        with self.lock:
+            return self._current_calendar().average_utilization(start_date, end_date)
+    
+    def search_available(self, start_date: str, end_date: str, brand: Optional[str] = None,
+                         max_price: Optional[float] = None, min_year: Optional[int] = None,
+                         sort: str = "id", limit: int = 50, offset: int = 0) -> List[Car]:
+        """Поиск по вторичным индексам с ранним выходом.
+
+        Кандидаты перебираются сразу в нужном порядке: по индексу марки или
+        по отсортированному индексу цены/года, который заодно отсекает
+        диапазон по max_price/min_year. Перебор останавливается, как только
+        набрана страница, поэтому первые страницы не требуют обхода всего парка.
+        """
+        self._ensure_rentals()
+        start, end = to_ordinal(start_date), to_ordinal(end_date)
+        key, reverse = sort.lstrip("-"), sort.startswith("-")
+        field = self.SEARCH_SORTS[key]
         
-        with open(self.rentals_file, 'r') as f:
-            self.rentals = [Rental.from_dict(rental) for rental in json.load(f)]
+        with self.lock:
+            # Порядок добавления не совпадает с порядком id (импорт с явными id),
+            # поэтому и по id кандидаты перебираются по отсортированному индексу
+            if brand is not None:
+                candidates = sorted(self._cars_by_brand.get(brand.lower(), []),
+                                    key=lambda car: (getattr(car, field), car.id), reverse=reverse)
+            else:
+                index = self._sorted_index(key)
+                low, high = 0, len(index)
+                if key == "price" and max_price is not None:
+                    high = bisect_right(index, (max_price, float("inf")))
+                if key == "year" and min_year is not None:
+                    low = bisect_left(index, (min_year, float("-inf")))
+                positions = range(high - 1, low - 1, -1) if reverse else range(low, high)
+                cars_by_id = self._cars_by_id
+                candidates = (cars_by_id[index[i][1]] for i in positions)
+            
+            schedules = self.schedules
+            page = []
+            scanned = 0
+            for car in candidates:
+                scanned += 1
+                if max_price is not None and car.daily_price > max_price:
+                    continue
+                if min_year is not None and car.year < min_year:
+                    continue
+                schedule = schedules.get(car.id)
+                if schedule is not None and not schedule.is_free(start, end):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                page.append(car)
+                if len(page) >= limit:
+                    break
+            metrics.observe("storage_records_scanned", scanned, RECORDS_BUCKETS,
+                            query="search_available")
+            return page
+    
+    def iter_rentals_with_cars(self, username: Optional[str] = None,
+                               status: Optional[str] = None) -> Iterator[Tuple[Rental, Optional[Car]]]:
+        self._ensure_rentals()
+        rentals = self._rentals if username is None else self._rentals_by_user.get(username, ())
+        cars_by_id = self._cars_by_id
+        for rental in rentals:
+            if status is None or rental.status == status:
+                yield rental, cars_by_id.get(rental.car_id)
+
+class SqliteStorage(Storage):
+    """Хранилище в базе SQLite.
+
+    Данные не загружаются в память при запуске: поиск пользователя,
+    аренд пользователя и проверка занятости автомобиля выполняются
+    запросами по индексам.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY,
+            brand TEXT NOT NULL,
+            model TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            daily_price REAL NOT NULL,
+            available INTEGER NOT NULL DEFAULT 1,
+            brand_key TEXT NOT NULL DEFAULT ''
+        );
+        CREATE TABLE IF NOT EXISTS rentals (
+            id INTEGER PRIMARY KEY,
+            car_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            total_price REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active'
+        );
+        CREATE TABLE IF NOT EXISTS rentals_archive (
+            id INTEGER PRIMARY KEY,
+            car_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            total_price REAL NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'customer'
+        );
+        CREATE INDEX IF NOT EXISTS idx_rentals_car_dates ON rentals(car_id, start_date, end_date);
+        CREATE INDEX IF NOT EXISTS idx_rentals_username ON rentals(username);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        CREATE INDEX IF NOT EXISTS idx_cars_price ON cars(daily_price);
+        CREATE INDEX IF NOT EXISTS idx_cars_year ON cars(year);
+    """
+    
+    CAR_COLUMNS = "id, brand, model, year, daily_price, available"
+    RENTAL_COLUMNS = "id, car_id, username, start_date, end_date, total_price, status"
+    USER_COLUMNS = "username, password, role"
+    
+    def __init__(self, db_file: str):
+        super().__init__()
+        self.db_file = db_file
+        self.conn: Optional[sqlite3.Connection] = None
+        self._transaction_depth = 0
+    
+    def initialize(self):
+        """Создает файл базы и схему, если их нет"""
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        # Соединение общее для потоков процесса, доступ к нему идет под self.lock;
+        # между процессами запись сериализует сама SQLite
+        self.conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.conn.executescript(self.SCHEMA)
+            self._migrate_brand_key()
+            self.conn.commit()
+    
+    def _migrate_brand_key(self):
+        """Добавляет в старую базу колонку brand_key — марку в нижнем регистре.
         
-        with open(self.users_file, 'r') as f:
-            self.users = [User.from_dict(user) for user in json.load(f)]
+        COLLATE NOCASE сравнивает без учета регистра только латиницу, поэтому
+        марка приводится к нижнему регистру str.lower(), как в JsonStorage.
+        """
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(cars)")}
+        if "brand_key" not in columns:
+            self.conn.execute("ALTER TABLE cars ADD COLUMN brand_key TEXT NOT NULL DEFAULT ''")
+            self.conn.executemany(
+                "UPDATE cars SET brand_key = ? WHERE id = ?",
+                [(brand.lower(), car_id) for car_id, brand in self.conn.execute("SELECT id, brand FROM cars")]
+            )
+            self.conn.execute("DROP INDEX IF EXISTS idx_cars_brand")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_brand_key ON cars(brand_key)")
+    
+    def close(self):
+        """Закрывает соединение с базой"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+    
+    @contextmanager
+    def transaction(self):
+        """Транзакция BEGIN IMMEDIATE: блокирует запись в базу другим процессам"""
+        with self.lock:
+            if self._transaction_depth:
+                self._transaction_depth += 1
+                try:
+                    yield
+                finally:
+                    self._transaction_depth -= 1
+                return
+            
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._transaction_depth = 1
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                raise
+            else:
+                self.conn.commit()
+            finally:
+                self._transaction_depth = 0
+    
+    def _query(self, sql: str, params=()) -> list:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+    
+    def _query_one(self, sql: str, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+    
+    def _write(self, sql: str, params=()):
+        """Выполняет изменение; вне явной транзакции сразу фиксирует его"""
+        with self.lock:
+            self.conn.execute(sql, params)
+            if not self._transaction_depth:
+                self.conn.commit()
+    
+    def _write_many(self, sql: str, rows):
+        with self.lock:
+            self.conn.executemany(sql, rows)
+            if not self._transaction_depth:
+                self.conn.commit()
+    
+    @staticmethod
+    def _car(row) -> Car:
+        return Car(row[0], row[1], row[2], row[3], row[4], bool(row[5]))
+    
+    @staticmethod
+    def _rental(row) -> Rental:
+        return Rental(*row)
+    
+    @staticmethod
+    def _user(row) -> User:
+        return User(*row)
+    
+    @property
+    def cars(self) -> List[Car]:
+        rows = self._query(f"SELECT {self.CAR_COLUMNS} FROM cars ORDER BY id")
+        return [self._car(row) for row in rows]
+    
+    @property
+    def rentals(self) -> List[Rental]:
+        rows = self._query(f"SELECT {self.RENTAL_COLUMNS} FROM rentals ORDER BY id")
+        return [self._rental(row) for row in rows]
+    
+    @property
+    def users(self) -> List[User]:
+        rows = self._query(f"SELECT {self.USER_COLUMNS} FROM users ORDER BY rowid")
+        return [self._user(row) for row in rows]
     
+    def get_user(self, username: str) -> Optional[User]:
+        row = self._query_one(f"SELECT {self.USER_COLUMNS} FROM users WHERE username = ?", (username,))
+        return self._user(row) if row else None
+    
+    def add_user(self, user: User):
+        self._write(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            (user.username, user.password, user.role)
+        )
+    
+    def update_user(self, user: User):
+        self._write(
+            "UPDATE users SET password = ?, role = ? WHERE username = ?",
+            (user.password, user.role, user.username)
+        )
+    
+    def get_car(self, car_id: int) -> Optional[Car]:
+        row = self._query_one(f"SELECT {self.CAR_COLUMNS} FROM cars WHERE id = ?", (car_id,))
+        return self._car(row) if row else None
+    
+    def next_car_id(self) -> int:
+        return self._query_one("SELECT COALESCE(MAX(id), 0) + 1 FROM cars")[0]
+    
+    def add_car(self, car: Car):
+        self.add_cars([car])
+    
+    def get_rental(self, rental_id: int) -> Optional[Rental]:
+        row = self._query_one(f"SELECT {self.RENTAL_COLUMNS} FROM rentals WHERE id = ?", (rental_id,))
+        return self._rental(row) if row else None
+    
+    def next_rental_id(self) -> int:
+        # Учитываются и архивные аренды, чтобы их id не выдавались повторно
+        return self._query_one(
+            "SELECT MAX(COALESCE((SELECT MAX(id) FROM rentals), 0), "
+            "COALESCE((SELECT MAX(id) FROM rentals_archive), 0)) + 1"
+        )[0]
+    
+    def add_rental(self, rental: Rental):
+        self._write(
+            "INSERT INTO rentals (id, car_id, username, start_date, end_date, total_price, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rental.id, rental.car_id, rental.username, rental.start_date,
+             rental.end_date, rental.total_price, rental.status)
+        )
+    
+    def add_users(self, users: List[User]):
+        self._write_many(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            [(user.username, user.password, user.role) for user in users]
+        )
+    
+    def add_cars(self, cars: List[Car]):
+        self._write_many(
+            "INSERT INTO cars (id, brand, model, year, daily_price, available, brand_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(car.id, car.brand, car.model, car.year, car.daily_price, int(car.available), car.brand.lower())
+             for car in cars]
+        )
+    
+    def add_rentals(self, rentals: List[Rental]):
+        self._write_many(
+            "INSERT INTO rentals (id, car_id, username, start_date, end_date, total_price, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(rental.id, rental.car_id, rental.username, rental.start_date,
+              rental.end_date, rental.total_price, rental.status) for rental in rentals]
+        )
+    
+    def set_rental_status(self, rental: Rental, status: str):
+        self._write("UPDATE rentals SET status = ? WHERE id = ?", (status, rental.id))
+        rental.status = status
+    
+    def user_rentals(self, username: str) -> List[Rental]:
+        rows = self._query(
+            f"SELECT {self.RENTAL_COLUMNS} FROM rentals WHERE username = ? ORDER BY id", (username,)
+        )
+        return [self._rental(row) for row in rows]
+    
+    def is_car_free(self, car_id: int, start_date: str, end_date: str) -> bool:
+        row = self._query_one(
+            "SELECT 1 FROM rentals WHERE car_id = ? AND start_date <= ? AND end_date >= ? "
+            "AND status = 'active' LIMIT 1",
+            (car_id, end_date, start_date)
+        )
+        return row is None
+    
+    def available_cars(self, start_date: str, end_date: str) -> List[Car]:
+        rows = self._query(
+            f"SELECT {self.CAR_COLUMNS} FROM cars c WHERE NOT EXISTS ("
+            "SELECT 1 FROM rentals r WHERE r.car_id = c.id AND r.start_date <= ? "
+            "AND r.end_date >= ? AND r.status = 'active') ORDER BY c.id",
+            (end_date, start_date)
+        )
+        return [self._car(row) for row in rows]
+    
+    def data_version(self) -> int:
+        # Меняется, когда изменения в базу записывает другое соединение
+        return self._query_one("PRAGMA data_version")[0]
+    
+    def archive_rentals(self, rentals: List[Rental]) -> int:
+        params = [(rental.id,) for rental in rentals]
+        with self.transaction():
+            self._write_many(
+                f"INSERT OR IGNORE INTO rentals_archive ({self.RENTAL_COLUMNS}) "
+                f"SELECT {self.RENTAL_COLUMNS} FROM rentals WHERE id = ?",
+                params
+            )
+            self._write_many("DELETE FROM rentals WHERE id = ?", params)
+        return len(params)
+    
+    def iter_archived_rentals(self, batch_size: int = 1000) -> Iterator[Rental]:
+        last_id = 0
+        while True:
+            rows = self._query(
+                f"SELECT {self.RENTAL_COLUMNS} FROM rentals_archive WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield self._rental(row)
+            last_id = rows[-1][0]
+    
+    def occupancy_calendar(self, horizon: int = 90) -> OccupancyCalendar:
+        calendar = OccupancyCalendar(horizon)
+        for (car_id,) in self._query("SELECT id FROM cars"):
+            calendar.add_car(car_id)
+        first = date.fromordinal(calendar.origin).isoformat()
+        last = date.fromordinal(calendar.origin + horizon - 1).isoformat()
+        rows = self._query(
+            f"SELECT {self.RENTAL_COLUMNS} FROM rentals WHERE status = 'active' "
+            "AND end_date >= ? AND start_date <= ?",
+            (first, last)
+        )
+        for row in rows:
+            calendar.add(self._rental(row))
+        return calendar
+    
+    def search_available(self, start_date: str, end_date: str, brand: Optional[str] = None,
+                         max_price: Optional[float] = None, min_year: Optional[int] = None,
+                         sort: str = "id", limit: int = 50, offset: int = 0) -> List[Car]:
+        field = self.SEARCH_SORTS[sort.lstrip("-")]
+        direction = "DESC" if sort.startswith("-") else "ASC"
+        conditions, params = [], []
+        if brand is not None:
+            conditions.append("c.brand_key = ?")
+            params.append(brand.lower())
+        if max_price is not None:
+            conditions.append("c.daily_price <= ?")
+            params.append(max_price)
+        if min_year is not None:
+            conditions.append("c.year >= ?")
+            params.append(min_year)
+        conditions.append(
+            "NOT EXISTS (SELECT 1 FROM rentals r WHERE r.car_id = c.id AND r.start_date <= ? "
+            "AND r.end_date >= ? AND r.status = 'active')"
+        )
+        params += [end_date, start_date, limit, offset]
+        rows = self._query(
+            f"SELECT {self.CAR_COLUMNS} FROM cars c WHERE {' AND '.join(conditions)} "
+            f"ORDER BY c.{field} {direction}, c.id {direction} LIMIT ? OFFSET ?",
+            params
+        )
+        return [self._car(row) for row in rows]
+    
+    def iter_rentals_with_cars(self, username: Optional[str] = None,
+                               status: Optional[str] = None,
+                               batch_size: int = 1000) -> Iterator[Tuple[Rental, Optional[Car]]]:
+        columns = ", ".join("r." + name for name in self.RENTAL_COLUMNS.split(", "))
+        car_columns = ", ".join("c." + name for name in self.CAR_COLUMNS.split(", "))
+        # Пачки читаются под блокировкой по ключу r.id > последнего id,
+        # а между пачками соединение свободно для других потоков
+        conditions, params = ["r.id > ?"], []
+        if username is not None:
+            conditions.append("r.username = ?")
+            params.append(username)
+        if status is not None:
+            conditions.append("r.status = ?")
+            params.append(status)
+        sql = (f"SELECT {columns}, {car_columns} FROM rentals r "
+               f"LEFT JOIN cars c ON c.id = r.car_id WHERE {' AND '.join(conditions)} "
+               "ORDER BY r.id LIMIT ?")
+        
+        last_id = 0
+        while True:
+            rows = self._query(sql, [last_id] + params + [batch_size])
+            for row in rows:
+                car = self._car(row[7:]) if row[7] is not None else None
+                yield self._rental(row[:7]), car
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+class PricingEngine:
+    """Расчет стоимости аренды по правилам с кешем рассчитанных цен.
+
+    Стоимость — сумма дневных цен с сезонными множителями (по месяцам),
+    умноженная на множитель марки, скидку за длительность, надбавку за
+    загрузку парка и множители дополнительных правил. Без правил это
+    days * daily_price, как и раньше.
+
+    Цены кешируются по (автомобиль, период, версия правил, версия
+    загрузки). Версия правил растет при каждом изменении правил, версия
+    загрузки — при каждой аренде и отмене через CarRentalSystem (движок
+    подписан на ее события) и учитывается, только если цена от загрузки
+    зависит. Изменения других процессов в совместном режиме становятся
+    видны надбавке после ближайшей аренды или отмены в этом процессе.
+    """
+    RULES = ("seasons", "brand_multipliers", "long_rental_discounts", "surge")
+    
+    def __init__(self, seasons: Optional[Dict[int, float]] = None,
+                 brand_multipliers: Optional[Dict[str, float]] = None,
+                 long_rental_discounts: Optional[Dict[int, float]] = None,
+                 surge: Optional[Dict[float, float]] = None,
+                 cache_size: int = 10000):
+        # Месяц (1-12) -> множитель дневной цены
+        self.seasons: Dict[int, float] = {}
+        # Марка (без учета регистра) -> множитель
+        self.brand_multipliers: Dict[str, float] = {}
+        # Минимальное число дней -> множитель (берется наибольший подходящий порог)
+        self.long_rental_discounts: Dict[int, float] = {}
+        # Доля занятого парка -> множитель (берется наибольший подходящий порог)
+        self.surge: Dict[float, float] = {}
+        # Дополнительные правила: rule(car, start, end, utilization) -> множитель
+        self.rules: List = []
+        self.version = 0
+        self.occupancy_version = 0
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._utilization: Dict[Tuple[date, date, int], float] = {}
+        self._lock = threading.Lock()
+        self.configure(seasons=seasons or {}, brand_multipliers=brand_multipliers or {},
+                       long_rental_discounts=long_rental_discounts or {}, surge=surge or {})
+    
+    def configure(self, **rules):
+        """Заменяет правила (seasons, brand_multipliers, long_rental_discounts, surge)"""
+        for name, value in rules.items():
+            if name not in self.RULES:
+                raise ValueError(f"Неизвестное правило цены: {name}")
+            if name == "brand_multipliers":
+                value = {brand.lower(): multiplier for brand, multiplier in value.items()}
+            setattr(self, name, dict(value))
+        self._rules_changed()
+    
+    def add_rule(self, rule):
+        """Добавляет правило rule(car, start, end, utilization) -> множитель"""
+        self.rules.append(rule)
+        self._rules_changed()
+    
+    def _rules_changed(self):
+        with self._lock:
+            self.version += 1
+            self._cache.clear()
+    
+    @property
+    def uses_occupancy(self) -> bool:
+        """Зависит ли цена от загрузки парка"""
+        return bool(self.surge or self.rules)
+    
+    def rental_added(self, rental: Rental):
+        with self._lock:
+            self.occupancy_version += 1
+            self._utilization.clear()
+    
+    # Новый автомобиль меняет размер парка, а с ним и долю занятых
+    rental_cancelled = car_added = rental_added
+    
+    def quote(self, car: Car, start: date, end: date, utilization) -> float:
+        """Цена аренды; utilization() вызывается, только если она нужна и не закеширована"""
+        occupancy = self.occupancy_version if self.uses_occupancy else 0
+        key = (car.id, start, end, self.version, occupancy)
+        with self._lock:
+            price = self._cache.get(key)
+            if price is not None:
+                self._cache.move_to_end(key)
+                return price
+        
+        load = self._fleet_load(start, end, occupancy, utilization) if occupancy else 0.0
+        price = self.price(car, start, end, load)
+        with self._lock:
+            self._cache[key] = price
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return price
+    
+    def _fleet_load(self, start: date, end: date, occupancy: int, utilization) -> float:
+        key = (start, end, occupancy)
+        load = self._utilization.get(key)
+        if load is None:
+            load = self._utilization[key] = utilization()
+        return load
+    
+    def price(self, car: Car, start: date, end: date, utilization: float = 0.0) -> float:
+        """Стоимость аренды без кеша"""
+        days = (end - start).days
+        if self.seasons:
+            seasons = self.seasons
+            base = sum(
+                car.daily_price * seasons.get(date.fromordinal(day).month, 1.0)
+                for day in range(start.toordinal(), end.toordinal())
+            )
+        else:
+            base = days * car.daily_price
+        
+        multiplier = self.brand_multipliers.get(car.brand.lower(), 1.0)
+        multiplier *= self._threshold(self.long_rental_discounts, days)
+        multiplier *= self._threshold(self.surge, utilization)
+        for rule in self.rules:
+            multiplier *= rule(car, start, end, utilization)
+        if multiplier == 1.0 and not self.seasons:
+            return base
+        return round(base * multiplier, 2)
+    
+    @staticmethod
+    def _threshold(tiers: Dict, value) -> float:
+        """Множитель наибольшего порога, не превышающего value"""
+        best, multiplier = None, 1.0
+        for threshold, tier_multiplier in tiers.items():
+            if threshold <= value and (best is None or threshold > best):
+                best, multiplier = threshold, tier_multiplier
+        return multiplier
+
+class PasswordHasher:
+    """Соленые хеши паролей PBKDF2-SHA256 с кешем недавних успешных проверок.
+
+    Хеш хранится строкой pbkdf2_sha256$<итерации>$<соль>$<хеш>. Пароль,
+    сохраненный открытым текстом (старые users.json), тоже проверяется —
+    по нему система понимает, что запись нужно перевести на хеш.
+
+    Вычисление хеша намеренно дорогое, поэтому успешные проверки
+    запоминаются в LRU-кеше: ключ — HMAC имени и пароля на случайном ключе
+    процесса (сам пароль в памяти не хранится), значение — хеш, с которым
+    совпала проверка. Смена пароля меняет хеш, и старая запись кеша
+    перестает совпадать. hashlib отпускает GIL на время вычисления, поэтому
+    проверки из пула потоков выполняются параллельно.
+    """
+    PREFIX = "pbkdf2_sha256"
+    
+    def __init__(self, iterations: int = 200000, cache_size: int = 1024):
+        self.iterations = iterations
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._cache_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def is_hashed(cls, stored: str) -> bool:
+        return stored.startswith(cls.PREFIX + "$")
+    
+    def hash(self, password: str) -> str:
+        """Вычисляет хеш пароля со случайной солью"""
+        salt = secrets.token_bytes(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f"{self.PREFIX}${self.iterations}${salt.hex()}${digest.hex()}"
+    
+    def verify(self, username: str, password: str, stored: str) -> bool:
+        """Проверяет пароль по сохраненному хешу (или открытому тексту)"""
+        if not self.is_hashed(stored):
+            return hmac.compare_digest(stored.encode(), password.encode())
+        
+        key = hmac.new(self._cache_key, f"{username}\0{password}".encode(), hashlib.sha256).digest()
+        with self._lock:
+            if self._cache.get(key) == stored:
+                self._cache.move_to_end(key)
+                return True
+        
+        try:
+            _, iterations, salt, expected = stored.split("$")
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+        except ValueError:
+            return False
+        if not hmac.compare_digest(digest.hex(), expected):
+            return False
+        
+        with self._lock:
+            self._cache[key] = stored
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return True
+
+class LifecycleScheduler:
+    """Фоновое завершение закончившихся аренд и их перенос в архив.
+
+    Активные аренды лежат в минимальной куче по дате окончания: проход
+    снимает с вершины только аренды, которые уже закончились, не
+    просматривая остальные. Новые аренды попадают в кучу через события
+    CarRentalSystem. После завершения завершенные и отмененные аренды
+    переносятся в архив, и рабочий набор не растет вместе с историей.
+
+    Аренды, созданные другими процессами в совместном режиме, попадают
+    в кучу при следующем build().
+    """
+    def __init__(self, system: "CarRentalSystem", interval: float = 3600, archive: bool = True,
+                 clock=date.today):
+        self.system = system
+        self.interval = interval
+        self.archive = archive
+        self.clock = clock
+        self.last_error: Optional[BaseException] = None
+        self._heap: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.build()
+        system.add_listener(self)
+    
+    def build(self):
+        """Строит кучу по активным арендам хранилища"""
+        heap = [
+            (to_ordinal(rental.end_date), rental.id)
+            for rental, _ in self.system.iter_rentals_with_cars(status="active")
+        ]
+        heapify(heap)
+        with self._lock:
+            self._heap = heap
+    
+    def rental_added(self, rental: Rental):
+        if rental.status == "active":
+            with self._lock:
+                heappush(self._heap, (to_ordinal(rental.end_date), rental.id))
+    
+    def run_once(self) -> Dict[str, int]:
+        """Завершает аренды, закончившиеся до сегодняшнего дня, и архивирует завершенные"""
+        today = self.clock().toordinal()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < today:
+                due.append(heappop(self._heap)[1])
+        # Отмененные аренды тоже остаются в куче — complete_rental их пропускает
+        completed = sum(1 for rental_id in due if self.system.complete_rental(rental_id))
+        archived = self.system.archive_finished_rentals() if self.archive else 0
+        return {"completed": completed, "archived": archived}
+    
+    def start(self):
+        """Запускает проходы в фоновом потоке раз в interval секунд"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rental-lifecycle", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as error:  # сбой прохода не должен останавливать планировщик
+                self.last_error = error
+            if self._stop.wait(self.interval):
+                return
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+class QueryCache:
+    """LRU-кеш результатов запросов CarRentalSystem.
+
+    Ключ — имя запроса с параметрами и версия данных хранилища (меняется,
+    когда данные изменил другой процесс). Изменения через систему (аренда,
+    отмена, новый автомобиль, завершение и архивация) увеличивают счетчик
+    поколений и сбрасывают кеш: кеш подписан на события системы. При смене
+    дня кеш тоже очищается — от «сегодня» зависят результаты запросов.
+    Результат, посчитанный во время изменения данных, в кеш не попадает.
+    """
+    def __init__(self, max_size: int = 1024, clock=date.today):
+        self.max_size = max_size
+        self.clock = clock
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._day: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple, compute, version: int = 0) -> list:
+        """Результат запроса key из кеша или вычисленный compute()"""
+        today = self.clock().toordinal()
+        full_key = (key, version)
+        with self._lock:
+            if today != self._day:
+                self._entries.clear()
+                self._day = today
+            result = self._entries.get(full_key)
+            if result is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return list(result)
+            self.misses += 1
+            generation = self.generation
+        
+        result = compute()
+        with self._lock:
+            if generation == self.generation and today == self._day and self.max_size > 0:
+                self._entries[full_key] = list(result)
+                if len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return result
+    
+    def invalidate(self, *args):
+        """Сбрасывает кеш после изменения данных"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+    
+    car_added = rental_added = rental_cancelled = rental_completed = rentals_archived = invalidate
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для мониторинга"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "generation": self.generation,
+            }
+
+class SessionStore:
+    """Хранилище сессий с ограничением размера и временем жизни.
+
+    Сессии упорядочены по последнему обращению: каждое обращение продлевает
+    сессию на ttl секунд, устаревшие сессии удаляются с начала очереди, а при
+    переполнении вытесняется самая давно не использованная.
+    """
+    def __init__(self, ttl: float = 1800, max_sessions: int = 10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._sessions: "OrderedDict[str, Tuple[User, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _evict_expired(self, now: float):
+        while self._sessions:
+            token, (user, expires) = next(iter(self._sessions.items()))
+            if expires > now:
+                break
+            del self._sessions[token]
+    
+    def create(self, user: User) -> str:
+        """Создает сессию пользователя и возвращает ее токен"""
+        token = secrets.token_urlsafe(24)
+        with self._lock:
+            now = self.clock()
+            self._evict_expired(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[token] = (user, now + self.ttl)
+        return token
+    
+    def get(self, token: str) -> Optional[User]:
+        """Возвращает пользователя сессии и продлевает ее; None — сессии нет"""
+        with self._lock:
+            now = self.clock()
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (user, now + self.ttl)
+            self._sessions.move_to_end(token)
+            return user
+    
+    def remove(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+    
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired(self.clock())
+            return len(self._sessions)
+
+class CarRentalSystem:
+    def __init__(self, data_dir: str = "data", storage: str = "json",
+                 journal: bool = False, compact_every: int = 1000, lazy_rentals: bool = False,
+                 shared: bool = False, session_ttl: float = 1800, max_sessions: int = 10000,
+                 password_iterations: int = 200000, pricing: Optional[PricingEngine] = None,
+                 query_cache_size: int = 1024, snapshot: str = "json", change_feed: bool = False):
+        self.data_dir = data_dir
+        # Снимок автомобилей и аренд: "json" или двоичный "binary" (SnapshotFile)
+        self.snapshot = snapshot
+        extension = ".bin" if snapshot == "binary" else ".json"
+        self.cars_file = os.path.join(self.data_dir, "cars" + extension)
+        self.rentals_file = os.path.join(self.data_dir, "rentals" + extension)
+        self.users_file = os.path.join(self.data_dir, "users.json")
+        self.journal_file = os.path.join(self.data_dir, "journal.jsonl")
+        self.db_file = os.path.join(self.data_dir, "car_rental.db")
+        self.current_user: Optional[User] = None
+        # Сессии позволяют одному экземпляру обслуживать многих пользователей сразу
+        self.sessions = SessionStore(session_ttl, max_sessions)
+        self.hasher = PasswordHasher(password_iterations)
+        # Подписчики на изменения: объекты с методами car_added, user_registered, rental_added, rental_cancelled
+        self.listeners: List = []
+        # Последняя ошибка подписчика: изменение к этому моменту уже сохранено, поэтому не пробрасывается
+        self.listener_error: Optional[BaseException] = None
+        # Движок цен подписан на аренды и отмены, чтобы сбрасывать зависящие от загрузки цены
+        self.pricing = pricing or PricingEngine()
+        self.add_listener(self.pricing)
+        # Кеш результатов запросов сбрасывается по событиям изменения данных
+        self.query_cache = QueryCache(query_cache_size)
+        self.add_listener(self.query_cache)
+        # Лента изменений для внешних потребителей (data/changes), по запросу
+        self.change_feed: Optional[ChangeFeed] = None
+        if change_feed:
+            self.change_feed = ChangeFeed(os.path.join(self.data_dir, "changes"))
+            self.add_listener(self.change_feed)
+        
+        # Тип хранилища: "json" (файлы в памяти, опционально с журналом) или "sqlite"
+        self.storage_type = storage
+        self.journal = journal
+        self.compact_every = compact_every
+        self.lazy_rentals = lazy_rentals
+        # Совместный доступ нескольких процессов к одной папке данных
+        self.shared = shared
+        
+        self._initialize_data()
+        self._load_data()
+    
+    def _create_storage(self) -> Storage:
+        """Создает хранилище выбранного типа по текущим путям к файлам"""
+        if self.storage_type == "sqlite":
+            return SqliteStorage(self.db_file)
+        if self.storage_type == "json":
+            return JsonStorage(
+                self.cars_file, self.rentals_file, self.users_file,
+                self.journal_file, self.journal, self.compact_every, self.lazy_rentals,
+                self.shared, self.snapshot
+            )
+        raise ValueError(f"Неизвестный тип хранилища: {self.storage_type}")
+    
+    def _initialize_data(self):
+        """Создает хранилище и его файлы, если они не существуют"""
+        if getattr(self, 'storage', None) is not None:
+            self.storage.close()
+        self.storage = self._create_storage()
+        self.storage.initialize()
+    
+    @metrics.timed("load_data")
+    def _load_data(self):
+        """Загружает данные из хранилища"""
+        self.storage.load()
+    
+    @property
+    def cars(self) -> List[Car]:
+        return self.storage.cars
+    
+    @property
+    def rentals(self) -> List[Rental]:
+        return self.storage.rentals
+    
+    @property
+    def users(self) -> List[User]:
+        return self.storage.users
+    
+    @metrics.timed("save_cars")
     def _save_cars(self):
         """Сохраняет данные об автомобилях"""
-        with open(self.cars_file, 'w') as f:
-            json.dump([car.to_dict() for car in self.cars], f, indent=2)
+        self.storage.save_cars()
+        self.query_cache.invalidate()
     
+    @metrics.timed("save_rentals")
     def _save_rentals(self):
         """Сохраняет данные об арендах"""
-        with open(self.rentals_file, 'w') as f:
-            json.dump([rental.to_dict() for rental in self.rentals], f, indent=2)
+        self.storage.save_rentals()
+        self.query_cache.invalidate()
     
+    @metrics.timed("save_users")
     def _save_users(self):
         """Сохраняет данные о пользователях"""
-        with open(self.users_file, 'w') as f:
-            json.dump([user.to_dict() for user in self.users], f, indent=2)
+        self.storage.save_users()
+    
+    def compact(self):
+        """Сворачивает журнал изменений в снимок"""
+        self.storage.compact()
+    
+    def deferred_writes(self):
+        """Группа операций, изменения которой записываются на диск один раз в конце"""
+        return self.storage.deferred_writes()
+    
+    def close(self):
+        """Закрывает хранилище"""
+        self.storage.close()
+        if self.change_feed is not None:
+            self.change_feed.close()
+    
+    def add_listener(self, listener):
+        """Подписывает объект на изменения, сделанные через систему"""
+        self.listeners.append(listener)
     
-    def register_user(self, username: str, password: str) -> bool:
+    def _notify(self, event: str, *args):
+        for listener in self.listeners:
+            handler = getattr(listener, event, None)
+            if handler is not None:
+                try:
+                    handler(*args)
+                except Exception as error:  # сбой одного подписчика не отменяет изменение и не мешает остальным
+                    logger.exception("Подписчик %s не обработал событие %s", type(listener).__name__, event)
+                    self.listener_error = error
+    
+    def register_user(self, username: str, password: str, role: str = "customer") -> bool:
         """Регистрация нового пользователя"""
-        if any(user.username == username for user in self.users):
+        if self.storage.get_user(username) is not None:
             return False
         
-        new_user = User(username, password)
-        self.users.append(new_user)
-        self._save_users()
+        # Хеш вычисляется до транзакции, чтобы не держать блокировку
+        password_hash = self.hasher.hash(password)
+        with self.storage.transaction():
+            if self.storage.get_user(username) is not None:
+                return False
+            
+            user = User(username, password_hash, role)
+            self.storage.add_user(user)
+        self._notify("user_registered", user)
         return True
     
+    def authenticate(self, username: str, password: str) -> Optional[User]:
+        """Проверяет пароль и возвращает пользователя, не меняя current_user"""
+        self.storage.refresh()
+        user = self.storage.get_user(username)
+        if user is None or not self.hasher.verify(username, password, user.password):
+            return None
+        
+        if not self.hasher.is_hashed(user.password):
+            # Пароль из старого файла хранился открытым текстом — заменяем на хеш
+            user.password = self.hasher.hash(password)
+            with self.storage.transaction():
+                self.storage.update_user(user)
+        return user
+    
+    @metrics.timed("login")
     def login(self, username: str, password: str) -> bool:
         """Аутентификация пользователя"""
-        for user in self.users:
-            if user.username == username and user.password == password:
-                self.current_user = user
-                return True
+        user = self.authenticate(username, password)
+        if user is not None:
+            self.current_user = user
+            return True
         return False
     
     def logout(self):
         """Выход из системы"""
         self.current_user = None
     
-    def add_car(self, brand: str, model: str, year: int, daily_price: float) -> bool:
+    def start_session(self, username: str, password: str) -> Optional[str]:
+        """Вход с созданием сессии: возвращает токен или None при неверном пароле"""
+        user = self.authenticate(username, password)
+        if user is None:
+            return None
+        return self.sessions.create(user)
+    
+    def end_session(self, session: str):
+        """Завершает сессию"""
+        self.sessions.remove(session)
+    
+    def session_user(self, session: Optional[str] = None) -> Optional[User]:
+        """Пользователь сессии; без токена — current_user"""
+        if session is None:
+            return self.current_user
+        return self.sessions.get(session)
+    
+    # Методы ниже действуют от имени сессии session (токен из start_session),
+    # а если она не передана — от имени current_user.
+    
+    def add_car(self, brand: str, model: str, year: int, daily_price: float,
+                session: Optional[str] = None) -> bool:
         """Добавление нового автомобиля (для администратора)"""
-        if not self.current_user or self.current_user.role != "admin":
+        user = self.session_user(session)
+        if not user or user.role != "admin":
             return False
         
-        new_id = max((car.id for car in self.cars), default=0) + 1
-        new_car = Car(new_id, brand, model, year, daily_price)
-        self.cars.append(new_car)
-        self._save_cars()
+        with self.storage.transaction():
+            new_car = Car(self.storage.next_car_id(), brand, model, year, daily_price)
+            self.storage.add_car(new_car)
+        self._notify("car_added", new_car)
         return True
     
-    def get_available_cars(self) -> List[Car]:
-        """Получение списка доступных автомобилей"""
-        today = date.today().isoformat()
-        rented_car_ids = {
-            rental.car_id for rental in self.rentals
-            if rental.status == "active" and rental.end_date >= today
-        }
-        
-        return [car for car in self.cars if car.id not in rented_car_ids]
+    def is_car_free(self, car_id: int, start_date: str, end_date: str) -> bool:
+        """Проверяет, свободен ли автомобиль в период [start_date, end_date]"""
+        self.storage.refresh()
+        return self.storage.is_car_free(car_id, start_date, end_date)
     
-    def rent_car(self, car_id: int, start_date: str, end_date: str) -> Optional[float]:
-        """Аренда автомобиля"""
-        if not self.current_user:
+    @metrics.timed("get_available_cars")
+    def get_available_cars(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Car]:
+        """Получение списка автомобилей, свободных в указанный период (по умолчанию — сегодня)"""
+        start_date = start_date or date.today().isoformat()
+        end_date = end_date or start_date
+        self.storage.refresh()
+        return self.query_cache.get(
+            ("available_cars", start_date, end_date),
+            lambda: self.storage.available_cars(start_date, end_date),
+            self.storage.data_version()
+        )
+    
+    def occupancy_calendar(self, horizon: int = 90) -> OccupancyCalendar:
+        """Календарь занятости парка на horizon дней вперед (снимок на момент вызова)"""
+        self.storage.refresh()
+        return self.storage.occupancy_calendar(horizon)
+    
+    @metrics.timed("search_available")
+    def search_available(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                         brand: Optional[str] = None, max_price: Optional[float] = None,
+                         min_year: Optional[int] = None, sort: str = "id",
+                         limit: int = 50, offset: int = 0) -> List[Car]:
+        """Страница автомобилей, свободных в период, с фильтрами.
+
+        sort — "id", "price" или "year"; с префиксом "-" — по убыванию.
+        """
+        if sort.lstrip("-") not in Storage.SEARCH_SORTS:
+            raise ValueError(f"Неизвестный порядок сортировки: {sort}")
+        if limit < 0 or offset < 0:
+            raise ValueError("limit и offset не могут быть отрицательными")
+        start_date = start_date or date.today().isoformat()
+        end_date = end_date or start_date
+        if limit == 0:
+            return []
+        self.storage.refresh()
+        return self.query_cache.get(
+            ("search_available", start_date, end_date, brand, max_price, min_year, sort, limit, offset),
+            lambda: self.storage.search_available(start_date, end_date, brand, max_price, min_year,
+                                                  sort, limit, offset),
+            self.storage.data_version()
+        )
+    
+    def _quote(self, car: Car, start: date, end: date) -> float:
+        return self.pricing.quote(
+            car, start, end,
+            lambda: self.storage.fleet_utilization(start.isoformat(), end.isoformat())
+        )
+    
+    def quote(self, car_id: int, start_date: str, end_date: str) -> Optional[float]:
+        """Стоимость аренды автомобиля в период; None — автомобиль или даты некорректны"""
+        car = self.storage.get_car(car_id)
+        if car is None:
             return None
-        
         try:
-            car = next(car for car in self.cars if car.id == car_id)
-        except StopIteration:
+            start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        except ValueError:
+            return None
+        if start < date.today() or end <= start:
+            return None
+        return self._quote(car, start, end)
+    
+    def quote_cars(self, cars: List[Car], start_date: str, end_date: str) -> Dict[int, float]:
+        """Цены для списка автомобилей (страницы каталога) в один период"""
+        start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+        if end <= start:
+            return {}
+        return {car.id: self._quote(car, start, end) for car in cars}
+    
+    @metrics.timed("rent_car")
+    def rent_car(self, car_id: int, start_date: str, end_date: str,
+                 session: Optional[str] = None) -> Optional[float]:
+        """Аренда автомобиля"""
+        user = self.session_user(session)
+        if not user:
             return None
         
-        # Проверка доступности автомобиля
-        available_cars = self.get_available_cars()
-        if car not in available_cars:
+        # Автомобиль мог добавить другой процесс (совместный режим)
+        self.storage.refresh()
+        car = self.storage.get_car(car_id)
+        if car is None:
             return None
         
         # Проверка дат
@@ -218,47 +2609,194 @@ class CarRentalSystem:
             return None
         
         # Расчет стоимости
-        days = (end - start).days
-        total_price = days * car.daily_price
-        
-        # Создание аренды
-        new_id = max((rental.id for rental in self.rentals), default=0) + 1
-        new_rental = Rental(
-            id=new_id,
-            car_id=car.id,
-            username=self.current_user.username,
-            start_date=start_date,
-            end_date=end_date,
-            total_price=total_price
-        )
+        start_date = start.isoformat()
+        end_date = end.isoformat()
+        total_price = self._quote(car, start, end)
         
-        self.rentals.append(new_rental)
-        self._save_rentals()
+        # Проверка доступности и создание аренды выполняются атомарно
+        with self.storage.car_transaction(car.id):
+            if not self.storage.is_car_free(car.id, start_date, end_date):
+                return None
+            
+            new_rental = Rental(
+                id=self.storage.next_rental_id(),
+                car_id=car.id,
+                username=user.username,
+                start_date=start_date,
+                end_date=end_date,
+                total_price=total_price
+            )
+            self.storage.add_rental(new_rental)
         
+        self._notify("rental_added", new_rental)
         return total_price
     
-    def get_user_rentals(self) -> List[Rental]:
+    @metrics.timed("rent_cars_batch")
+    def rent_cars_batch(self, bookings: List[Tuple[int, str, str]],
+                        session: Optional[str] = None) -> List[Dict]:
+        """Пакетная аренда по принципу «все или ничего».
+
+        bookings — список (car_id, start_date, end_date). Все позиции
+        проверяются по индексу занятости и друг с другом, после чего
+        сохраняются одной записью. Если хотя бы одна позиция не прошла
+        проверку или запись не удалась, не создается ни одной аренды.
+        Возвращает результаты по позициям: rental_id и total_price при
+        успехе, иначе error.
+        """
+        results = [
+            {"car_id": car_id, "start_date": start_date, "end_date": end_date,
+             "rental_id": None, "total_price": None, "error": None}
+            for car_id, start_date, end_date in bookings
+        ]
+        user = self.session_user(session)
+        if not user:
+            for result in results:
+                result["error"] = "Требуется вход в систему"
+            return results
+        
+        # Проверки, не зависящие от других аренд, — до блокировок
+        self.storage.refresh()
+        prepared = []
+        for result in results:
+            car = self.storage.get_car(result["car_id"])
+            try:
+                start = date.fromisoformat(result["start_date"])
+                end = date.fromisoformat(result["end_date"])
+            except (TypeError, ValueError):
+                result["error"] = "Некорректная дата"
+                continue
+            if car is None:
+                result["error"] = "Автомобиль не найден"
+            elif start < date.today() or end <= start:
+                result["error"] = "Некорректный период аренды"
+            else:
+                result["start_date"], result["end_date"] = start.isoformat(), end.isoformat()
+                result["total_price"] = self._quote(car, start, end)
+                prepared.append(result)
+        
+        if len(prepared) < len(results):
+            return self._reject_batch(results)
+        
+        rentals = [
+            Rental(None, result["car_id"], user.username, result["start_date"],
+                   result["end_date"], result["total_price"])
+            for result in prepared
+        ]
+        with self.storage.cars_transaction([rental.car_id for rental in rentals]):
+            # Локальные расписания ловят пересечения позиций внутри пакета
+            schedules: Dict[int, CarSchedule] = {}
+            for result, rental in zip(prepared, rentals):
+                schedule = schedules.setdefault(rental.car_id, CarSchedule())
+                if not schedule.is_free(to_ordinal(rental.start_date), to_ordinal(rental.end_date)):
+                    result["error"] = "Пересекается с другой позицией пакета"
+                elif not self.storage.is_car_free(rental.car_id, rental.start_date, rental.end_date):
+                    result["error"] = "Автомобиль занят в указанный период"
+                else:
+                    schedule.add(rental)
+            if any(result["error"] for result in prepared):
+                return self._reject_batch(results)
+            
+            # id резервируются только для пакета, который будет записан
+            for rental, rental_id in zip(rentals, self.storage.next_rental_ids(len(rentals))):
+                rental.id = rental_id
+            self.storage.add_rentals(rentals)
+        
+        for result, rental in zip(prepared, rentals):
+            result["rental_id"] = rental.id
+            self._notify("rental_added", rental)
+        return results
+    
+    @staticmethod
+    def _reject_batch(results: List[Dict]) -> List[Dict]:
+        for result in results:
+            result["rental_id"] = None
+            result["total_price"] = None
+            result["error"] = result["error"] or "Пакет отклонен из-за ошибки в другой позиции"
+        return results
+    
+    @metrics.timed("get_user_rentals")
+    def get_user_rentals(self, session: Optional[str] = None) -> List[Rental]:
         """Получение аренд текущего пользователя"""
-        if not self.current_user:
+        user = self.session_user(session)
+        if not user:
             return []
         
-        return [
-            rental for rental in self.rentals
-            if rental.username == self.current_user.username
-        ]
+        self.storage.refresh()
+        return self.query_cache.get(
+            ("user_rentals", user.username),
+            lambda: self.storage.user_rentals(user.username),
+            self.storage.data_version()
+        )
     
-    def cancel_rental(self, rental_id: int) -> bool:
-        """Отмена аренды"""
-        if not self.current_user:
+    @metrics.timed("cancel_rental")
+    def cancel_rental(self, rental_id: int, session: Optional[str] = None) -> bool:
+        """Отмена активной аренды; False — аренды нет, она чужая или уже не активна"""
+        user = self.session_user(session)
+        if not user:
             return False
         
-        for rental in self.rentals:
-            if rental.id == rental_id and rental.username == self.current_user.username:
-                rental.status = "cancelled"
-                self._save_rentals()
-                return True
+        # Аренду мог создать другой процесс (совместный режим)
+        self.storage.refresh()
+        rental = self.storage.get_rental(rental_id)
+        if rental is None:
+            return False
         
-        return False
+        with self.storage.car_transaction(rental.car_id):
+            # В совместном режиме данные могли быть перечитаны — берем аренду заново
+            rental = self.storage.get_rental(rental_id)
+            if rental is None or rental.username != user.username:
+                return False
+            # Отменить можно только активную аренду: завершенная остается завершенной
+            if rental.status != "active":
+                return False
+            
+            self.storage.set_rental_status(rental, "cancelled")
+        self._notify("rental_cancelled", rental)
+        return True
+    
+    def complete_rental(self, rental_id: int) -> bool:
+        """Переводит закончившуюся активную аренду в статус completed"""
+        self.storage.refresh()
+        rental = self.storage.get_rental(rental_id)
+        if rental is None:
+            return False
+        
+        with self.storage.car_transaction(rental.car_id):
+            rental = self.storage.get_rental(rental_id)
+            if rental is None or rental.status != "active":
+                return False
+            self.storage.set_rental_status(rental, "completed")
+        self._notify("rental_completed", rental)
+        return True
+    
+    def archive_finished_rentals(self) -> int:
+        """Переносит завершенные и отмененные аренды в архив, возвращает их число"""
+        with self.storage.transaction():
+            finished = [
+                rental for rental, _ in self.storage.iter_rentals_with_cars()
+                if rental.status in ("completed", "cancelled")
+            ]
+            archived = self.storage.archive_rentals(finished)
+        self._notify("rentals_archived", finished)
+        return archived
+    
+    def iter_rental_history(self) -> Iterator[Rental]:
+        """Все аренды: рабочий набор и архив"""
+        self.storage.refresh()
+        for rental, _ in self.storage.iter_rentals_with_cars():
+            yield rental
+        yield from self.storage.iter_archived_rentals()
+    
+    def iter_rentals_with_cars(self, username: Optional[str] = None,
+                               status: Optional[str] = None) -> Iterator[Tuple[Rental, Optional[Car]]]:
+        """Потоковый отчет: аренды вместе с автомобилями (Car или None, если автомобиль удален)"""
+        self.storage.refresh()
+        return self.storage.iter_rentals_with_cars(username, status)
+    
+    def get_rentals_page(self, offset: int = 0, limit: int = 50, username: Optional[str] = None,
+                         status: Optional[str] = None) -> List[Tuple[Rental, Optional[Car]]]:
+        """Страница отчета по арендам"""
+        return list(islice(self.iter_rentals_with_cars(username, status), offset, offset + limit))
 
 class ConsoleInterface:
     def __init__(self):
@@ -267,10 +2805,7 @@ class ConsoleInterface:
     
     def _initialize_admin(self):
         """Создает администратора, если его нет"""
-        if not any(user.username == "admin" for user in self.system.users):
-            admin = User("admin", "admin123", "admin")
-            self.system.users.append(admin)
-            self.system._save_users()
+        self.system.register_user("admin", "admin123", "admin")
     
     def _display_menu(self):
         """Отображает главное меню"""
@@ -295,7 +2830,11 @@ class ConsoleInterface:
     
     def _clear_screen(self):
         """Очищает экран консоли"""
-        os.system('cls' if os.name == 'nt' else 'clear')
+        if os.name == 'nt':
+            os.system('cls')
+        else:
+            # Escape-последовательность ANSI вместо запуска процесса clear
+            print("\033[H\033[2J", end="", flush=True)
     
     def run(self):
         """Запускает главный цикл приложения"""
@@ -425,18 +2964,10 @@ class ConsoleInterface:
         """Показывает аренды текущего пользователя"""
         self._clear_screen()
         print("=== Мои аренды ===")
-        rentals = self.system.get_user_rentals()
+        rentals = self.system.iter_rentals_with_cars(self.system.current_user.username)
         
-        if not rentals:
+        if not self._print_rentals(rentals):
             print("У вас нет активных аренд.")
-        else:
-            for rental in rentals:
-                car = next(car for car in self.system.cars if car.id == rental.car_id)
-                print(f"\nАренда #{rental.id}")
-                print(f"Автомобиль: {car.brand} {car.model}")
-                print(f"Период: с {rental.start_date} по {rental.end_date}")
-                print(f"Стоимость: {rental.total_price:.2f} руб.")
-                print(f"Статус: {rental.status}")
         
         input("\nНажмите Enter для продолжения...")
     
@@ -444,10 +2975,7 @@ class ConsoleInterface:
         """Обрабатывает отмену аренды"""
         self._clear_screen()
         print("=== Отмена аренды ===")
-        rentals = [
-            rental for rental in self.system.get_user_rentals()
-            if rental.status == "active"
-        ]
+        rentals = list(self.system.iter_rentals_with_cars(self.system.current_user.username, "active"))
         
         if not rentals:
             print("У вас нет активных аренд для отмены.")
@@ -455,9 +2983,10 @@ class ConsoleInterface:
             return
         
         print("\nВаши активные аренды:")
-        for rental in rentals:
-            car = next(car for car in self.system.cars if car.id == rental.car_id)
-            print(f"{rental.id}. {car.brand} {car.model} - с {rental.start_date} по {rental.end_date}")
+        print("\n".join(
+            f"{rental.id}. {self._car_info(car)} - с {rental.start_date} по {rental.end_date}"
+            for rental, car in rentals
+        ))
         
         try:
             rental_id = int(input("\nВведите ID аренды для отмены: "))
@@ -498,20 +3027,35 @@ class ConsoleInterface:
         self._clear_screen()
         print("=== Все аренды ===")
         
-        if not self.system.rentals:
+        if not self._print_rentals(self.system.iter_rentals_with_cars(), show_user=True):
             print("Нет данных об арендах.")
-        else:
-            for rental in self.system.rentals:
-                car = next((car for car in self.system.cars if car.id == rental.car_id), None)
-                car_info = f"{car.brand} {car.model}" if car else "Неизвестный автомобиль"
-                print(f"\nАренда #{rental.id}")
-                print(f"Пользователь: {rental.username}")
-                print(f"Автомобиль: {car_info}")
-                print(f"Период: с {rental.start_date} по {rental.end_date}")
-                print(f"Стоимость: {rental.total_price:.2f} руб.")
-                print(f"Статус: {rental.status}")
         
         input("\nНажмите Enter для продолжения...")
+    
+    @staticmethod
+    def _car_info(car: Optional[Car]) -> str:
+        return f"{car.brand} {car.model}" if car else "Неизвестный автомобиль"
+    
+    def _print_rentals(self, rentals: Iterator[Tuple[Rental, Optional[Car]]],
+                       show_user: bool = False, batch_size: int = 500) -> int:
+        """Выводит аренды пачками по batch_size записей, возвращает их количество"""
+        count = 0
+        batch = []
+        for rental, car in rentals:
+            batch.append(f"\nАренда #{rental.id}")
+            if show_user:
+                batch.append(f"Пользователь: {rental.username}")
+            batch.append(f"Автомобиль: {self._car_info(car)}")
+            batch.append(f"Период: с {rental.start_date} по {rental.end_date}")
+            batch.append(f"Стоимость: {rental.total_price:.2f} руб.")
+            batch.append(f"Статус: {rental.status}")
+            count += 1
+            if count % batch_size == 0:
+                print("\n".join(batch))
+                batch.clear()
+        if batch:
+            print("\n".join(batch))
+        return count
 
 if __name__ == "__main__":
     app = ConsoleInterface()
@@ -0,0 +1,286 @@
+"""Аналитика по арендам: выручка, загрузка парка, длительность и отмены.
+
+Запуск:
+    python rental_analytics.py --data-dir data --start 2024-01-01 --end 2024-12-31
+
+RentalAnalytics считает агрегаты по колоночной таблице аренд (RentalTable)
+целиком по столбцам: с NumPy — векторно через bincount по ключам
+группировки, без него — одним проходом zip по массивам array.
+RentalStats поддерживает те же агрегаты инкрементально: подписывается на
+события CarRentalSystem и обновляет суммы при каждой аренде и отмене.
+
+Выручка аренды относится ко дню ее начала; отмененные аренды в выручку,
+длительность и загрузку не входят. Загрузка считается по оплаченным дням
+аренды: [start_date, end_date).
+"""
+import argparse
+import json
+import threading
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from car_rental import Car, CarRentalSystem, Rental, RentalTable, to_ordinal
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: без него работает вариант на array
+    np = None
+
+UNKNOWN_BRAND = "Неизвестно"
+
+
+class _Aggregates:
+    """Отчеты, которые строятся из сумм по дням и по автомобилям"""
+    car_brands: Dict[int, str]
+
+    def _day_totals(self) -> Dict[int, float]:
+        raise NotImplementedError
+
+    def _car_totals(self) -> Dict[int, float]:
+        raise NotImplementedError
+
+    def revenue_by_day(self) -> Dict[str, float]:
+        return {
+            date.fromordinal(day).isoformat(): total
+            for day, total in sorted(self._day_totals().items())
+        }
+
+    def revenue_by_month(self) -> Dict[str, float]:
+        months: Dict[str, float] = {}
+        for day, total in sorted(self._day_totals().items()):
+            month = date.fromordinal(day).isoformat()[:7]
+            months[month] = months.get(month, 0.0) + total
+        return months
+
+    def revenue_by_car(self) -> Dict[int, float]:
+        return dict(sorted(self._car_totals().items()))
+
+    def revenue_by_brand(self) -> Dict[str, float]:
+        brands: Dict[str, float] = {}
+        for car_id, total in self._car_totals().items():
+            brand = self.car_brands.get(car_id, UNKNOWN_BRAND)
+            brands[brand] = brands.get(brand, 0.0) + total
+        return dict(sorted(brands.items()))
+
+    def utilization(self, start_date: str, end_date: str) -> float:
+        raise NotImplementedError
+
+    def average_length(self) -> float:
+        raise NotImplementedError
+
+    def cancellation_rate(self) -> float:
+        raise NotImplementedError
+
+    def summary(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+        """Все показатели одним словарем; загрузка — если задан период"""
+        report = {
+            "revenue_by_month": self.revenue_by_month(),
+            "revenue_by_brand": self.revenue_by_brand(),
+            "average_length": self.average_length(),
+            "cancellation_rate": self.cancellation_rate(),
+        }
+        if start_date and end_date:
+            report["utilization"] = self.utilization(start_date, end_date)
+        return report
+
+
+class RentalAnalytics(_Aggregates):
+    """Агрегаты по снимку истории аренд в колоночном виде"""
+    def __init__(self, table: RentalTable, car_brands: Dict[int, str],
+                 use_numpy: Optional[bool] = None):
+        if use_numpy and np is None:
+            raise RuntimeError("NumPy не установлен")
+        self.table = table
+        self.car_brands = car_brands
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self._cancelled = table.status_code("cancelled")
+
+    @classmethod
+    def from_system(cls, system: CarRentalSystem, use_numpy: Optional[bool] = None) -> "RentalAnalytics":
+        table = RentalTable.from_rentals(system.iter_rental_history())
+        brands = {car.id: car.brand for car in system.storage.cars}
+        return cls(table, brands, use_numpy)
+
+    def _numpy_columns(self):
+        """Столбцы таблицы как массивы NumPy без копирования и маска неотмененных аренд"""
+        table = self.table
+
+        def column(values, kind):
+            return np.frombuffer(values, dtype=f"{kind}{values.itemsize}")
+
+        codes = column(table.status_codes, "i")
+        return {
+            "car_ids": column(table.car_ids, "i"),
+            "starts": column(table.starts, "i"),
+            "ends": column(table.ends, "i"),
+            "prices": column(table.prices, "f"),
+            "valid": codes != self._cancelled,
+        }
+
+    @staticmethod
+    def _numpy_group_sum(keys, weights) -> Dict[int, float]:
+        if not len(keys):
+            return {}
+        # Ключи (дни, id автомобилей) плотные, поэтому bincount по смещению
+        # от минимума обходится без сортировки
+        low = int(keys.min())
+        offsets = keys - low
+        present = np.flatnonzero(np.bincount(offsets))
+        sums = np.bincount(offsets, weights=weights)[present]
+        return dict(zip((present + low).tolist(), sums.tolist()))
+
+    def _group_sum(self, keys) -> Dict[int, float]:
+        cancelled = self._cancelled
+        totals: Dict[int, float] = {}
+        get = totals.get
+        for key, price, code in zip(keys, self.table.prices, self.table.status_codes):
+            if code != cancelled:
+                totals[key] = get(key, 0.0) + price
+        return totals
+
+    def _day_totals(self) -> Dict[int, float]:
+        if self.use_numpy and len(self.table):
+            c = self._numpy_columns()
+            return self._numpy_group_sum(c["starts"][c["valid"]], c["prices"][c["valid"]])
+        return self._group_sum(self.table.starts)
+
+    def _car_totals(self) -> Dict[int, float]:
+        if self.use_numpy and len(self.table):
+            c = self._numpy_columns()
+            return self._numpy_group_sum(c["car_ids"][c["valid"]], c["prices"][c["valid"]])
+        return self._group_sum(self.table.car_ids)
+
+    def utilization(self, start_date: str, end_date: str) -> float:
+        """Доля оплаченных автомобиле-дней парка в периоде [start_date, end_date]"""
+        first, last = to_ordinal(start_date), to_ordinal(end_date) + 1
+        capacity = len(self.car_brands) * (last - first)
+        if capacity <= 0:
+            return 0.0
+        if self.use_numpy and len(self.table):
+            c = self._numpy_columns()
+            busy = np.minimum(c["ends"], last) - np.maximum(c["starts"], first)
+            busy_days = int(np.clip(busy, 0, None)[c["valid"]].sum())
+        else:
+            cancelled = self._cancelled
+            busy_days = 0
+            for start, end, code in zip(self.table.starts, self.table.ends, self.table.status_codes):
+                if code != cancelled and start < last and end > first:
+                    busy_days += min(end, last) - max(start, first)
+        return busy_days / capacity
+
+    def average_length(self) -> float:
+        """Средняя длительность неотмененной аренды в днях"""
+        if self.use_numpy and len(self.table):
+            c = self._numpy_columns()
+            lengths = (c["ends"] - c["starts"])[c["valid"]]
+            return float(lengths.mean()) if len(lengths) else 0.0
+        cancelled = self._cancelled
+        count = total = 0
+        for start, end, code in zip(self.table.starts, self.table.ends, self.table.status_codes):
+            if code != cancelled:
+                count += 1
+                total += end - start
+        return total / count if count else 0.0
+
+    def cancellation_rate(self) -> float:
+        if not len(self.table):
+            return 0.0
+        return self.table.status_codes.count(self._cancelled) / len(self.table)
+
+
+class RentalStats(_Aggregates):
+    """Инкрементальные агрегаты: обновляются на каждую аренду и отмену.
+
+    Подключается к системе через attach(): один раз считает историю,
+    а дальше получает события rental_added / rental_cancelled / car_added
+    (их дает и пакетный импорт rental_io). Изменения, сделанные другими
+    процессами (совместный режим), в агрегаты не попадают.
+    """
+    def __init__(self, car_brands: Optional[Dict[int, str]] = None):
+        self.car_brands = dict(car_brands or {})
+        self.count = 0
+        self.cancelled = 0
+        self.total_days = 0
+        self.day_totals: Dict[int, float] = {}
+        self.car_totals: Dict[int, float] = {}
+        self.busy_days: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, system: CarRentalSystem) -> "RentalStats":
+        stats = cls({car.id: car.brand for car in system.storage.cars})
+        for rental in system.iter_rental_history():
+            stats.rental_added(rental)
+        system.add_listener(stats)
+        return stats
+
+    def car_added(self, car: Car):
+        with self._lock:
+            self.car_brands[car.id] = car.brand
+
+    def rental_added(self, rental: Rental):
+        with self._lock:
+            self.count += 1
+            if rental.status == "cancelled":
+                self.cancelled += 1
+            else:
+                self._apply(rental, 1)
+
+    def rental_cancelled(self, rental: Rental):
+        with self._lock:
+            self.cancelled += 1
+            self._apply(rental, -1)
+
+    def _apply(self, rental: Rental, sign: int):
+        start, end = to_ordinal(rental.start_date), to_ordinal(rental.end_date)
+        price = sign * rental.total_price
+        self.day_totals[start] = self.day_totals.get(start, 0.0) + price
+        self.car_totals[rental.car_id] = self.car_totals.get(rental.car_id, 0.0) + price
+        self.total_days += sign * (end - start)
+        for day in range(start, end):
+            self.busy_days[day] = self.busy_days.get(day, 0) + sign
+
+    def _day_totals(self) -> Dict[int, float]:
+        with self._lock:
+            return dict(self.day_totals)
+
+    def _car_totals(self) -> Dict[int, float]:
+        with self._lock:
+            return dict(self.car_totals)
+
+    def utilization(self, start_date: str, end_date: str) -> float:
+        first, last = to_ordinal(start_date), to_ordinal(end_date) + 1
+        capacity = len(self.car_brands) * (last - first)
+        if capacity <= 0:
+            return 0.0
+        with self._lock:
+            busy = sum(self.busy_days.get(day, 0) for day in range(first, last))
+        return busy / capacity
+
+    def average_length(self) -> float:
+        valid = self.count - self.cancelled
+        return self.total_days / valid if valid else 0.0
+
+    def cancellation_rate(self) -> float:
+        return self.cancelled / self.count if self.count else 0.0
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Аналитика по арендам")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--start", help="начало периода для загрузки парка")
+    parser.add_argument("--end", help="конец периода для загрузки парка")
+    parser.add_argument("--no-numpy", action="store_true", help="считать без NumPy")
+    args = parser.parse_args(argv)
+
+    system = CarRentalSystem(data_dir=args.data_dir, storage=args.storage)
+    try:
+        analytics = RentalAnalytics.from_system(system, use_numpy=False if args.no_numpy else None)
+        print(json.dumps(analytics.summary(args.start, args.end), ensure_ascii=False, indent=2))
+    finally:
+        system.close()
+
+
+if __name__ == "__main__":
+    main()
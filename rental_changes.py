@@ -0,0 +1,334 @@
+"""Лента изменений: пронумерованные события об автомобилях, пользователях и арендах.
+
+    system = CarRentalSystem(change_feed=True)        # события пишутся в data/changes
+    system.change_feed.subscribe(print)               # обратный вызов в этом же процессе
+
+    reader = ChangeFeedReader("data/changes", offset=saved_offset)
+    for event in reader.read():                       # только новые события
+        ...
+    saved_offset = reader.offset
+
+Из командной строки (строки JSONL в стандартный вывод):
+    python rental_changes.py data/changes --offset 0 --follow
+
+Событие — строка JSON {"offset", "time", "type", "data"}. Типы: car_added,
+user_registered, rental_added, rental_cancelled, rental_completed; в data —
+запись автомобиля или аренды, для пользователя — имя и роль (без пароля).
+Номера (offset) идут подряд с нуля.
+
+Лента хранится сегментами — файлами только для дописывания с именем по
+номеру первого события (00000000000000000000.jsonl), новый сегмент
+начинается, когда текущий превышает segment_size байт. Читатель находит
+сегмент по номеру, продолжает с сохраненного номера и переходит к
+следующему сегменту, дочитав текущий. Несколько процессов (совместный
+режим) дописывают ленту по очереди под блокировкой fcntl.
+
+Событие записывается после того, как изменение сохранено хранилищем:
+при сбое между этими шагами событие может потеряться, но лента не
+содержит событий о несохраненных изменениях. Пакетный импорт rental_io
+дает те же события, что и добавление записей через CarRentalSystem.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: запись из нескольких процессов не поддерживается
+    fcntl = None
+
+SEGMENT_SUFFIX = ".jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_name(base_offset: int) -> str:
+    return f"{base_offset:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory: str) -> List[int]:
+    """Номера первых событий сегментов по возрастанию"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+        if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+    )
+
+
+def _parse_event(line: bytes, path: str, position: int) -> Dict:
+    try:
+        return json.loads(line)
+    except ValueError:
+        raise ValueError(f"Поврежденное событие в {path} (байт {position}): "
+                         f"{line[:80]!r}") from None
+
+
+def _scan_tail(path: str) -> Tuple[Optional[int], int]:
+    """Номер последнего полностью записанного события сегмента и конец его строки"""
+    last, end = None, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            last = _parse_event(line, path, end)["offset"]
+            end += len(line)
+    return last, end
+
+
+class ChangeFeed:
+    """Запись ленты изменений; подписывается на события CarRentalSystem"""
+    def __init__(self, directory: str, segment_size: int = 16 << 20, fsync: bool = True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.subscribers: List[Callable[[Dict], None]] = []
+        self.last_error: Optional[BaseException] = None
+        # Ошибка записи останавливает ленту: следующие события легли бы после
+        # пропущенного с теми же номерами, и потерю нельзя было бы заметить
+        self.broken: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._handle = None
+        self._lock_handle = None
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._open_tail()
+
+    @contextmanager
+    def _file_lock(self):
+        """Блокировка ленты между процессами (вызывается под self._lock)"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_handle is None:
+            self._lock_handle = open(os.path.join(self.directory, ".lock"), 'a')
+        fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+
+    def _open_tail(self):
+        """Открывает последний сегмент и определяет номер следующего события.
+
+        Строка, оборванная сбоем посреди записи, отрезается: иначе следующее
+        событие склеилось бы с ней в одну нечитаемую строку.
+        """
+        if self._handle is not None:
+            self._handle.close()
+        segments = list_segments(self.directory)
+        base = segments[-1] if segments else 0
+        path = os.path.join(self.directory, _segment_name(base))
+        last, end = _scan_tail(path) if os.path.exists(path) else (None, 0)
+        self.next_offset = base if last is None else last + 1
+        self._segment_base = base
+        self._handle = open(path, 'ab')
+        if self._handle.tell() > end:
+            self._handle.truncate(end)
+        self._expected_size = end
+
+    def close(self):
+        with self._lock:
+            for handle in (self._handle, self._lock_handle):
+                if handle is not None:
+                    handle.close()
+            self._handle = self._lock_handle = None
+
+    # События CarRentalSystem
+
+    def car_added(self, car):
+        self.append("car_added", car.to_dict())
+
+    def user_registered(self, user):
+        self.append("user_registered", {"username": user.username, "role": user.role})
+
+    def rental_added(self, rental):
+        self.append("rental_added", rental.to_dict())
+
+    def rental_cancelled(self, rental):
+        self.append("rental_cancelled", rental.to_dict())
+
+    def rental_completed(self, rental):
+        self.append("rental_completed", rental.to_dict())
+
+    def append(self, event_type: str, data: Dict) -> Dict:
+        """Дописывает событие в ленту и передает его подписчикам.
+
+        Ошибка записи пробрасывается, а лента до перезапуска отказывает в
+        записи всем следующим событиям.
+        """
+        with self._lock:
+            if self.broken is not None:
+                raise RuntimeError(f"Лента изменений остановлена после ошибки записи: {self.broken}")
+            with self._file_lock():
+                # Другой процесс дописал ленту или начал новый сегмент — перечитываем хвост
+                if (os.path.getsize(self._handle.name) != self._expected_size
+                        or list_segments(self.directory)[-1] != self._segment_base):
+                    self._open_tail()
+                if self._expected_size >= self.segment_size:
+                    path = os.path.join(self.directory, _segment_name(self.next_offset))
+                    self._handle.close()
+                    self._handle = open(path, 'ab')
+                    self._segment_base = self.next_offset
+                    self._expected_size = 0
+
+                event = {
+                    "offset": self.next_offset,
+                    "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "type": event_type,
+                    "data": data,
+                }
+                line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+                try:
+                    self._handle.write(line)
+                    self._handle.flush()
+                    if self.fsync:
+                        os.fsync(self._handle.fileno())
+                except OSError as error:
+                    self.broken = error
+                    raise
+                self._expected_size += len(line)
+                self.next_offset += 1
+            subscribers = list(self.subscribers)
+
+        # Подписчики вызываются вне блокировки, чтобы могли сами менять данные системы;
+        # при записи из нескольких потоков порядок вызовов восстанавливается по offset
+        for callback in subscribers:
+            self._call(callback, event)
+        return event
+
+    def _call(self, callback: Callable[[Dict], None], event: Dict):
+        try:
+            callback(event)
+        except Exception as error:  # ошибка подписчика не отменяет уже сохраненное изменение
+            logger.exception("Подписчик ленты изменений не обработал событие %s", event["offset"])
+            self.last_error = error
+
+    def subscribe(self, callback: Callable[[Dict], None], offset: Optional[int] = None):
+        """Подписывает callback на новые события; с offset — сначала передает записанные с него.
+
+        Записанные события передаются вне блокировки, поэтому callback может
+        сам дописывать ленту. Подписка регистрируется, когда чтение догнало
+        запись: события, дописанные во время передачи, дочитываются в цикле.
+        """
+        reader = ChangeFeedReader(self.directory, offset) if offset is not None else None
+        while True:
+            if reader is not None:
+                for event in reader.read(limit=None):
+                    self._call(callback, event)
+            with self._lock:
+                if reader is None or reader.offset >= self.next_offset:
+                    self.subscribers.append(callback)
+                    return
+
+    def unsubscribe(self, callback: Callable[[Dict], None]):
+        with self._lock:
+            self.subscribers.remove(callback)
+
+    def prune(self, before_offset: int) -> int:
+        """Удаляет сегменты, все события которых старше before_offset"""
+        removed = 0
+        with self._lock:
+            segments = list_segments(self.directory)
+            for base, following in zip(segments, segments[1:]):
+                if following <= before_offset and base != self._segment_base:
+                    os.remove(os.path.join(self.directory, _segment_name(base)))
+                    removed += 1
+        return removed
+
+
+class ChangeFeedReader:
+    """Чтение ленты с заданного номера события, в том числе из другого процесса"""
+    def __init__(self, directory: str, offset: int = 0):
+        self.directory = directory
+        self.offset = offset
+        self._segment: Optional[int] = None
+        self._position = 0
+
+    def _seek(self):
+        """Находит сегмент, содержащий self.offset, и позицию события в нем"""
+        segments = list_segments(self.directory)
+        candidates = [base for base in segments if base <= self.offset]
+        if not candidates:
+            if segments and segments[0] > self.offset:
+                raise ValueError(f"События до {segments[0]} удалены из ленты")
+            return
+        self._segment = candidates[-1]
+        self._position = 0
+        path = os.path.join(self.directory, _segment_name(self._segment))
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n") or \
+                        _parse_event(line, path, self._position)["offset"] >= self.offset:
+                    break
+                self._position += len(line)
+
+    def read(self, limit: Optional[int] = 1000) -> List[Dict]:
+        """Следующие события (не больше limit); пустой список — новых пока нет"""
+        if self._segment is None:
+            self._seek()
+            if self._segment is None:
+                return []
+        events: List[Dict] = []
+        while limit is None or len(events) < limit:
+            path = os.path.join(self.directory, _segment_name(self._segment))
+            with open(path, 'rb') as f:
+                f.seek(self._position)
+                for line in f:
+                    # Строка, которую писатель еще не дописал, читается в следующий раз
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        event = _parse_event(line, path, self._position)
+                    except ValueError:
+                        # Прочитанные до поврежденной строки события отдаются, ошибка — при следующем вызове
+                        if events:
+                            return events
+                        raise
+                    self._position += len(line)
+                    self.offset = event["offset"] + 1
+                    events.append(event)
+                    if limit is not None and len(events) >= limit:
+                        return events
+            following = [base for base in list_segments(self.directory) if base > self._segment]
+            if not following or following[0] > self.offset:
+                return events
+            self._segment, self._position = following[0], 0
+        return events
+
+    def follow(self, poll_interval: float = 0.5, stop: Optional[threading.Event] = None) -> Iterator[Dict]:
+        """Бесконечно отдает события по мере появления (до установки stop)"""
+        while stop is None or not stop.is_set():
+            events = self.read()
+            yield from events
+            if not events:
+                time.sleep(poll_interval)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Чтение ленты изменений")
+    parser.add_argument("directory", nargs="?", default=os.path.join("data", "changes"))
+    parser.add_argument("--offset", type=int, default=0, help="номер первого события")
+    parser.add_argument("--follow", action="store_true", help="ждать новые события")
+    args = parser.parse_args(argv)
+
+    reader = ChangeFeedReader(args.directory, args.offset)
+    events = reader.follow() if args.follow else iter(lambda: reader.read(), [])
+    try:
+        for event in events:
+            for item in ([event] if args.follow else event):
+                sys.stdout.write(json.dumps(item, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Неинтерактивный режим: команды из аргументов или из сценария JSONL.
+
+Запуск:
+    python rental_cli.py login admin admin123 + add_car BMW X5 2022 5000
+    python rental_cli.py --script ops.jsonl
+    python rental_cli.py --script - < ops.jsonl
+
+Команды в аргументах разделяются отдельным «+». Строка сценария — объект
+JSON с полем "cmd" и аргументами по именам или списком "args":
+    {"cmd": "login", "username": "admin", "password": "admin123"}
+    {"cmd": "rent_car", "args": [1, "2025-07-01", "2025-07-03"]}
+
+Все команды выполняются одним загруженным CarRentalSystem от имени
+пользователя, вошедшего командой login. Изменения записываются на диск
+один раз в конце (CarRentalSystem.deferred_writes). На каждую команду
+печатается строка JSON {"n", "cmd", "ok", "result"} (или "error"), в конце —
+строка {"summary": ...}. Код выхода 1, если хотя бы одна команда не удалась.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from car_rental import CarRentalSystem
+
+SEPARATOR = "+"
+
+
+def _optional(convert: Callable) -> Callable:
+    return lambda value: None if value is None else convert(value)
+
+
+# Команда: функция системы и ее аргументы (имя, преобразование, значение по умолчанию)
+COMMANDS: Dict[str, Tuple[Callable, List[Tuple]]] = {
+    "register_user": (
+        lambda system, **kwargs: system.register_user(**kwargs),
+        [("username", str), ("password", str), ("role", str, "customer")],
+    ),
+    "login": (
+        lambda system, **kwargs: system.login(**kwargs),
+        [("username", str), ("password", str)],
+    ),
+    "logout": (
+        lambda system: system.logout() or True,
+        [],
+    ),
+    "add_car": (
+        lambda system, **kwargs: system.add_car(**kwargs),
+        [("brand", str), ("model", str), ("year", int), ("daily_price", float)],
+    ),
+    "get_available_cars": (
+        lambda system, **kwargs: [car.to_dict() for car in system.get_available_cars(**kwargs)],
+        [("start_date", _optional(str), None), ("end_date", _optional(str), None)],
+    ),
+    "search_available": (
+        lambda system, **kwargs: [car.to_dict() for car in system.search_available(**kwargs)],
+        [("start_date", _optional(str), None), ("end_date", _optional(str), None),
+         ("brand", _optional(str), None), ("max_price", _optional(float), None),
+         ("min_year", _optional(int), None), ("sort", str, "id"),
+         ("limit", int, 50), ("offset", int, 0)],
+    ),
+    "quote": (
+        lambda system, **kwargs: system.quote(**kwargs),
+        [("car_id", int), ("start_date", str), ("end_date", str)],
+    ),
+    "rent_car": (
+        lambda system, **kwargs: system.rent_car(**kwargs),
+        [("car_id", int), ("start_date", str), ("end_date", str)],
+    ),
+    "cancel_rental": (
+        lambda system, **kwargs: system.cancel_rental(**kwargs),
+        [("rental_id", int)],
+    ),
+    "get_user_rentals": (
+        lambda system: [rental.to_dict() for rental in system.get_user_rentals()],
+        [],
+    ),
+}
+
+
+def bind_arguments(name: str, args: List, kwargs: Dict) -> Dict:
+    """Сопоставляет позиционные и именованные аргументы команде и приводит типы"""
+    if name not in COMMANDS:
+        raise ValueError(f"Неизвестная команда: {name}")
+    _, params = COMMANDS[name]
+    if len(args) > len(params):
+        raise ValueError(f"Слишком много аргументов: {len(args)}")
+    unknown = set(kwargs) - {param[0] for param in params}
+    if unknown:
+        raise ValueError(f"Неизвестные аргументы: {', '.join(sorted(unknown))}")
+
+    bound = {}
+    for i, (param, convert, *default) in enumerate(params):
+        if i < len(args):
+            value = args[i]
+        elif param in kwargs:
+            value = kwargs[param]
+        elif default:
+            value = default[0]
+        else:
+            raise ValueError(f"Не указан аргумент {param}")
+        bound[param] = convert(value)
+    return bound
+
+
+def iter_argv_commands(argv: List[str]) -> Iterator[Tuple[str, List, Dict]]:
+    """Команды из аргументов командной строки, разделенные «+»"""
+    command: List[str] = []
+    for token in list(argv) + [SEPARATOR]:
+        if token != SEPARATOR:
+            command.append(token)
+        elif command:
+            yield command[0], command[1:], {}
+            command = []
+
+
+def iter_script_commands(lines: Iterable[str]) -> Iterator[Tuple[str, List, Dict]]:
+    """Команды из строк JSONL; пустые строки пропускаются"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            # Строка все равно становится командой, чтобы номера результатов совпадали со строками
+            record = {"cmd": "<некорректная строка>"}
+        kwargs = dict(record)
+        name = kwargs.pop("cmd", None)
+        args = kwargs.pop("args", [])
+        yield name, args, kwargs
+
+
+def run_commands(system: CarRentalSystem, commands: Iterable[Tuple[str, List, Dict]],
+                 output=None) -> Dict:
+    """Выполняет команды одной группой записи и возвращает сводку.
+
+    Ошибка одной команды (неизвестная команда, неверные аргументы)
+    не прерывает сценарий и попадает в ее строку результата.
+    """
+    started = time.perf_counter()
+    total = failed = 0
+    with system.deferred_writes():
+        for total, (name, args, kwargs) in enumerate(commands, 1):
+            entry = {"n": total, "cmd": name}
+            try:
+                bound = bind_arguments(name, args, kwargs)
+                result = COMMANDS[name][0](system, **bound)
+            except (TypeError, ValueError) as error:
+                entry.update(ok=False, error=str(error))
+            else:
+                # None и False — отказ системы (занято, нет прав, неверные данные)
+                entry.update(ok=result is not None and result is not False, result=result)
+            if not entry["ok"]:
+                failed += 1
+            if output is not None:
+                output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return {"commands": total, "failed": failed,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Неинтерактивное выполнение команд системы проката")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--journal", action="store_true", help="режим журнала изменений")
+    parser.add_argument("--script", help="файл JSONL с командами ('-' — стандартный ввод)")
+    parser.add_argument("--password-iterations", type=int, default=200000,
+                        help="итерации PBKDF2 для новых паролей")
+    parser.add_argument("--quiet", action="store_true", help="печатать только сводку")
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help=f"команда и аргументы; несколько команд разделяются «{SEPARATOR}»")
+    args = parser.parse_args(argv)
+    if bool(args.script) == bool(args.command):
+        parser.error("укажите либо команду, либо --script")
+
+    system = CarRentalSystem(data_dir=args.data_dir, storage=args.storage, journal=args.journal,
+                             password_iterations=args.password_iterations)
+    script = None
+    try:
+        if args.script:
+            script = sys.stdin if args.script == "-" else open(args.script, encoding="utf-8")
+            commands = iter_script_commands(script)
+        else:
+            commands = iter_argv_commands(args.command)
+        summary = run_commands(system, commands, None if args.quiet else sys.stdout)
+        print(json.dumps({"summary": summary}, ensure_ascii=False))
+        return 1 if summary["failed"] else 0
+    finally:
+        if script is not None and script is not sys.stdin:
+            script.close()
+        system.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,394 @@
+"""Пакетный импорт и экспорт автомобилей, пользователей и аренд.
+
+Запуск:
+    python rental_io.py import cars fleet.csv
+    python rental_io.py import users users.jsonl
+    python rental_io.py import rentals history.jsonl --batch-size 10000
+    python rental_io.py export rentals rentals.csv
+
+Формат файла определяется расширением: .csv, .jsonl или .json (массив).
+Записи читаются потоково и обрабатываются пакетами: пакет проверяется
+целиком, получает id за один проход и сохраняется одной записью на диск.
+Открытые пароли хешируются при импорте (до блокировки хранилища, хеш
+вычисляется долго), уже хешированные (pbkdf2_sha256$...) сохраняются как есть.
+Активные аренды импорта не должны пересекаться друг с другом, а с уже
+сохраненными — начиная с сегодняшнего дня: прошлые периоды бронированию не
+мешают, и так оба хранилища (JSON и SQLite) проверяют импорт одинаково.
+"""
+import argparse
+import csv
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from car_rental import (CarRentalSystem, Car, CarSchedule, PasswordHasher, Rental, Storage, User,
+                        iter_json_array)
+
+FIELDS = {
+    "cars": ["id", "brand", "model", "year", "daily_price", "available"],
+    "users": ["username", "password", "role"],
+    "rentals": ["id", "car_id", "username", "start_date", "end_date", "total_price", "status"],
+}
+# Событие CarRentalSystem, которое получают подписчики о каждой импортированной записи
+EVENTS = {"cars": "car_added", "users": "user_registered", "rentals": "rental_added"}
+ROLES = ("customer", "admin")
+RENTAL_STATUSES = ("active", "cancelled", "completed")
+
+
+class ImportReport:
+    """Итог импорта: число загруженных записей и ошибки по номерам записей"""
+    def __init__(self, kind: str, max_errors: int = 100):
+        self.kind = kind
+        self.imported = 0
+        self.failed = 0
+        self.max_errors = max_errors
+        self.errors: List[Tuple[int, str]] = []
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": [{"line": line, "error": message} for line, message in self.errors],
+        }
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl", "json"):
+        raise ValueError(f"Неизвестный формат файла: {path}")
+    return fmt
+
+
+def iter_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Потоково читает записи из CSV, JSONL или JSON-массива"""
+    fmt = detect_format(path, fmt)
+    if fmt == "json":
+        yield from iter_json_array(path)
+        return
+
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_records(records: Iterable[Dict], path: str, kind: str, fmt: Optional[str] = None) -> int:
+    """Потоково записывает записи в файл, возвращает их количество"""
+    fmt = detect_format(path, fmt)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=FIELDS[kind])
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                count += 1
+        elif fmt == "jsonl":
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            f.write("[")
+            for record in records:
+                f.write(("," if count else "") + "\n" + json.dumps(record, ensure_ascii=False))
+                count += 1
+            f.write("\n]")
+    return count
+
+
+def _text(data: Dict, field: str) -> str:
+    value = data.get(field)
+    if value is None or str(value).strip() == "":
+        raise ValueError(f"не указано поле {field}")
+    return str(value).strip()
+
+
+def _int(data: Dict, field: str) -> int:
+    try:
+        return int(_text(data, field))
+    except ValueError as error:
+        if "не указано" in str(error):
+            raise
+        raise ValueError(f"поле {field} должно быть целым числом")
+
+
+def _float(data: Dict, field: str) -> float:
+    try:
+        return float(_text(data, field))
+    except ValueError as error:
+        if "не указано" in str(error):
+            raise
+        raise ValueError(f"поле {field} должно быть числом")
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "no", "нет")
+
+
+def _iso_date(data: Dict, field: str) -> str:
+    try:
+        return date.fromisoformat(_text(data, field)).isoformat()
+    except ValueError as error:
+        if "не указано" in str(error):
+            raise
+        raise ValueError(f"поле {field} должно быть датой ГГГГ-ММ-ДД")
+
+
+class _IdAllocator:
+    """Выдает id новым записям импорта, пропуская занятые"""
+    def __init__(self, exists):
+        self.exists = exists
+        self.taken: Set[int] = set()
+        self.next_id: Optional[int] = None
+
+    def claim(self, record_id: int):
+        if record_id in self.taken or self.exists(record_id):
+            raise ValueError(f"id {record_id} уже занят")
+        self.taken.add(record_id)
+
+    def allocate(self, reserve) -> int:
+        if self.next_id is None:
+            # Счетчик хранилища резервируется один раз на весь импорт
+            self.next_id = reserve()
+        while self.next_id in self.taken or self.exists(self.next_id):
+            self.next_id += 1
+        self.taken.add(self.next_id)
+        return self.next_id
+
+
+class Importer:
+    """Импорт записей пакетами в хранилище системы"""
+    def __init__(self, system: CarRentalSystem, batch_size: int = 5000):
+        self.system = system
+        self.storage: Storage = system.storage
+        self.batch_size = batch_size
+
+    def run(self, kind: str, records: Iterable[Dict]) -> ImportReport:
+        if kind not in FIELDS:
+            raise ValueError(f"Неизвестный тип записей: {kind}")
+        report = ImportReport(kind)
+        prepare = getattr(self, f"_prepare_{kind}")
+        save = getattr(self.storage, f"add_{kind}")
+        event = EVENTS[kind]
+        state = self._new_state(kind)
+
+        numbered = enumerate(records, start=1)
+        while True:
+            batch = list(islice(numbered, self.batch_size))
+            if not batch:
+                break
+            if kind == "users":
+                batch = self._hash_passwords(batch)
+            # Проверка и сохранение пакета — одна транзакция хранилища
+            with self._batch_transaction(kind, batch):
+                items = prepare(batch, report, state)
+                save(items)
+            # Подписчики системы (кеш запросов, цены, планировщик, лента изменений)
+            # узнают о каждой записи пакета так же, как при добавлении через систему
+            for item in items:
+                self.system._notify(event, item)
+            report.imported += len(items)
+        return report
+
+    @contextmanager
+    def _batch_transaction(self, kind: str, batch):
+        """Транзакция пакета; аренды — еще и под блокировками их автомобилей, как в rent_car"""
+        car_ids = set()
+        if kind == "rentals":
+            for _, data in batch:
+                try:
+                    car_ids.add(_int(data, "car_id"))
+                except ValueError:
+                    pass
+        with self.storage.cars_transaction(car_ids), self.storage.transaction():
+            yield
+
+    def _hash_passwords(self, batch):
+        """Заменяет открытые пароли пакета хешами; вызывается вне транзакции"""
+        hashed = []
+        for line, data in batch:
+            password = data.get("password")
+            if password not in (None, "") and not PasswordHasher.is_hashed(str(password)):
+                data = dict(data, password=self.system.hasher.hash(str(password)))
+            hashed.append((line, data))
+        return hashed
+
+    def _new_state(self, kind: str) -> Dict:
+        if kind == "cars":
+            return {"ids": _IdAllocator(lambda car_id: self.storage.get_car(car_id) is not None)}
+        if kind == "rentals":
+            return {
+                "ids": _IdAllocator(lambda rental_id: self.storage.get_rental(rental_id) is not None),
+                "schedules": {},
+            }
+        return {"usernames": set()}
+
+    def _prepare_cars(self, batch, report: ImportReport, state: Dict) -> List[Car]:
+        ids: _IdAllocator = state["ids"]
+        cars = []
+        for line, data in batch:
+            try:
+                car = Car(
+                    id=None,
+                    brand=_text(data, "brand"),
+                    model=_text(data, "model"),
+                    year=_int(data, "year"),
+                    daily_price=_float(data, "daily_price"),
+                    available=_bool(data.get("available", True)),
+                )
+                if car.daily_price <= 0:
+                    raise ValueError("daily_price должна быть больше нуля")
+                if data.get("id") not in (None, ""):
+                    car.id = _int(data, "id")
+                    ids.claim(car.id)
+            except ValueError as error:
+                report.error(line, str(error))
+                continue
+            cars.append(car)
+
+        # id новым автомобилям выдаются одним проходом по пакету
+        for car in cars:
+            if car.id is None:
+                car.id = ids.allocate(self.storage.next_car_id)
+        return cars
+
+    def _prepare_users(self, batch, report: ImportReport, state: Dict) -> List[User]:
+        usernames: Set[str] = state["usernames"]
+        users = []
+        for line, data in batch:
+            try:
+                username = _text(data, "username")
+                role = str(data.get("role") or "customer")
+                if role not in ROLES:
+                    raise ValueError(f"неизвестная роль {role}")
+                if username in usernames or self.storage.get_user(username) is not None:
+                    raise ValueError(f"пользователь {username} уже существует")
+                user = User(username, _text(data, "password"), role)
+            except ValueError as error:
+                report.error(line, str(error))
+                continue
+            usernames.add(username)
+            users.append(user)
+        return users
+
+    def _prepare_rentals(self, batch, report: ImportReport, state: Dict) -> List[Rental]:
+        ids: _IdAllocator = state["ids"]
+        schedules: Dict[int, CarSchedule] = state["schedules"]
+        today = date.today().isoformat()
+        rentals = []
+        for line, data in batch:
+            try:
+                car_id = _int(data, "car_id")
+                car = self.storage.get_car(car_id)
+                if car is None:
+                    raise ValueError(f"автомобиль {car_id} не найден")
+                username = _text(data, "username")
+                if self.storage.get_user(username) is None:
+                    raise ValueError(f"пользователь {username} не найден")
+                start_date = _iso_date(data, "start_date")
+                end_date = _iso_date(data, "end_date")
+                if end_date <= start_date:
+                    raise ValueError("дата окончания должна быть позже даты начала")
+                status = str(data.get("status") or "active")
+                if status not in RENTAL_STATUSES:
+                    raise ValueError(f"неизвестный статус {status}")
+                if data.get("total_price") not in (None, ""):
+                    total_price = _float(data, "total_price")
+                else:
+                    days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days
+                    total_price = days * car.daily_price
+
+                rental = Rental(None, car_id, username, start_date, end_date, total_price, status)
+                if status == "active":
+                    # Пересечения ищутся и с хранилищем, и внутри импорта
+                    schedule = schedules.setdefault(car_id, CarSchedule())
+                    start, end = date.fromisoformat(start_date).toordinal(), date.fromisoformat(end_date).toordinal()
+                    if not schedule.is_free(start, end) or (end_date >= today and not
+                            self.storage.is_car_free(car_id, max(start_date, today), end_date)):
+                        raise ValueError(f"аренда пересекается с другой арендой автомобиля {car_id}")
+                if data.get("id") not in (None, ""):
+                    rental.id = _int(data, "id")
+                    ids.claim(rental.id)
+            except ValueError as error:
+                report.error(line, str(error))
+                continue
+            if status == "active":
+                schedule.add(rental)
+            rentals.append(rental)
+
+        for rental in rentals:
+            if rental.id is None:
+                rental.id = ids.allocate(self.storage.next_rental_id)
+        return rentals
+
+
+def import_file(system: CarRentalSystem, kind: str, path: str, fmt: Optional[str] = None,
+                batch_size: int = 5000) -> ImportReport:
+    """Импортирует записи вида kind из файла"""
+    return Importer(system, batch_size).run(kind, iter_records(path, fmt))
+
+
+def iter_export(system: CarRentalSystem, kind: str) -> Iterator[Dict]:
+    """Потоково перебирает записи вида kind в формате to_dict"""
+    if kind == "cars":
+        return (car.to_dict() for car in system.storage.cars)
+    if kind == "users":
+        return (user.to_dict() for user in system.storage.users)
+    if kind == "rentals":
+        return (rental.to_dict() for rental, _ in system.storage.iter_rentals_with_cars())
+    raise ValueError(f"Неизвестный тип записей: {kind}")
+
+
+def export_file(system: CarRentalSystem, kind: str, path: str, fmt: Optional[str] = None) -> int:
+    """Экспортирует записи вида kind в файл, возвращает их количество"""
+    return write_records(iter_export(system, kind), path, kind, fmt)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт и экспорт данных системы проката")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--journal", action="store_true", help="режим журнала изменений")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="загрузить записи из файла")
+    import_parser.add_argument("kind", choices=sorted(FIELDS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=("csv", "jsonl", "json"))
+    import_parser.add_argument("--batch-size", type=int, default=5000)
+
+    export_parser = commands.add_parser("export", help="выгрузить записи в файл")
+    export_parser.add_argument("kind", choices=sorted(FIELDS))
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=("csv", "jsonl", "json"))
+
+    args = parser.parse_args(argv)
+    system = CarRentalSystem(data_dir=args.data_dir, storage=args.storage, journal=args.journal)
+    try:
+        if args.command == "import":
+            report = import_file(system, args.kind, args.path, args.format, args.batch_size)
+            print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+            return 1 if report.failed else 0
+        count = export_file(system, args.kind, args.path, args.format)
+        print(json.dumps({"kind": args.kind, "exported": count}, ensure_ascii=False))
+        return 0
+    finally:
+        system.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
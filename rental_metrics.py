@@ -0,0 +1,267 @@
+"""Легкая инструментация: гистограммы задержек, счетчики и профилирование.
+
+По умолчанию сбор выключен, и обертки стоят одной проверки флага. Включение:
+    RENTAL_METRICS=1                 — гистограммы и счетчики
+    RENTAL_PROFILE=cprofile          — профилировать каждый N-й вызов через cProfile
+    RENTAL_PROFILE=tracemalloc       — замерять пик выделенной памяти каждого N-го вызова
+    RENTAL_PROFILE_EVERY=100         — N (по умолчанию 100)
+    RENTAL_PROFILE_OUT=profile.out   — куда записать статистику cProfile при выходе
+
+Из кода: metrics.enable(), metrics.snapshot(), metrics.to_prometheus().
+Гистограммы в стиле HDR: границы корзин идут по степеням двойки с
+промежуточными делениями, поэтому относительная точность одинакова от
+микросекунд до минут при фиксированном числе корзин.
+"""
+import atexit
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def log_buckets(low: float, high: float, per_octave: int = 2) -> List[float]:
+    """Границы корзин от low до high: per_octave делений на каждое удвоение"""
+    bounds = []
+    octave = low
+    while octave < high:
+        for step in range(per_octave):
+            bounds.append(octave * (1 + step / per_octave))
+        octave *= 2
+    bounds.append(octave)
+    return bounds
+
+
+LATENCY_BUCKETS = log_buckets(1e-6, 120.0)
+BYTES_BUCKETS = log_buckets(64, float(1 << 34))
+RECORDS_BUCKETS = log_buckets(1, float(1 << 24))
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        # Последняя корзина — значения больше всех границ (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def _key(name: str, labels: Dict[str, str]) -> LabelKey:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Реестр счетчиков и гистограмм с метками"""
+    def __init__(self, enabled: bool = False, profile: Optional[str] = None,
+                 profile_every: int = 100):
+        if profile not in (None, "cprofile", "tracemalloc"):
+            raise ValueError(f"Неизвестный режим профилирования: {profile}")
+        self.enabled = enabled
+        self.profile = profile
+        self.profile_every = max(profile_every, 1)
+        self.counters: Dict[LabelKey, float] = {}
+        self.histograms: Dict[LabelKey, Histogram] = {}
+        self.profile_stats: Optional[pstats.Stats] = None
+        self._calls = 0
+        self._profiling = threading.local()
+        self._lock = threading.Lock()
+        if profile == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        profile = os.environ.get("RENTAL_PROFILE") or None
+        instance = cls(
+            enabled=os.environ.get("RENTAL_METRICS", "") not in ("", "0") or profile is not None,
+            profile=profile,
+            profile_every=int(os.environ.get("RENTAL_PROFILE_EVERY", 100)),
+        )
+        output = os.environ.get("RENTAL_PROFILE_OUT")
+        if profile == "cprofile" and output:
+            atexit.register(instance.dump_profile, output)
+        return instance
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.profile_stats = None
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Увеличивает счетчик name на value"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: List[float] = LATENCY_BUCKETS, **labels):
+        """Добавляет значение в гистограмму name"""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Замеряет время блока в гистограмму name (секунды)"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, operation: str):
+        """Декоратор: время вызовов в operation_seconds{operation=...} и их число"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return self._call(operation, func, args, kwargs)
+                finally:
+                    self.observe("operation_seconds", time.perf_counter() - started,
+                                 operation=operation)
+                    self.count("operation_calls_total", operation=operation)
+            return wrapper
+        return decorator
+
+    def _call(self, operation: str, func, args, kwargs):
+        """Вызывает func, профилируя каждый profile_every-й вызов"""
+        if self.profile is None or getattr(self._profiling, "active", False):
+            return func(*args, **kwargs)
+        with self._lock:
+            self._calls += 1
+            sampled = self._calls % self.profile_every == 0
+        if not sampled:
+            return func(*args, **kwargs)
+
+        # Вложенные замеряемые вызовы внутри профилируемого не профилируются повторно
+        self._profiling.active = True
+        try:
+            if self.profile == "cprofile":
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(func, *args, **kwargs)
+                finally:
+                    with self._lock:
+                        if self.profile_stats is None:
+                            self.profile_stats = pstats.Stats(profiler)
+                        else:
+                            self.profile_stats.add(profiler)
+            before = tracemalloc.get_traced_memory()[0]
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.observe("operation_alloc_peak_bytes", max(peak - before, 0),
+                             BYTES_BUCKETS, operation=operation)
+        finally:
+            self._profiling.active = False
+
+    def dump_profile(self, path: str):
+        """Записывает накопленную статистику cProfile (для pstats/snakeviz)"""
+        with self._lock:
+            if self.profile_stats is not None:
+                self.profile_stats.dump_stats(path)
+
+    def snapshot(self) -> Dict:
+        """Текущие значения: счетчики и сводки гистограмм"""
+        def name(key: LabelKey) -> str:
+            return key[0] + _format_labels(key[1])
+
+        with self._lock:
+            return {
+                "counters": {name(key): value for key, value in sorted(self.counters.items())},
+                "histograms": {
+                    name(key): histogram.snapshot()
+                    for key, histogram in sorted(self.histograms.items())
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "car_rental_") -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                    typed.add(name)
+                lines.append(f"{prefix}{name}{_format_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                # Prometheus ждет все корзины с накопленными счетами, включая пустые и +Inf
+                for bound, count in zip(histogram.bounds + [float("inf")], histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:.9g}"
+                    lines.append(f"{prefix}{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{prefix}{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса; настраивается переменными окружения
+metrics = Metrics.from_env()
@@ -0,0 +1,448 @@
+"""HTTP/JSON API системы проката на asyncio без сторонних зависимостей.
+
+Запуск:
+    python rental_server.py --port 8080
+    python rental_server.py --create-admin admin    # первый запуск: создать администратора
+
+Учетная запись администратора по умолчанию не создается: имя задается
+флагом --create-admin, пароль — переменной RENTAL_ADMIN_PASSWORD или
+вводится с клавиатуры.
+
+POST /login возвращает токен сессии. Токен запоминается для соединения:
+следующие запросы в том же keep-alive соединении выполняются от имени
+вошедшего пользователя. С других соединений токен передается заголовком
+Authorization: Bearer <токен>.
+
+Маршруты:
+    POST /register            {"username", "password"}
+    POST /login               {"username", "password"}
+    POST /logout
+    GET  /cars/available      ?start=ГГГГ-ММ-ДД&end=ГГГГ-ММ-ДД&brand=&max_price=&min_year=
+                              &sort=id|price|-price|year|-year&offset=0&limit=50
+                              (при заданных start и end у каждого автомобиля есть total_price)
+    GET  /quote               ?car_id=&start=ГГГГ-ММ-ДД&end=ГГГГ-ММ-ДД
+    GET  /rentals             аренды текущего пользователя
+    POST /rentals             {"car_id", "start_date", "end_date"}
+    POST /rentals/batch       {"bookings": [{"car_id", "start_date", "end_date"}, ...]}
+    POST /rentals/<id>/cancel
+    POST /admin/cars          {"brand", "model", "year", "daily_price"}
+    GET  /admin/rentals       ?offset=0&limit=50
+    GET  /metrics             метрики в текстовом формате Prometheus
+                              (собираются с флагом --metrics или RENTAL_METRICS=1)
+"""
+import argparse
+import asyncio
+import getpass
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from car_rental import CarRentalSystem, LifecycleScheduler
+from rental_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_LINES = 100
+MAX_BODY_SIZE = 1 << 20
+IDLE_TIMEOUT = 60
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+}
+
+
+class HttpError(Exception):
+    """Ошибка, которая возвращается клиенту как ответ с кодом status"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method: str, path: str, query: Dict[str, str],
+                 headers: Dict[str, str], body: bytes, version: str):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.version = version
+
+    def json(self) -> Dict:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HttpError(400, "Некорректный JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Ожидается JSON-объект")
+        return data
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+class Session:
+    """Состояние одного соединения"""
+    def __init__(self):
+        self.token: Optional[str] = None
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Читает один HTTP-запрос; None — клиент закрыл соединение"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Некорректная строка запроса")
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Слишком много заголовков")
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(501, "Chunked-запросы не поддерживаются")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Некорректный Content-Length")
+    if length < 0:
+        raise HttpError(400, "Некорректный Content-Length")
+    if length > MAX_BODY_SIZE:
+        raise HttpError(413, "Слишком большое тело запроса")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return Request(method.upper(), url.path, query, headers, body, version)
+
+
+def build_response(status: int, payload, keep_alive: bool) -> bytes:
+    # Строка отдается как есть текстом (формат экспозиции Prometheus), остальное — JSON
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        content_type = "application/json; charset=utf-8"
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+class RentalServer:
+    """Асинхронный HTTP-сервер поверх одного общего CarRentalSystem.
+
+    Операции с хранилищем — и записи, и чтения — выполняются в пуле потоков:
+    запись держит блокировку хранилища на время сохранения на диск, и
+    чтение, ожидающее ее в цикле событий, остановило бы обработку
+    остальных соединений.
+    """
+    def __init__(self, system: CarRentalSystem, workers: int = 4):
+        self.system = system
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.routes = {
+            ("POST", "register"): self.register,
+            ("POST", "login"): self.login,
+            ("POST", "logout"): self.logout,
+            ("GET", "cars/available"): self.available_cars,
+            ("GET", "quote"): self.quote,
+            ("GET", "rentals"): self.user_rentals,
+            ("POST", "rentals"): self.rent_car,
+            ("POST", "rentals/batch"): self.rent_cars_batch,
+            ("POST", "admin/cars"): self.add_car,
+            ("GET", "admin/rentals"): self.all_rentals,
+            ("GET", "metrics"): self.export_metrics,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080,
+                    backlog: int = 1024) -> Tuple[str, int]:
+        self.server = await asyncio.start_server(
+            self.handle_connection, host, port, backlog=backlog
+        )
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def _blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session()
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    status, payload = await self.dispatch(request, session)
+                except HttpError as error:
+                    status, payload = error.status, {"error": error.message}
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception:  # ошибка обработчика не должна ронять сервер
+                    # Текст исключения остается в логе сервера, клиенту — общее сообщение
+                    logger.exception("Ошибка обработки запроса")
+                    status, payload = 500, {"error": "Внутренняя ошибка сервера"}
+
+                writer.write(build_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request: Request, session: Session) -> Tuple[int, object]:
+        parts = [part for part in request.path.split("/") if part]
+        key = (request.method, "/".join(parts))
+        handler = self.routes.get(key)
+        if handler is not None:
+            return await handler(request, session)
+        if len(parts) == 3 and parts[0] == "rentals" and parts[2] == "cancel":
+            if request.method != "POST":
+                raise HttpError(405, "Метод не поддерживается")
+            return await self.cancel_rental(request, session, parts[1])
+        raise HttpError(404, "Маршрут не найден")
+
+    def _require_session(self, request: Request, session: Session, admin: bool = False) -> str:
+        """Токен сессии запроса; ошибка 401/403, если сессии нет или не хватает прав"""
+        authorization = request.headers.get("authorization", "")
+        token = authorization[7:] if authorization.startswith("Bearer ") else session.token
+        user = self.system.session_user(token) if token else None
+        if user is None:
+            raise HttpError(401, "Требуется вход в систему")
+        if admin and user.role != "admin":
+            raise HttpError(403, "Требуются права администратора")
+        return token
+
+    @staticmethod
+    def _fields(data: Dict, *names: str):
+        try:
+            return [data[name] for name in names]
+        except KeyError as error:
+            raise HttpError(400, f"Не указано поле {error.args[0]}")
+
+    async def register(self, request: Request, session: Session):
+        username, password = self._fields(request.json(), "username", "password")
+        if not await self._blocking(self.system.register_user, str(username), str(password)):
+            raise HttpError(409, "Пользователь с таким именем уже существует")
+        return 201, {"username": username}
+
+    async def login(self, request: Request, session: Session):
+        username, password = self._fields(request.json(), "username", "password")
+        # Проверка хеша пароля дорогая — выполняется в пуле потоков
+        token = await self._blocking(self.system.start_session, str(username), str(password))
+        if token is None:
+            raise HttpError(401, "Неверное имя пользователя или пароль")
+        session.token = token
+        user = self.system.session_user(token)
+        return 200, {"username": user.username, "role": user.role, "token": token}
+
+    async def logout(self, request: Request, session: Session):
+        token = self._require_session(request, session)
+        self.system.end_session(token)
+        if session.token == token:
+            session.token = None
+        return 200, {}
+
+    async def available_cars(self, request: Request, session: Session):
+        query = request.query
+        try:
+            max_price = float(query["max_price"]) if "max_price" in query else None
+            min_year = int(query["min_year"]) if "min_year" in query else None
+            offset = int(query.get("offset", 0))
+            limit = min(int(query.get("limit", 50)), 1000)
+            if offset < 0 or limit < 0:
+                raise ValueError("offset и limit не могут быть отрицательными")
+            cars = await self._blocking(
+                self.system.search_available,
+                query.get("start"), query.get("end"), query.get("brand"), max_price, min_year,
+                query.get("sort", "id"), limit, offset
+            )
+            prices = {}
+            if "start" in query and "end" in query:
+                prices = await self._blocking(self.system.quote_cars, cars, query["start"], query["end"])
+        except ValueError as error:
+            raise HttpError(400, str(error))
+        return 200, [
+            dict(car.to_dict(), total_price=prices[car.id]) if car.id in prices else car.to_dict()
+            for car in cars
+        ]
+
+    async def quote(self, request: Request, session: Session):
+        try:
+            car_id = int(request.query.get("car_id", ""))
+        except ValueError:
+            raise HttpError(400, "Некорректный car_id")
+        total_price = await self._blocking(
+            self.system.quote, car_id, request.query.get("start", ""), request.query.get("end", "")
+        )
+        if total_price is None:
+            raise HttpError(404, "Автомобиль не найден или даты указаны неверно")
+        return 200, {"car_id": car_id, "total_price": total_price}
+
+    async def user_rentals(self, request: Request, session: Session):
+        token = self._require_session(request, session)
+        rentals = await self._blocking(self.system.get_user_rentals, token)
+        return 200, [rental.to_dict() for rental in rentals]
+
+    async def rent_car(self, request: Request, session: Session):
+        token = self._require_session(request, session)
+        car_id, start_date, end_date = self._fields(request.json(), "car_id", "start_date", "end_date")
+        try:
+            car_id = int(car_id)
+        except (TypeError, ValueError):
+            raise HttpError(400, "Некорректный car_id")
+        total_price = await self._blocking(
+            self.system.rent_car, car_id, str(start_date), str(end_date), token
+        )
+        if total_price is None:
+            raise HttpError(409, "Автомобиль недоступен или даты указаны неверно")
+        return 201, {"total_price": total_price}
+
+    async def rent_cars_batch(self, request: Request, session: Session):
+        token = self._require_session(request, session)
+        bookings = request.json().get("bookings")
+        if not isinstance(bookings, list) or not all(isinstance(item, dict) for item in bookings):
+            raise HttpError(400, "Ожидается список bookings")
+        try:
+            bookings = [
+                (int(item["car_id"]), str(item["start_date"]), str(item["end_date"]))
+                for item in bookings
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise HttpError(400, "Каждая позиция должна содержать car_id, start_date и end_date")
+        results = await self._blocking(self.system.rent_cars_batch, bookings, token)
+        if any(result["error"] for result in results):
+            return 409, results
+        return 201, results
+
+    async def cancel_rental(self, request: Request, session: Session, rental_id: str):
+        token = self._require_session(request, session)
+        try:
+            rental_id = int(rental_id)
+        except ValueError:
+            raise HttpError(404, "Аренда не найдена")
+        if not await self._blocking(self.system.cancel_rental, rental_id, token):
+            raise HttpError(404, "Аренда не найдена")
+        return 200, {"id": rental_id, "status": "cancelled"}
+
+    async def add_car(self, request: Request, session: Session):
+        token = self._require_session(request, session, admin=True)
+        brand, model, year, daily_price = self._fields(
+            request.json(), "brand", "model", "year", "daily_price"
+        )
+        try:
+            year, daily_price = int(year), float(daily_price)
+        except (TypeError, ValueError):
+            raise HttpError(400, "Некорректный год или цена")
+        await self._blocking(self.system.add_car, str(brand), str(model), year, daily_price, token)
+        return 201, {}
+
+    async def all_rentals(self, request: Request, session: Session):
+        self._require_session(request, session, admin=True)
+        try:
+            offset = int(request.query.get("offset", 0))
+            limit = min(int(request.query.get("limit", 50)), 1000)
+        except ValueError:
+            raise HttpError(400, "Некорректные offset или limit")
+        if offset < 0 or limit < 0:
+            raise HttpError(400, "Некорректные offset или limit")
+        page = await self._blocking(self.system.get_rentals_page, offset, limit)
+        return 200, [
+            dict(rental.to_dict(), car=car.to_dict() if car else None)
+            for rental, car in page
+        ]
+
+    async def export_metrics(self, request: Request, session: Session):
+        return 200, metrics.to_prometheus()
+
+
+async def serve(system: CarRentalSystem, host: str, port: int):
+    server = RentalServer(system)
+    host, port = await server.start(host, port)
+    print(f"Сервер запущен на http://{host}:{port}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API системы проката автомобилей")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--journal", action="store_true", help="режим журнала изменений")
+    parser.add_argument("--metrics", action="store_true", help="собирать метрики для GET /metrics")
+    parser.add_argument("--create-admin", metavar="USERNAME",
+                        help="создать администратора, если его нет (пароль из RENTAL_ADMIN_PASSWORD "
+                             "или с клавиатуры)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.metrics:
+        metrics.enable()
+
+    system = CarRentalSystem(data_dir=args.data_dir, storage=args.storage, journal=args.journal)
+    if args.create_admin:
+        password = os.environ.get("RENTAL_ADMIN_PASSWORD") or getpass.getpass("Пароль администратора: ")
+        if not system.register_user(args.create_admin, password, "admin"):
+            print(f"Пользователь {args.create_admin} уже существует")
+    # Завершение и архивация аренд идут в фоне, пока работает сервер
+    scheduler = LifecycleScheduler(system)
+    scheduler.start()
+    try:
+        asyncio.run(serve(system, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+        system.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""Шардированный режим: парк и аренды разделены между процессами-шардами.
+
+    system = ShardedRentalSystem("data", shards=4)            # по хешу id
+    system = ShardedRentalSystem("data", branches=["Москва", "Казань"])  # по филиалам
+    token = system.start_session("admin", "admin123")
+    system.add_car("BMW", "X5", 2022, 5000, token, branch="Казань")
+
+Каждый шард — отдельный процесс multiprocessing со своим CarRentalSystem и
+своей папкой данных (data/shard-<номер>). Маршрутизатор в основном процессе
+хранит пользователей и сессии (data/accounts), отправляет аренду и отмену
+шарду-владельцу, а поиск свободных автомобилей рассылает всем шардам сразу
+и сливает отсортированные ответы.
+
+Номер шарда закодирован в id: глобальный id = локальный id * число шардов +
+номер шарда. Поэтому владелец автомобиля или аренды находится по остатку от
+деления без справочника, а число шардов после создания папки менять нельзя
+(оно записано в data/shards.json).
+
+Запросы к шарду передаются по каналу Pipe и возвращают Future; обработкой
+ответов занимается отдельный поток на каждый шард. Запросы к разным шардам
+выполняются параллельно, rent_cars отправляет шарду все свои брони одним
+сообщением. Надбавка за загрузку (PricingEngine) считается по парку шарда.
+"""
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from car_rental import Car, CarRentalSystem, Rental, Storage, User
+
+META_FILE = "shards.json"
+
+
+class _ShardWorker:
+    """Операции шарда; выполняются в процессе шарда от имени переданного пользователя"""
+    def __init__(self, system: CarRentalSystem):
+        self.system = system
+        # Последняя добавленная запись: по ней шард сообщает id нового автомобиля или аренды
+        self.added = None
+        system.add_listener(self)
+
+    def car_added(self, car: Car):
+        self.added = car
+
+    def rental_added(self, rental: Rental):
+        self.added = rental
+
+    def _act_as(self, user: Tuple[str, str]):
+        username, role = user
+        self.system.current_user = User(username, "", role)
+
+    def add_car(self, user, brand: str, model: str, year: int, daily_price: float) -> Optional[Car]:
+        self._act_as(user)
+        self.added = None
+        return self.added if self.system.add_car(brand, model, year, daily_price) else None
+
+    def rent_car(self, user, car_id: int, start_date: str, end_date: str) -> Optional[Tuple[int, float]]:
+        self._act_as(user)
+        total_price = self.system.rent_car(car_id, start_date, end_date)
+        return None if total_price is None else (self.added.id, total_price)
+
+    def cancel_rental(self, user, rental_id: int) -> bool:
+        self._act_as(user)
+        return self.system.cancel_rental(rental_id)
+
+    def user_rentals(self, user) -> List[Rental]:
+        self._act_as(user)
+        return self.system.get_user_rentals()
+
+    def get_available_cars(self, start_date: Optional[str], end_date: Optional[str]) -> List[Car]:
+        return self.system.get_available_cars(start_date, end_date)
+
+    def search_available(self, *args) -> List[Car]:
+        return self.system.search_available(*args)
+
+    def quote(self, car_id: int, start_date: str, end_date: str) -> Optional[float]:
+        return self.system.quote(car_id, start_date, end_date)
+
+
+def _serve_shard(conn, data_dir: str, options: Dict):
+    """Цикл процесса шарда: сообщение — список вызовов, ответ — список (успех, значение)"""
+    try:
+        system = CarRentalSystem(data_dir=data_dir, **options)
+    except Exception as error:
+        conn.send(error)
+        return
+    worker = _ShardWorker(system)
+    conn.send(None)
+    try:
+        while True:
+            try:
+                calls = conn.recv()
+            except EOFError:
+                break
+            if calls is None:
+                break
+            results = []
+            for method, args in calls:
+                try:
+                    results.append((True, getattr(worker, method)(*args)))
+                except Exception as error:
+                    results.append((False, error))
+            conn.send(results)
+    finally:
+        system.close()
+        conn.close()
+
+
+class _ShardClient:
+    """Канал маршрутизатора к процессу шарда"""
+    def __init__(self, index: int, data_dir: str, options: Dict, context):
+        self.index = index
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_shard, args=(child, data_dir, options),
+            name=f"rental-shard-{index}", daemon=True
+        )
+        self.process.start()
+        child.close()
+        # Шард отвечает строго по порядку запросов: ответ — первому ожидающему
+        self.pending: deque = deque()
+        self.lock = threading.Lock()
+        self.reader: Optional[threading.Thread] = None
+
+    def wait_ready(self):
+        error = self.conn.recv()
+        if error is not None:
+            raise error
+        self.reader = threading.Thread(target=self._read, name=f"rental-shard-{self.index}-reader",
+                                       daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            try:
+                results = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            self.pending.popleft().set_result(results)
+        while self.pending:
+            self.pending.popleft().set_exception(RuntimeError(f"Шард {self.index} остановлен"))
+
+    def submit(self, calls: List[Tuple[str, tuple]]) -> Future:
+        """Отправляет вызовы одним сообщением; Future вернет список (успех, значение)"""
+        future = Future()
+        with self.lock:
+            self.pending.append(future)
+            self.conn.send(calls)
+        return future
+
+    def stop(self, timeout: float = 10):
+        with self.lock:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        if self.reader is not None:
+            self.reader.join(timeout)
+
+
+def _unwrap(result: Tuple[bool, object]):
+    ok, value = result
+    if not ok:
+        raise value
+    return value
+
+
+class ShardedRentalSystem:
+    """Маршрутизатор поверх процессов-шардов с интерфейсом сессий CarRentalSystem"""
+    def __init__(self, data_dir: str = "data", shards: Optional[int] = None,
+                 branches: Optional[Sequence[str]] = None, password_iterations: int = 200000,
+                 **options):
+        if branches is not None:
+            shards = len(branches)
+        shards = shards or os.cpu_count() or 1
+        self.data_dir = data_dir
+        self.branches = list(branches) if branches is not None else None
+        self._check_meta(shards)
+        self.shard_count = shards
+        self._next_shard = 0
+        self._lock = threading.Lock()
+
+        # Процессы шардов стартуют параллельно, затем дожидаемся загрузки каждого
+        context = multiprocessing.get_context()
+        self.shards = [
+            _ShardClient(index, os.path.join(data_dir, f"shard-{index}"), options, context)
+            for index in range(shards)
+        ]
+        try:
+            for shard in self.shards:
+                shard.wait_ready()
+        except BaseException:
+            self.close()
+            raise
+        # Пользователи и сессии общие для всех шардов и живут в маршрутизаторе
+        self.accounts = CarRentalSystem(
+            data_dir=os.path.join(data_dir, "accounts"),
+            password_iterations=password_iterations,
+            **{key: options[key] for key in ("storage", "journal") if key in options}
+        )
+
+    def _check_meta(self, shards: int):
+        """Проверяет, что папка создана с тем же числом шардов, или записывает его"""
+        path = os.path.join(self.data_dir, META_FILE)
+        meta = {"shards": shards, "branches": self.branches}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                saved = json.load(f)
+            if saved != meta:
+                raise ValueError(f"Папка данных создана для другого разбиения: {saved}")
+            return
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        for shard in self.shards:
+            shard.stop()
+        if getattr(self, "accounts", None) is not None:
+            self.accounts.close()
+
+    # Глобальный id <-> (шард, локальный id)
+
+    def _locate(self, global_id: int) -> Tuple["_ShardClient", int]:
+        return self.shards[global_id % self.shard_count], global_id // self.shard_count
+
+    def _global_id(self, shard: "_ShardClient", local_id: int) -> int:
+        return local_id * self.shard_count + shard.index
+
+    def _globalize_car(self, shard: "_ShardClient", car: Car) -> Car:
+        car.id = self._global_id(shard, car.id)
+        return car
+
+    def _globalize_rental(self, shard: "_ShardClient", rental: Rental) -> Rental:
+        rental.id = self._global_id(shard, rental.id)
+        rental.car_id = self._global_id(shard, rental.car_id)
+        return rental
+
+    def _call(self, shard: "_ShardClient", method: str, *args):
+        return _unwrap(shard.submit([(method, args)]).result()[0])
+
+    def _fan_out(self, method: str, *args) -> List[Tuple["_ShardClient", object]]:
+        """Вызывает метод на всех шардах параллельно"""
+        futures = [(shard, shard.submit([(method, args)])) for shard in self.shards]
+        return [(shard, _unwrap(future.result()[0])) for shard, future in futures]
+
+    # Пользователи и сессии
+
+    def register_user(self, username: str, password: str, role: str = "customer") -> bool:
+        return self.accounts.register_user(username, password, role)
+
+    def start_session(self, username: str, password: str) -> Optional[str]:
+        return self.accounts.start_session(username, password)
+
+    def end_session(self, session: str):
+        self.accounts.end_session(session)
+
+    def _user(self, session: str) -> Optional[Tuple[str, str]]:
+        user = self.accounts.session_user(session)
+        return None if user is None else (user.username, user.role)
+
+    # Операции
+
+    def add_car(self, brand: str, model: str, year: int, daily_price: float, session: str,
+                branch: Optional[str] = None) -> Optional[int]:
+        """Добавляет автомобиль в филиал branch (или в очередной шард), возвращает его id"""
+        user = self._user(session)
+        if user is None or user[1] != "admin":
+            return None
+        if self.branches is not None:
+            if branch not in self.branches:
+                raise ValueError(f"Неизвестный филиал: {branch}")
+            shard = self.shards[self.branches.index(branch)]
+        else:
+            with self._lock:
+                shard = self.shards[self._next_shard]
+                self._next_shard = (self._next_shard + 1) % self.shard_count
+        car = self._call(shard, "add_car", user, brand, model, year, daily_price)
+        return None if car is None else self._global_id(shard, car.id)
+
+    def branch_of(self, car_id: int) -> Optional[str]:
+        """Филиал автомобиля (при разбиении по филиалам)"""
+        return None if self.branches is None else self.branches[car_id % self.shard_count]
+
+    def quote(self, car_id: int, start_date: str, end_date: str) -> Optional[float]:
+        shard, local_id = self._locate(car_id)
+        return self._call(shard, "quote", local_id, start_date, end_date)
+
+    def rent_car(self, car_id: int, start_date: str, end_date: str, session: str) -> Optional[float]:
+        return self.rent_cars([(car_id, start_date, end_date)], session)[0]
+
+    def rent_cars(self, bookings: List[Tuple[int, str, str]], session: str) -> List[Optional[float]]:
+        """Независимые брони (не «все или ничего»): стоимость каждой или None.
+
+        Брони группируются по шардам, каждый шард получает свои одним
+        сообщением, и шарды обрабатывают их одновременно.
+        """
+        user = self._user(session)
+        if user is None:
+            return [None] * len(bookings)
+        groups: Dict[int, List[int]] = {}
+        for position, (car_id, _, _) in enumerate(bookings):
+            groups.setdefault(car_id % self.shard_count, []).append(position)
+        futures = []
+        for index, positions in groups.items():
+            calls = [
+                ("rent_car", (user, bookings[p][0] // self.shard_count, bookings[p][1], bookings[p][2]))
+                for p in positions
+            ]
+            futures.append((positions, self.shards[index].submit(calls)))
+
+        prices: List[Optional[float]] = [None] * len(bookings)
+        for positions, future in futures:
+            for position, result in zip(positions, future.result()):
+                booked = _unwrap(result)
+                prices[position] = None if booked is None else booked[1]
+        return prices
+
+    def cancel_rental(self, rental_id: int, session: str) -> bool:
+        user = self._user(session)
+        if user is None:
+            return False
+        shard, local_id = self._locate(rental_id)
+        return self._call(shard, "cancel_rental", user, local_id)
+
+    def get_user_rentals(self, session: str) -> List[Rental]:
+        user = self._user(session)
+        if user is None:
+            return []
+        rentals = [
+            self._globalize_rental(shard, rental)
+            for shard, page in self._fan_out("user_rentals", user) for rental in page
+        ]
+        rentals.sort(key=lambda rental: (rental.start_date, rental.id))
+        return rentals
+
+    def get_available_cars(self, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) -> List[Car]:
+        pages = [
+            [self._globalize_car(shard, car) for car in page]
+            for shard, page in self._fan_out("get_available_cars", start_date, end_date)
+        ]
+        return list(heapq.merge(*pages, key=lambda car: car.id))
+
+    def search_available(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                         brand: Optional[str] = None, max_price: Optional[float] = None,
+                         min_year: Optional[int] = None, sort: str = "id",
+                         limit: int = 50, offset: int = 0) -> List[Car]:
+        """Страница поиска: каждый шард отдает первые offset + limit, ответы сливаются"""
+        if sort.lstrip("-") not in Storage.SEARCH_SORTS:
+            raise ValueError(f"Неизвестный порядок сортировки: {sort}")
+        if limit < 0 or offset < 0:
+            raise ValueError("limit и offset не могут быть отрицательными")
+        field, reverse = Storage.SEARCH_SORTS[sort.lstrip("-")], sort.startswith("-")
+        pages = [
+            [self._globalize_car(shard, car) for car in page]
+            for shard, page in self._fan_out("search_available", start_date, end_date, brand,
+                                             max_price, min_year, sort, offset + limit, 0)
+        ]
+        # Внутри шарда порядок локальных id совпадает с порядком глобальных
+        merged = heapq.merge(*pages, key=lambda car: (getattr(car, field), car.id), reverse=reverse)
+        return list(merged)[offset:offset + limit]
@@ -0,0 +1,76 @@
+"""Перевод снимков автомобилей и аренд между JSON и двоичным форматом.
+
+Запуск:
+    python rental_snapshot.py to-binary data     # cars.json, rentals.json -> cars.bin, rentals.bin
+    python rental_snapshot.py to-json data       # обратно
+    python rental_snapshot.py info data/rentals.bin
+
+После перевода систему запускают с CarRentalSystem(snapshot="binary").
+Журнал и users.json формат не меняют и переводить их не нужно; если в
+папке есть журнал, его стоит сначала свернуть (CarRentalSystem.compact()),
+иначе он будет применен к новому снимку при следующем запуске.
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional
+
+from car_rental import Car, Rental, SnapshotFile, iter_json_array
+from rental_io import write_records
+
+KINDS = ("cars", "rentals")
+
+
+def to_binary(data_dir: str) -> Dict[str, int]:
+    """Переводит JSON-снимки папки в двоичные, возвращает размеры файлов"""
+    sizes = {}
+    for kind in KINDS:
+        factory = Car.from_dict if kind == "cars" else Rental.from_dict
+        records = (factory(data) for data in iter_json_array(os.path.join(data_dir, kind + ".json")))
+        sizes[kind] = SnapshotFile.write(os.path.join(data_dir, kind + ".bin"), kind, records)
+    return sizes
+
+
+def to_json(data_dir: str) -> Dict[str, int]:
+    """Переводит двоичные снимки папки в JSON, возвращает число записей"""
+    counts = {}
+    for kind in KINDS:
+        path = os.path.join(data_dir, kind + ".json")
+        with SnapshotFile(os.path.join(data_dir, kind + ".bin"), kind) as snapshot:
+            counts[kind] = write_records((item.to_dict() for item in snapshot), path + ".tmp",
+                                         kind, "json")
+        os.replace(path + ".tmp", path)
+    return counts
+
+
+def info(path: str) -> Dict:
+    """Заголовок двоичного снимка: вид записей, их число и размер таблицы строк"""
+    for kind in KINDS:
+        try:
+            snapshot = SnapshotFile(path, kind)
+        except ValueError:
+            continue
+        with snapshot:
+            return {"kind": kind, "records": len(snapshot), "record_size": snapshot.record.size,
+                    "strings": len(snapshot.strings), "bytes": os.path.getsize(path)}
+    raise ValueError(f"{path}: не двоичный снимок")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Перевод снимков между JSON и двоичным форматом")
+    parser.add_argument("command", choices=("to-binary", "to-json", "info"))
+    parser.add_argument("path", help="папка данных (для info — файл .bin)")
+    args = parser.parse_args(argv)
+
+    if args.command == "to-binary":
+        result = to_binary(args.path)
+    elif args.command == "to-json":
+        result = to_json(args.path)
+    else:
+        result = info(args.path)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
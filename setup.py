@@ -4,7 +4,7 @@ setup(
     name='car_rental',
     version='0.1.0',
     packages=find_packages(),  # если ты используешь структуру с подкаталогами
-    py_modules=['car_rental'],  # если car_rental.py лежит отдельно
+    py_modules=['car_rental', 'rental_server', 'rental_io', 'rental_analytics', 'rental_metrics', 'rental_cli', 'rental_snapshot', 'rental_shards', 'rental_changes'],  # если car_rental.py лежит отдельно
     author='Твоё имя',
     description='Система проката автомобилей на Python',
     install_requires=[],  # можно указать зависимости
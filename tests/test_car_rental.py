@@ -2,30 +2,20 @@
 import os
 import shutil
 import pytest
-from car_rental import CarRentalSystem, User
+import json
+from datetime import date, timedelta
+from car_rental import (CarRentalSystem, OccupancyCalendar, Rental, RentalTable, SessionStore,
+                        SnapshotFile, User, iter_json_array)
+from rental_snapshot import to_binary, to_json
 
 @pytest.fixture
-def test_system():
-    # Подготовка: создаем отдельную папку data для теста
-    test_data_dir = "test_data"
-    if os.path.exists(test_data_dir):
-        shutil.rmtree(test_data_dir)
-    os.makedirs(test_data_dir)
-
-    # Создаем копию системы с переопределением путей к данным
-    system = CarRentalSystem()
-    system.data_dir = test_data_dir
-    system.cars_file = os.path.join(test_data_dir, "cars.json")
-    system.rentals_file = os.path.join(test_data_dir, "rentals.json")
-    system.users_file = os.path.join(test_data_dir, "users.json")
-
-    system._initialize_data()
-    system._load_data()
+def test_system(tmp_path):
+    # Изолированная папка данных для каждого теста, вне рабочей папки data
+    system = CarRentalSystem(data_dir=str(tmp_path))
 
     yield system
 
-    # Очистка после теста
-    shutil.rmtree(test_data_dir)
+    system.close()
 
 def test_user_registration_and_login(test_system):
     assert test_system.register_user("testuser", "testpass") == True
@@ -55,3 +45,237 @@ def test_get_available_cars(test_system):
     cars = test_system.get_available_cars()
     assert len(cars) == 1
     assert cars[0].model == "Civic"
+
+def test_journal_mode_replays_changes(tmp_path):
+    data_dir = str(tmp_path)
+    system = CarRentalSystem(data_dir=data_dir, journal=True)
+    system.users.append(User("admin", "admin123", "admin"))
+    system._save_users()
+    system.login("admin", "admin123")
+    system.add_car("Toyota", "Camry", 2020, 3000)
+    assert system.register_user("testuser", "testpass") == True
+    system.close()
+
+    # Снимок не перезаписывался, изменения лежат в журнале
+    with open(system.cars_file) as f:
+        assert f.read().strip() == "[]"
+
+    restored = CarRentalSystem(data_dir=data_dir, journal=True)
+    assert [car.model for car in restored.cars] == ["Camry"]
+    assert restored.login("testuser", "testpass") == True
+
+    # Компактификация переносит журнал в снимок
+    restored.compact()
+    assert not os.path.exists(restored.journal_file)
+    assert len(CarRentalSystem(data_dir=data_dir).cars) == 1
+
+def test_journal_torn_tail_is_truncated(tmp_path):
+    data_dir = str(tmp_path)
+    system = CarRentalSystem(data_dir=data_dir, journal=True, password_iterations=1000)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Toyota", "Camry", 2020, 3000)
+    system.close()
+    # Сбой посреди записи оставил половину строки
+    with open(system.journal_file, "a") as f:
+        f.write('{"op": "add_car", "data": {"id": 2, "br')
+
+    restored = CarRentalSystem(data_dir=data_dir, journal=True, password_iterations=1000)
+    restored.login("admin", "admin123")
+    start = date.today() + timedelta(days=1)
+    assert restored.rent_car(1, start.isoformat(), (start + timedelta(days=1)).isoformat()) == 3000
+    restored.close()
+    # Запись после оборванной строки не потерялась
+    reopened = CarRentalSystem(data_dir=data_dir, journal=True, password_iterations=1000)
+    assert [car.id for car in reopened.cars] == [1] and len(reopened.rentals) == 1
+    reopened.close()
+
+    # Поврежденная строка в середине журнала — ошибка, а не молчаливая потеря хвоста
+    with open(system.journal_file) as f:
+        lines = f.readlines()
+    with open(system.journal_file, "w") as f:
+        f.writelines([lines[0], "{broken\n"] + lines[1:])
+    with pytest.raises(ValueError, match="Поврежденная запись журнала"):
+        CarRentalSystem(data_dir=data_dir, journal=True, password_iterations=1000)
+
+def test_indexes_follow_changes(test_system):
+    # Запись, добавленная в список напрямую, попадает в индекс при сохранении
+    test_system.users.append(User("admin", "admin123", "admin"))
+    test_system._save_users()
+    assert test_system.login("admin", "admin123") == True
+
+    for model in ("Polo", "Golf", "Passat"):
+        test_system.add_car("Volkswagen", model, 2020, 2000)
+    assert [car.id for car in test_system.cars] == [1, 2, 3]
+    assert test_system.storage.get_car(2).model == "Golf"
+    assert test_system.storage.get_car(4) is None
+    assert test_system.register_user("admin", "other") == False
+
+def test_iter_json_array_reads_across_chunks(tmp_path):
+    path = str(tmp_path / "items.json")
+    items = [{"id": n, "brand": "Марка, [n]"} for n in range(20)]
+    with open(path, "w") as f:
+        json.dump(items, f, indent=2)
+
+    assert list(iter_json_array(path, chunk_size=7)) == items
+
+def test_lazy_rentals_loaded_on_first_access(tmp_path):
+    data_dir = str(tmp_path)
+    system = CarRentalSystem(data_dir=data_dir)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Toyota", "Camry", 2020, 3000)
+    system.rent_car(1, "2999-01-01", "2999-01-03")
+
+    lazy = CarRentalSystem(data_dir=data_dir, lazy_rentals=True)
+    assert lazy.storage._rentals_loaded == False
+    assert lazy.login("admin", "admin123") == True
+    assert lazy.is_car_free(1, "2999-01-02", "2999-01-02") == False
+    assert len(lazy.get_user_rentals()) == 1
+
+def test_rental_table_round_trip():
+    rentals = [
+        Rental(1, 10, "ivan", "2024-01-01", "2024-01-05", 12000.0),
+        Rental(2, 11, "petr", "2024-01-03", "2024-01-04", 2500.5, "cancelled"),
+        Rental(3, 11, "ivan", "2024-02-01", "2024-02-03", 5000.0),
+    ]
+    table = RentalTable.from_rentals(rentals)
+    table.append_dict(Rental(4, 12, "anna", "2024-01-02", "2024-01-02", 0.0).to_dict())
+
+    assert len(table) == 4
+    assert table.usernames == ["ivan", "petr", "anna"]
+    assert list(table.to_dicts())[:3] == [rental.to_dict() for rental in rentals]
+    assert table[3].username == "anna"
+    assert table.busy_car_ids("2024-01-02", "2024-01-03") == {10, 12}
+
+def test_session_store_ttl_and_capacity():
+    now = [0.0]
+    store = SessionStore(ttl=10, max_sessions=2, clock=lambda: now[0])
+    first = store.create(User("a", "x"))
+    second = store.create(User("b", "x"))
+
+    now[0] = 5
+    assert store.get(first).username == "a"  # продлевает сессию до 15
+    third = store.create(User("c", "x"))     # вытесняет давно не использованную
+    assert store.get(second) is None
+    now[0] = 14
+    assert store.get(first).username == "a"
+    now[0] = 30
+    assert store.get(third) is None
+    assert len(store) == 0
+
+def test_sessions_share_one_system(test_system):
+    test_system.register_user("admin", "admin123", "admin")
+    test_system.register_user("ivan", "1")
+    test_system.register_user("petr", "2")
+    admin = test_system.start_session("admin", "admin123")
+    ivan = test_system.start_session("ivan", "1")
+    petr = test_system.start_session("petr", "2")
+    assert test_system.start_session("petr", "wrong") is None
+
+    assert test_system.add_car("Kia", "Rio", 2019, 2000, session=ivan) == False
+    assert test_system.add_car("Kia", "Rio", 2019, 2000, session=admin) == True
+    assert test_system.rent_car(1, "2999-01-01", "2999-01-02", session=ivan) == 2000
+    assert test_system.get_user_rentals(petr) == []
+    assert test_system.cancel_rental(1, session=petr) == False
+    assert test_system.cancel_rental(1, session=ivan) == True
+
+    test_system.end_session(ivan)
+    assert test_system.get_user_rentals(ivan) == []
+    assert test_system.current_user is None
+
+def test_plaintext_password_migrated_on_login(test_system):
+    test_system.users.append(User("old", "secret"))
+    test_system._save_users()
+
+    assert test_system.login("old", "wrong") == False
+    assert test_system.login("old", "secret") == True
+    stored = test_system.storage.get_user("old").password
+    assert stored.startswith("pbkdf2_sha256$")
+
+    test_system._load_data()
+    assert test_system.storage.get_user("old").password == stored
+    assert test_system.login("old", "secret") == True
+
+    test_system.register_user("new", "pass")
+    assert test_system.storage.get_user("new").password != "pass"
+    assert test_system.login("new", "pass") == True
+
+def test_occupancy_calendar_bitmaps():
+    calendar = OccupancyCalendar(horizon=10, origin=date(2030, 1, 1).toordinal())
+    calendar.add_car(1)
+    calendar.add_car(2)
+    rental = Rental(1, 1, "u", "2030-01-03", "2030-01-05", 0)
+    calendar.add(rental)
+    calendar.add(Rental(2, 1, "u", "2030-01-08", "2030-01-20", 0))  # обрезается горизонтом
+
+    assert not calendar.is_free(1, "2030-01-05", "2030-01-06")
+    assert calendar.free_cars("2030-01-04", "2030-01-04") == [2]
+    assert calendar.free_days(1) == ["2030-01-01", "2030-01-02", "2030-01-06", "2030-01-07"]
+    assert calendar.first_free_window(1, 2) == "2030-01-01"
+    assert calendar.first_free_window(1, 3) is None
+    assert calendar.utilization()[2] == ("2030-01-03", 0.5)
+
+    calendar.remove(rental)
+    assert calendar.first_free_window(1, 7) == "2030-01-01"
+    assert calendar.utilization()[2][1] == 0.0
+
+def test_query_cache_invalidation(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = (date.today() + timedelta(days=1)).isoformat()
+    end = (date.today() + timedelta(days=2)).isoformat()
+
+    assert len(system.get_available_cars(start, end)) == 1
+    assert len(system.get_available_cars(start, end)) == 1
+    assert system.query_cache.stats()["hits"] == 1
+
+    # Аренда меняет поколение — следующий запрос считается заново
+    system.rent_car(1, start, end)
+    assert system.get_available_cars(start, end) == []
+    assert len(system.get_user_rentals()) == 1
+    stats = system.query_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+    # Смена дня очищает кеш
+    system.query_cache.clock = lambda: date.today() + timedelta(days=1)
+    system.get_available_cars(start, end)
+    assert system.query_cache.stats()["misses"] == 4
+    system.close()
+
+def test_binary_snapshot_round_trip(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Škoda", "Octavia", 2021, 3000.5)
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    system.rent_car(2, start.isoformat(), (start + timedelta(days=3)).isoformat())
+    system.cancel_rental(1)
+    system.rent_car(2, start.isoformat(), (start + timedelta(days=1)).isoformat())
+    expected = [rental.to_dict() for rental in system.rentals]
+    system.close()
+
+    assert set(to_binary(str(tmp_path))) == {"cars", "rentals"}
+    with SnapshotFile(str(tmp_path / "rentals.bin"), "rentals") as snapshot:
+        assert len(snapshot) == 2
+        assert snapshot[1].to_dict() == expected[1]
+        assert [rental.to_dict() for rental in snapshot] == expected
+    with pytest.raises(ValueError):
+        SnapshotFile(str(tmp_path / "rentals.bin"), "cars")
+
+    binary = CarRentalSystem(data_dir=str(tmp_path), snapshot="binary")
+    assert [car.brand for car in binary.cars] == ["Škoda", "Kia"]
+    binary.login("admin", "admin123")
+    assert binary.rent_car(2, start.isoformat(), (start + timedelta(days=1)).isoformat()) is None
+    assert binary.add_car("BMW", "X5", 2022, 5000)
+    binary.close()
+
+    os.remove(tmp_path / "cars.json")
+    assert to_json(str(tmp_path)) == {"cars": 3, "rentals": 2}
+    restored = CarRentalSystem(data_dir=str(tmp_path))
+    assert [car.model for car in restored.cars] == ["Octavia", "Rio", "X5"]
+    assert [rental.to_dict() for rental in restored.rentals] == expected
+    restored.close()
@@ -1,29 +1,15 @@
-import os
-import shutil
 import pytest
-from car_rental import CarRentalSystem, User
+from car_rental import CarRentalSystem, LifecycleScheduler, PricingEngine, User
 from datetime import date, timedelta
 
 @pytest.fixture
-def system():
-    # Создание изолированной тестовой среды
-    test_data_dir = "test_data"
-    if os.path.exists(test_data_dir):
-        shutil.rmtree(test_data_dir)
-    os.makedirs(test_data_dir)
-
-    system = CarRentalSystem()
-    system.data_dir = test_data_dir
-    system.cars_file = os.path.join(test_data_dir, "cars.json")
-    system.rentals_file = os.path.join(test_data_dir, "rentals.json")
-    system.users_file = os.path.join(test_data_dir, "users.json")
-
-    system._initialize_data()
-    system._load_data()
+def system(tmp_path):
+    # Изолированная папка данных для каждого теста, вне рабочей папки data
+    system = CarRentalSystem(data_dir=str(tmp_path))
 
     yield system
 
-    shutil.rmtree(test_data_dir)
+    system.close()
 
 def test_full_rental_flow(system):
     # Регистрация пользователя
@@ -65,3 +51,364 @@ def test_full_rental_flow(system):
     # Проверка, что статус стал "cancelled"
     rentals = system.get_user_rentals()
     assert rentals[0].status == "cancelled"
+
+def test_booking_in_future_gap(system):
+    admin = User("admin", "admin123", "admin")
+    system.users.append(admin)
+    system._save_users()
+    system.login("admin", "admin123")
+    system.add_car("Audi", "A4", 2021, 4000)
+    car_id = system.cars[0].id
+
+    today = date.today()
+    day = lambda n: (today + timedelta(days=n)).isoformat()
+
+    # Аренда на будущие даты не блокирует автомобиль на сегодня
+    assert system.rent_car(car_id, day(5), day(8)) == 3 * 4000
+    assert len(system.get_available_cars()) == 1
+
+    # Пересекающийся период отклоняется, свободные промежутки доступны
+    assert system.rent_car(car_id, day(7), day(10)) is None
+    assert system.rent_car(car_id, day(1), day(4)) == 3 * 4000
+    assert system.rent_car(car_id, day(9), day(12)) == 3 * 4000
+    assert system.get_available_cars(day(4), day(5)) == []
+
+    # После отмены период снова свободен
+    rental_id = system.get_user_rentals()[0].id
+    assert system.cancel_rental(rental_id) == True
+    assert system.rent_car(car_id, day(6), day(7)) == 4000
+
+def test_sqlite_storage_flow(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage="sqlite")
+    assert system.register_user("admin", "admin123", "admin") == True
+    assert system.register_user("admin", "other") == False
+    assert system.register_user("user1", "pass1") == True
+    system.login("admin", "admin123")
+    assert system.add_car("Kia", "Rio", 2019, 2000) == True
+    assert system.add_car("Lada", "Vesta", 2021, 1500) == True
+
+    system.login("user1", "pass1")
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=2)
+    assert system.rent_car(1, start.isoformat(), end.isoformat()) == 2 * 2000
+    assert system.rent_car(1, start.isoformat(), end.isoformat()) is None
+    assert [car.id for car in system.get_available_cars(start.isoformat(), end.isoformat())] == [2]
+    system.close()
+
+    # Данные читаются из базы запросами после перезапуска
+    restored = CarRentalSystem(data_dir=str(tmp_path), storage="sqlite")
+    assert restored.login("user1", "pass1") == True
+    rentals = restored.get_user_rentals()
+    assert [rental.car_id for rental in rentals] == [1]
+    assert restored.cancel_rental(rentals[0].id) == True
+    assert len(restored.get_available_cars(start.isoformat(), end.isoformat())) == 2
+    restored.close()
+
+def test_rentals_report_joins_cars(system):
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Skoda", "Octavia", 2020, 2500)
+    car_id = system.cars[0].id
+
+    start = date.today() + timedelta(days=1)
+    for n in range(3):
+        begin = start + timedelta(days=3 * n)
+        system.rent_car(car_id, begin.isoformat(), (begin + timedelta(days=1)).isoformat())
+
+    page = system.get_rentals_page(offset=1, limit=5)
+    assert [rental.id for rental, car in page] == [2, 3]
+    assert all(car.model == "Octavia" for rental, car in page)
+
+    # Аренда удаленного автомобиля не ломает отчет
+    system.cars.clear()
+    system._save_cars()
+    assert [car for rental, car in system.iter_rentals_with_cars("admin")] == [None] * 3
+
+def test_shared_mode_sees_other_process_changes(tmp_path):
+    data_dir = str(tmp_path)
+    first = CarRentalSystem(data_dir=data_dir, shared=True)
+    first.register_user("admin", "admin123", "admin")
+    first.login("admin", "admin123")
+    first.add_car("Mazda", "6", 2020, 3500)
+
+    # Второй экземпляр имитирует другой процесс с собственной копией данных
+    second = CarRentalSystem(data_dir=data_dir, shared=True)
+    assert second.login("admin", "admin123") == True
+
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=2)
+    assert first.rent_car(1, start.isoformat(), end.isoformat()) == 2 * 3500
+    # Перед проверкой второй экземпляр перечитывает измененные данные
+    assert second.rent_car(1, start.isoformat(), end.isoformat()) is None
+    assert second.rent_car(1, (end + timedelta(days=1)).isoformat(),
+                           (end + timedelta(days=2)).isoformat()) == 3500
+    assert len(first.get_user_rentals()) == 2
+
+    # Автомобиль и аренда, созданные другим процессом, находятся без явного перечитывания
+    first.add_car("Kia", "Rio", 2021, 2000)
+    assert second.rent_car(2, start.isoformat(), end.isoformat()) == 2 * 2000
+    assert first.cancel_rental(3) == True
+    assert second.rent_cars_batch([(2, start.isoformat(), end.isoformat())])[0]["error"] is None
+    first.close()
+    second.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_batch_booking_is_all_or_nothing(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Audi", "A4", 2021, 4000)
+    system.add_car("Opel", "Astra", 2018, 1800)
+
+    start = date.today() + timedelta(days=1)
+    day = lambda n: (start + timedelta(days=n)).isoformat()
+
+    # Вторая позиция пересекается с первой — пакет отклоняется целиком
+    results = system.rent_cars_batch([(1, day(0), day(2)), (1, day(2), day(4)), (2, day(0), day(1))])
+    assert [bool(result["error"]) for result in results] == [True, True, True]
+    assert "пакета" in results[1]["error"]
+    assert system.get_user_rentals() == []
+
+    results = system.rent_cars_batch([(1, day(0), day(2)), (1, day(3), day(4)), (2, day(0), day(1))])
+    assert [result["error"] for result in results] == [None, None, None]
+    assert [result["total_price"] for result in results] == [8000, 4000, 1800]
+    assert sorted(rental.id for rental in system.get_user_rentals()) == \
+        sorted(result["rental_id"] for result in results)
+
+    # Конфликт с уже сохраненной арендой тоже отклоняет пакет
+    results = system.rent_cars_batch([(2, day(5), day(6)), (1, day(1), day(2))])
+    assert results[1]["error"] == "Автомобиль занят в указанный период"
+    assert len(system.get_user_rentals()) == 3
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_search_available_filters_sorts_and_pages(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    for brand, model, year, price in [("Kia", "Rio", 2019, 2000), ("BMW", "X5", 2022, 6000),
+                                      ("Kia", "Ceed", 2021, 2500), ("BMW", "320", 2018, 4000),
+                                      ("Lada", "Vesta", 2020, 1500)]:
+        system.add_car(brand, model, year, price)
+
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=2)
+    system.rent_car(3, start.isoformat(), end.isoformat())
+    search = lambda **kwargs: [car.id for car in system.search_available(
+        start.isoformat(), end.isoformat(), **kwargs)]
+
+    assert search() == [1, 2, 4, 5]
+    assert search(sort="price") == [5, 1, 4, 2]
+    assert search(sort="-year", limit=2) == [2, 5]
+    assert search(sort="-year", limit=2, offset=2) == [1, 4]
+    assert search(brand="kia", sort="price") == [1]
+    assert search(max_price=4000, sort="-price") == [4, 1, 5]
+    assert search(min_year=2020, sort="year") == [5, 2]
+    # Новый автомобиль попадает в уже построенные индексы
+    system.add_car("Kia", "Soul", 2023, 1000)
+    assert search(sort="price", limit=1) == [6]
+    assert search(brand="Kia") == [1, 6]
+    with pytest.raises(ValueError):
+        system.search_available(sort="mileage")
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_search_available_folds_cyrillic_brand(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Лада", "Веста", 2020, 1500)
+    system.add_car("Kia", "Rio", 2019, 2000)
+    start = date.today() + timedelta(days=1)
+    search = lambda brand: [car.id for car in system.search_available(
+        start.isoformat(), (start + timedelta(days=1)).isoformat(), brand=brand)]
+
+    assert search("лада") == [1]
+    assert search("ЛАДА") == [1]
+    system.close()
+
+def test_sqlite_migrates_brand_key(tmp_path):
+    import sqlite3
+    # База старой схемы: колонки brand_key еще нет
+    conn = sqlite3.connect(str(tmp_path / "car_rental.db"))
+    conn.execute("CREATE TABLE cars (id INTEGER PRIMARY KEY, brand TEXT NOT NULL, model TEXT NOT NULL, "
+                 "year INTEGER NOT NULL, daily_price REAL NOT NULL, available INTEGER NOT NULL DEFAULT 1)")
+    conn.execute("INSERT INTO cars VALUES (1, 'Лада', 'Веста', 2020, 1500, 1)")
+    conn.commit()
+    conn.close()
+
+    system = CarRentalSystem(data_dir=str(tmp_path), storage="sqlite")
+    start = date.today() + timedelta(days=1)
+    found = system.search_available(start.isoformat(), (start + timedelta(days=1)).isoformat(), brand="лада")
+    assert [car.id for car in found] == [1]
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_search_available_pages_by_id_after_import(tmp_path, storage):
+    from rental_io import Importer
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    # Явные id идут не по порядку: порядок добавления не совпадает с порядком id
+    Importer(system).run("cars", [{"id": car_id, "brand": "Kia", "model": "Rio", "year": 2020,
+                                   "daily_price": 2000} for car_id in (7, 3, 9, 1, 5)])
+    start = date.today() + timedelta(days=1)
+    search = lambda **kwargs: [car.id for car in system.search_available(
+        start.isoformat(), (start + timedelta(days=1)).isoformat(), **kwargs)]
+
+    assert search(limit=2) == [1, 3]
+    assert search(limit=2, offset=2) == [5, 7]
+    assert search(sort="-id", limit=3) == [9, 7, 5]
+    assert search(brand="kia", limit=2, offset=1) == [3, 5]
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_occupancy_calendar_follows_bookings(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Volvo", "XC60", 2021, 5000)
+    system.add_car("Fiat", "500", 2017, 1500)
+
+    start = date.today() + timedelta(days=2)
+    system.rent_car(1, start.isoformat(), (start + timedelta(days=3)).isoformat())
+    calendar = system.occupancy_calendar()
+    assert calendar.first_free_window(1, 3) == (start + timedelta(days=4)).isoformat()
+    assert calendar.free_cars(start.isoformat(), start.isoformat()) == [2]
+    assert calendar.utilization()[2][1] == 0.5
+    assert [car.id for car in system.get_available_cars(start.isoformat())] == [2]
+
+    system.cancel_rental(system.get_user_rentals()[0].id)
+    calendar = system.occupancy_calendar()
+    assert calendar.first_free_window(1, 90) == date.today().isoformat()
+    assert [car.id for car in system.get_available_cars(start.isoformat())] == [1, 2]
+    system.close()
+
+def test_pricing_rules_and_quote_cache(tmp_path):
+    pricing = PricingEngine(brand_multipliers={"bmw": 1.5}, long_rental_discounts={7: 0.9},
+                            surge={0.5: 1.2})
+    system = CarRentalSystem(data_dir=str(tmp_path), pricing=pricing)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("BMW", "X1", 2021, 1000)
+    system.add_car("Lada", "Niva", 2019, 1000)
+
+    start = date.today() + timedelta(days=1)
+    day = lambda n: (start + timedelta(days=n)).isoformat()
+    assert system.quote(1, day(0), day(2)) == 3000
+    assert system.quote(2, day(0), day(7)) == 6300
+    assert system.quote(2, day(2), day(1)) is None
+
+    # Занята половина парка — включается надбавка, закешированные цены сбрасываются
+    assert system.rent_car(1, day(0), day(2)) == 3000
+    assert system.quote_cars(system.cars, day(0), day(2)) == {1: 3600, 2: 2400}
+
+    pricing.configure(surge={})
+    assert system.quote(2, day(0), day(2)) == 2000
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_scheduler_completes_and_archives_rentals(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    day = lambda n: (start + timedelta(days=n)).isoformat()
+    system.rent_car(1, day(0), day(2))
+    system.rent_car(1, day(10), day(12))
+    system.rent_car(1, day(20), day(21))
+    system.cancel_rental(3)
+
+    # Часы планировщика переведены на день после окончания первой аренды
+    scheduler = LifecycleScheduler(system, clock=lambda: start + timedelta(days=3))
+    assert scheduler.run_once() == {"completed": 1, "archived": 2}
+    assert [rental.id for rental in system.rentals] == [2]
+    assert sorted((rental.id, rental.status) for rental in system.storage.iter_archived_rentals()) == \
+        [(1, "completed"), (3, "cancelled")]
+    assert scheduler.run_once() == {"completed": 0, "archived": 0}
+
+    # id архивных аренд не выдаются повторно и после перезапуска
+    system.close()
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.login("admin", "admin123")
+    system.rent_car(1, day(30), day(31))
+    assert sorted(rental.id for rental in system.iter_rental_history()) == [1, 2, 3, 4]
+    system.close()
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_only_active_rentals_can_be_cancelled(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    system.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat())
+    assert [rental.status for rental in system.get_user_rentals()] == ["active"]
+
+    assert system.complete_rental(1) == True
+    assert system.cancel_rental(1) == False
+    assert [rental.status for rental in system.get_user_rentals()] == ["completed"]
+    system.close()
+
+def test_scheduler_sees_imported_rentals(tmp_path):
+    from rental_io import Importer
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    system.register_user("ivan", "secret")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    scheduler = LifecycleScheduler(system, clock=lambda: start + timedelta(days=3))
+
+    # Аренда импортирована после построения кучи — планировщик узнает о ней из события
+    Importer(system).run("rentals", [{"car_id": 1, "username": "ivan", "start_date": start.isoformat(),
+                                      "end_date": (start + timedelta(days=2)).isoformat()}])
+    assert scheduler.run_once() == {"completed": 1, "archived": 1}
+    assert system.rentals == []
+    system.close()
+
+def test_archive_does_not_race_with_bookings(tmp_path):
+    import threading
+    from car_rental import Rental
+    system = CarRentalSystem(data_dir=str(tmp_path), journal=True)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    for _ in range(50):
+        system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    day = lambda n: (start + timedelta(days=n)).isoformat()
+    # Много более ранних аренд: индекс автомобиля 1 попадает в конец перестроения при архивации
+    storage = system.storage
+    storage.add_rentals([
+        Rental(storage.next_rental_id(), car_id, "admin", day(n), day(n + 1), 2000)
+        for car_id in range(2, 51) for n in range(0, 400, 2)
+    ])
+    cancelled = [Rental(storage.next_rental_id(), 2, "admin", day(-1), day(0), 0, "cancelled")
+                 for _ in range(3)]
+    storage.add_rentals(cancelled)
+    periods = [(day(n), day(n + 1)) for n in range(500, 540, 2)]
+    for period in periods:
+        system.rent_car(1, *period)
+
+    done = threading.Event()
+
+    def archive():
+        for rental in cancelled:
+            storage.archive_rentals([rental])
+        done.set()
+
+    def book():
+        # Все периоды уже заняты: ни одна из повторных броней не должна пройти
+        while not done.is_set():
+            for period in periods:
+                system.rent_car(1, *period)
+
+    threads = [threading.Thread(target=archive)] + [threading.Thread(target=book) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    booked = sorted((rental.start_date, rental.end_date) for rental in system.rentals
+                    if rental.car_id == 1 and rental.status == "active")
+    assert booked == periods
+    system.close()
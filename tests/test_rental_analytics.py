@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+import pytest
+
+from car_rental import CarRentalSystem, Rental, RentalTable
+from rental_analytics import RentalAnalytics, RentalStats, np
+from rental_io import Importer
+
+
+def _rentals():
+    return [
+        Rental(1, 1, "u", "2030-01-30", "2030-02-02", 3000, "completed"),
+        Rental(2, 2, "u", "2030-02-01", "2030-02-03", 4000, "active"),
+        Rental(3, 1, "u", "2030-02-05", "2030-02-06", 1000, "cancelled"),
+        Rental(4, 3, "u", "2030-02-01", "2030-02-02", 500, "active"),
+    ]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_analytics_over_columns(use_numpy):
+    if use_numpy and np is None:
+        pytest.skip("NumPy не установлен")
+    analytics = RentalAnalytics(RentalTable.from_rentals(_rentals()),
+                                {1: "Kia", 2: "BMW", 3: "Kia"}, use_numpy)
+    assert analytics.revenue_by_day() == {"2030-01-30": 3000, "2030-02-01": 4500}
+    assert analytics.revenue_by_month() == {"2030-01": 3000, "2030-02": 4500}
+    assert analytics.revenue_by_brand() == {"BMW": 4000, "Kia": 3500}
+    assert analytics.average_length() == 2
+    assert analytics.cancellation_rate() == 0.25
+    # 1 февраля заняты все три автомобиля, 2 февраля — только второй
+    assert analytics.utilization("2030-02-01", "2030-02-02") == 4 / 6
+
+
+def test_incremental_stats_follow_bookings(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    system.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat())
+
+    stats = RentalStats.attach(system)
+    system.add_car("BMW", "X3", 2022, 5000)
+    system.rent_car(2, start.isoformat(), (start + timedelta(days=1)).isoformat())
+    system.rent_car(1, (start + timedelta(days=5)).isoformat(), (start + timedelta(days=6)).isoformat())
+    system.cancel_rental(3)
+    # Пакетный импорт тоже обновляет агрегаты
+    Importer(system).run("rentals", [{"car_id": 2, "username": "admin",
+                                      "start_date": (start + timedelta(days=3)).isoformat(),
+                                      "end_date": (start + timedelta(days=5)).isoformat()}])
+
+    full = RentalAnalytics.from_system(system, use_numpy=False)
+    window = (start.isoformat(), (start + timedelta(days=9)).isoformat())
+    assert stats.summary(*window) == full.summary(*window)
+    assert stats.revenue_by_brand() == {"BMW": 15000, "Kia": 4000}
+    system.close()
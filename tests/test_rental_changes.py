@@ -0,0 +1,177 @@
+from datetime import date, timedelta
+
+import pytest
+
+from car_rental import CarRentalSystem
+from rental_changes import ChangeFeed, ChangeFeedReader, list_segments
+from rental_io import Importer
+
+
+def test_system_events_and_resume(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), change_feed=True, password_iterations=1000)
+    received = []
+    system.change_feed.subscribe(received.append)
+
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    system.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat())
+    system.cancel_rental(1)
+    system.cancel_rental(1)    # повторная отмена ничего не меняет и события не дает
+
+    types = ["user_registered", "car_added", "rental_added", "rental_cancelled"]
+    assert [event["type"] for event in received] == types
+    assert [event["offset"] for event in received] == [0, 1, 2, 3]
+    assert "password" not in received[0]["data"]
+    assert received[3]["data"]["status"] == "cancelled"
+
+    reader = ChangeFeedReader(str(tmp_path / "changes"), offset=2)
+    assert [event["type"] for event in reader.read()] == types[2:]
+    assert reader.read() == [] and reader.offset == 4
+    system.add_car("BMW", "X5", 2022, 5000)
+    assert [event["offset"] for event in reader.read()] == [4]
+
+    # Подписка с номером сначала отдает уже записанные события
+    replayed = []
+    system.change_feed.subscribe(replayed.append, offset=3)
+    assert [event["offset"] for event in replayed] == [3, 4]
+    system.close()
+
+    # После перезапуска нумерация продолжается
+    reopened = CarRentalSystem(data_dir=str(tmp_path), change_feed=True, password_iterations=1000)
+    reopened.register_user("ivan", "secret")
+    assert [event["offset"] for event in reader.read()] == [5]
+    reopened.close()
+
+
+def test_segments_roll_and_prune(tmp_path):
+    directory = str(tmp_path / "changes")
+    feed = ChangeFeed(directory, segment_size=200, fsync=False)
+    for n in range(10):
+        feed.append("car_added", {"id": n})
+    segments = list_segments(directory)
+    assert len(segments) > 2 and segments[0] == 0
+
+    reader = ChangeFeedReader(directory, offset=0)
+    assert [event["data"]["id"] for event in reader.read(limit=4)] == [0, 1, 2, 3]
+    assert [event["data"]["id"] for event in reader.read()] == list(range(4, 10))
+
+    assert feed.prune(before_offset=segments[2]) == 2
+    assert list_segments(directory) == segments[2:]
+    assert [event["offset"] for event in ChangeFeedReader(directory, offset=segments[2]).read()][0] == segments[2]
+    feed.close()
+
+
+def test_listener_error_does_not_reach_caller(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), change_feed=True, password_iterations=1000)
+
+    class Broken:
+        def rental_added(self, rental):
+            raise RuntimeError("сбой подписчика")
+
+    system.listeners.insert(0, Broken())
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    assert system.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat()) == 4000
+    assert isinstance(system.listener_error, RuntimeError)
+    # Остальные подписчики событие получили
+    events = ChangeFeedReader(str(tmp_path / "changes")).read()
+    assert [event["type"] for event in events][-1] == "rental_added"
+    system.close()
+
+
+def test_import_reaches_feed(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), change_feed=True, password_iterations=1000)
+    importer = Importer(system, batch_size=2)
+    importer.run("cars", [{"brand": "Kia", "model": "Rio", "year": 2020, "daily_price": 2000}] * 3)
+    importer.run("users", [{"username": "ivan", "password": "secret"}])
+    start = date.today() + timedelta(days=1)
+    importer.run("rentals", [{"car_id": 2, "username": "ivan", "start_date": start.isoformat(),
+                              "end_date": (start + timedelta(days=1)).isoformat()}])
+
+    events = ChangeFeedReader(str(tmp_path / "changes")).read()
+    assert [event["type"] for event in events] == ["car_added"] * 3 + ["user_registered", "rental_added"]
+    assert [event["data"]["id"] for event in events[:3]] == [1, 2, 3]
+    assert "password" not in events[3]["data"] and events[4]["data"]["car_id"] == 2
+    system.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    directory = str(tmp_path / "changes")
+    feed = ChangeFeed(directory, fsync=False)
+    feed.append("car_added", {"id": 1})
+    feed.close()
+    # Сбой посреди записи второго события оставил половину строки
+    path = tmp_path / "changes" / "00000000000000000000.jsonl"
+    with open(path, "ab") as f:
+        f.write(b'{"offset": 1, "time": "2026-')
+
+    feed = ChangeFeed(directory, fsync=False)
+    assert feed.next_offset == 1
+    feed.append("car_added", {"id": 2})
+    feed.close()
+    events = ChangeFeedReader(directory).read()
+    assert [(event["offset"], event["data"]["id"]) for event in events] == [(0, 1), (1, 2)]
+
+    # Поврежденная полная строка — понятная ошибка, а не JSONDecodeError
+    with open(path, "ab") as f:
+        f.write(b'{"offset": 2, "ti\n')
+    reader = ChangeFeedReader(directory, offset=1)
+    assert len(reader.read()) == 1
+    with pytest.raises(ValueError, match="Поврежденное событие"):
+        reader.read()
+    with pytest.raises(ValueError, match="Поврежденное событие"):
+        ChangeFeedReader(directory, offset=5).read()
+
+
+def test_subscribe_replay_can_append(tmp_path):
+    feed = ChangeFeed(str(tmp_path / "changes"), fsync=False)
+    feed.append("car_added", {"id": 1})
+    feed.append("car_added", {"id": 2})
+    received = []
+
+    def callback(event):
+        received.append(event["offset"])
+        if event["offset"] == 0:
+            feed.append("car_added", {"id": 3})    # запись из обработчика не блокируется
+        if event["offset"] == 1:
+            raise RuntimeError("сбой подписчика")
+
+    feed.subscribe(callback, offset=0)
+    # Событие, дописанное во время передачи, дочитано до регистрации подписки
+    assert received == [0, 1, 2]
+    assert isinstance(feed.last_error, RuntimeError)
+    feed.append("car_added", {"id": 4})
+    assert received == [0, 1, 2, 3]
+    feed.close()
+
+
+def test_feed_write_failure_stops_feed(tmp_path, caplog):
+    system = CarRentalSystem(data_dir=str(tmp_path), change_feed=True, password_iterations=1000)
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    feed = system.change_feed
+    handle = feed._handle
+
+    class FullDisk:
+        name = handle.name
+
+        def write(self, data):
+            raise OSError(28, "No space left on device")
+
+        def close(self):
+            handle.close()
+
+    feed._handle = FullDisk()
+    # Изменение сохранено, сбой ленты записан в журнал логов, а не проброшен вызывающему
+    assert system.add_car("Kia", "Rio", 2020, 2000) == True
+    assert isinstance(feed.broken, OSError)
+    assert "car_added" in caplog.text
+    # Следующие события не ложатся в ленту после пропущенного
+    with pytest.raises(RuntimeError):
+        feed.append("car_added", {"id": 2})
+    assert ChangeFeedReader(str(tmp_path / "changes")).read()[-1]["type"] == "user_registered"
+    system.close()
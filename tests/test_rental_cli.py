@@ -0,0 +1,58 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from car_rental import CarRentalSystem
+from rental_cli import iter_argv_commands, main
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_script_replay_writes_once(tmp_path, capsys, storage):
+    data_dir = str(tmp_path / "data")
+    start = date.today() + timedelta(days=1)
+    commands = [
+        {"cmd": "register_user", "args": ["admin", "admin123", "admin"]},
+        {"cmd": "login", "username": "admin", "password": "admin123"},
+        {"cmd": "add_car", "args": ["Kia", "Rio", "2020", "2000"]},
+        {"cmd": "rent_car", "car_id": 1, "start_date": start.isoformat(),
+         "end_date": (start + timedelta(days=2)).isoformat()},
+        {"cmd": "rent_car", "args": [1, start.isoformat(), (start + timedelta(days=1)).isoformat()]},
+        {"cmd": "fly_away"},
+        {"cmd": "cancel_rental", "args": ["x"]},
+        {"cmd": "get_user_rentals"},
+    ]
+    script = tmp_path / "ops.jsonl"
+    script.write_text("\n".join(json.dumps(command) for command in commands) + "\nnot json\n")
+
+    assert main(["--data-dir", data_dir, "--storage", storage, "--password-iterations", "1000",
+                 "--script", str(script)]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [line.get("ok") for line in lines[:-1]] == [True, True, True, True, False, False, False, True, False]
+    assert lines[3]["result"] == 4000
+    assert "Неизвестная команда" in lines[5]["error"]
+    assert len(lines[7]["result"]) == 1
+    assert lines[-1]["summary"]["commands"] == 9 and lines[-1]["summary"]["failed"] == 4
+
+    system = CarRentalSystem(data_dir=data_dir, storage=storage)
+    assert len(system.cars) == 1 and len(system.rentals) == 1
+    system.close()
+
+
+def test_argv_commands_and_journal_group(tmp_path, capsys):
+    assert list(iter_argv_commands(["login", "a", "b", "+", "+", "logout"])) == [
+        ("login", ["a", "b"], {}), ("logout", [], {})
+    ]
+    data_dir = str(tmp_path)
+    argv = ["--data-dir", data_dir, "--journal", "--password-iterations", "1000", "--quiet",
+            "register_user", "admin", "admin123", "admin", "+", "login", "admin", "admin123"]
+    for brand in ("Kia", "BMW"):
+        argv += ["+", "add_car", brand, "X", "2020", "1000"]
+    assert main(argv) == 0
+    assert json.loads(capsys.readouterr().out)["summary"]["commands"] == 4
+    # Три изменения группы дописаны в журнал одной записью
+    with open(tmp_path / "journal.jsonl") as f:
+        assert len(f.readlines()) == 3
+    system = CarRentalSystem(data_dir=data_dir, journal=True)
+    assert [car.brand for car in system.cars] == ["Kia", "BMW"]
+    system.close()
@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import date, timedelta
+
+import pytest
+
+from car_rental import CarRentalSystem, PasswordHasher, PricingEngine
+from rental_io import Importer, export_file, import_file, iter_records
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_import_validates_and_skips_bad_rows(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    cars_csv = tmp_path / "fleet.csv"
+    cars_csv.write_text(
+        "id,brand,model,year,daily_price,available\n"
+        ",Toyota,Camry,2021,3000,true\n"
+        "5,Kia,Rio,2020,2000,1\n"
+        "5,Kia,Rio,2020,2000,1\n"      # повторный id
+        ",Lada,Vesta,год,1500,1\n",     # год не число
+        encoding="utf-8",
+    )
+    report = import_file(system, "cars", str(cars_csv), batch_size=2)
+    assert report.imported == 2
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert sorted(car.id for car in system.cars) == [1, 5]
+
+    users = tmp_path / "users.jsonl"
+    users.write_text('{"username": "ivan", "password": "secret"}\n', encoding="utf-8")
+    assert import_file(system, "users", str(users)).imported == 1
+    # Открытый пароль хешируется при импорте и не попадает на диск
+    assert PasswordHasher.is_hashed(system.storage.get_user("ivan").password)
+    system.close()
+    for name in ("users.json", "journal.jsonl", "car_rental.db"):
+        if os.path.exists(tmp_path / name):
+            assert b"secret" not in (tmp_path / name).read_bytes()
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage)
+    assert system.login("ivan", "secret") == True
+
+    start = date.today() + timedelta(days=1)
+    rows = [
+        {"car_id": 1, "username": "ivan", "start_date": start.isoformat(),
+         "end_date": (start + timedelta(days=2)).isoformat()},
+        {"car_id": 1, "username": "ivan", "start_date": (start + timedelta(days=1)).isoformat(),
+         "end_date": (start + timedelta(days=3)).isoformat()},       # пересечение
+        {"car_id": 1, "username": "ivan", "start_date": (start + timedelta(days=1)).isoformat(),
+         "end_date": (start + timedelta(days=3)).isoformat(), "status": "cancelled"},
+        {"car_id": 9, "username": "ivan", "start_date": start.isoformat(),
+         "end_date": (start + timedelta(days=1)).isoformat()},       # нет автомобиля
+    ]
+    rentals = tmp_path / "rentals.jsonl"
+    rentals.write_text("\n".join(json.dumps(row) for row in rows), encoding="utf-8")
+    report = import_file(system, "rentals", str(rentals))
+    assert report.imported == 2
+    assert [line for line, _ in report.errors] == [2, 4]
+    assert system.get_user_rentals()[0].total_price == 2 * 3000
+    assert not system.is_car_free(1, start.isoformat(), start.isoformat())
+    system.close()
+
+
+def test_export_round_trip(tmp_path):
+    source = CarRentalSystem(data_dir=str(tmp_path / "source"))
+    source.register_user("admin", "admin123", "admin")
+    source.login("admin", "admin123")
+    source.add_car("BMW", "X5", 2022, 5000)
+    start = date.today() + timedelta(days=1)
+    source.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat())
+
+    for kind, name in (("cars", "cars.csv"), ("users", "users.json"), ("rentals", "rentals.jsonl")):
+        assert export_file(source, kind, str(tmp_path / name)) == 1
+    assert list(iter_records(str(tmp_path / "cars.csv")))[0]["model"] == "X5"
+
+    target = CarRentalSystem(data_dir=str(tmp_path / "target"))
+    for kind, name in (("cars", "cars.csv"), ("users", "users.json"), ("rentals", "rentals.jsonl")):
+        assert import_file(target, kind, str(tmp_path / name)).failed == 0
+    assert [rental.to_dict() for rental in target.rentals] == [rental.to_dict() for rental in source.rentals]
+    assert target.login("admin", "admin123") == True
+    source.close()
+    target.close()
+
+
+def test_import_refreshes_surge_prices(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), pricing=PricingEngine(surge={0.5: 1.2}))
+    importer = Importer(system)
+    importer.run("cars", [{"brand": "Kia", "model": "Rio", "year": 2020, "daily_price": 1000}] * 2)
+    importer.run("users", [{"username": "ivan", "password": "secret"}])
+    start = date.today() + timedelta(days=1)
+    period = (start.isoformat(), (start + timedelta(days=2)).isoformat())
+    assert system.quote(2, *period) == 2000
+
+    # Импортированная аренда занимает половину парка — закешированная цена не годится
+    importer.run("rentals", [{"car_id": 1, "username": "ivan", "start_date": period[0], "end_date": period[1]}])
+    assert system.quote(2, *period) == 2400
+    # Новые автомобили снижают загрузку парка
+    importer.run("cars", [{"brand": "Kia", "model": "Rio", "year": 2020, "daily_price": 1000}])
+    assert system.quote(2, *period) == 2000
+    system.close()
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_rental_overlaps_checked_alike_on_both_storages(tmp_path, storage):
+    system = CarRentalSystem(data_dir=str(tmp_path), storage=storage, password_iterations=1000)
+    importer = Importer(system)
+    importer.run("cars", [{"brand": "Kia", "model": "Rio", "year": 2020, "daily_price": 1000}])
+    importer.run("users", [{"username": "ivan", "password": "secret"}])
+    day = lambda n: (date.today() + timedelta(days=n)).isoformat()
+    rental = lambda start, end: {"car_id": 1, "username": "ivan", "start_date": day(start), "end_date": day(end)}
+
+    assert importer.run("rentals", [rental(-10, -5), rental(3, 6)]).imported == 2
+    # Прошлые периоды с сохраненными арендами не сравниваются, будущие — сравниваются
+    assert importer.run("rentals", [rental(-8, -6)]).imported == 1
+    report = importer.run("rentals", [rental(-2, 4)])
+    assert report.imported == 0 and "пересекается" in report.errors[0][1]
+    system.close()
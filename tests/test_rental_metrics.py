@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+import pytest
+
+from car_rental import CarRentalSystem
+from rental_metrics import Histogram, Metrics, log_buckets, metrics
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.reset()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.reset()
+
+
+def test_histogram_and_prometheus_text():
+    registry = Metrics()
+    registry.count("calls_total")
+    assert registry.snapshot()["counters"] == {}    # выключено — ничего не пишется
+
+    registry.enable()
+    histogram = Histogram(log_buckets(1, 1024))
+    for value in range(1, 101):
+        histogram.observe(value)
+    assert histogram.count == 100 and histogram.sum == 5050
+    # Корзины по степеням двойки с делениями: ошибка квантиля меньше половины значения
+    assert 50 <= histogram.quantile(0.5) < 75
+    assert 99 <= histogram.quantile(0.99) < 150
+
+    registry.observe("latency_seconds", 0.002, operation="rent_car")
+    registry.observe("latency_seconds", 5.0, operation="rent_car")
+    registry.count("calls_total", 2, operation="rent_car")
+    text = registry.to_prometheus(prefix="")
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{operation="rent_car",le="+Inf"} 2' in text
+    # Выводятся все корзины, и пустые тоже, с накопленными счетами
+    buckets = [line.rsplit(" ", 1) for line in text.splitlines() if line.startswith("latency_seconds_bucket")]
+    assert len(buckets) == len(registry.histograms[("latency_seconds", (("operation", "rent_car"),))].bounds) + 1
+    counts = [int(count) for _, count in buckets]
+    assert counts == sorted(counts) and counts[0] == 0 and counts[-1] == 2
+    assert 'latency_seconds_count{operation="rent_car"} 2' in text
+    assert 'calls_total{operation="rent_car"} 2' in text
+
+
+def test_system_operations_are_measured(tmp_path, enabled_metrics):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    system.login("admin", "admin123")
+    system.add_car("Kia", "Rio", 2020, 2000)
+    start = date.today() + timedelta(days=1)
+    system.get_available_cars(start.isoformat(), start.isoformat())
+    assert system.rent_car(1, start.isoformat(), (start + timedelta(days=2)).isoformat()) == 4000
+
+    snapshot = enabled_metrics.snapshot()
+    assert snapshot["counters"]['operation_calls_total{operation="rent_car"}'] == 1
+    assert snapshot["histograms"]['operation_seconds{operation="get_available_cars"}']["count"] == 1
+    assert snapshot["histograms"]['storage_records_scanned{query="available_cars"}']["sum"] == 1
+    assert snapshot["histograms"]['storage_write_bytes{file="rentals.json"}']["sum"] > 0
+    system.close()
+
+
+def test_cprofile_sampling():
+    registry = Metrics(enabled=True, profile="cprofile", profile_every=2)
+
+    @registry.timed("work")
+    def work(n):
+        return sum(range(n))
+
+    for _ in range(4):
+        assert work(1000) == 499500
+    assert registry.snapshot()["counters"]['operation_calls_total{operation="work"}'] == 4
+    assert registry.profile_stats is not None and registry.profile_stats.total_calls > 0
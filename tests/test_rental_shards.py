@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+
+import pytest
+
+from rental_shards import ShardedRentalSystem
+
+
+def test_router_dispatches_and_merges(tmp_path):
+    data_dir = str(tmp_path)
+    system = ShardedRentalSystem(data_dir, shards=2, password_iterations=1000, journal=True)
+    try:
+        system.register_user("admin", "admin123", "admin")
+        system.register_user("ivan", "secret")
+        admin = system.start_session("admin", "admin123")
+        ivan = system.start_session("ivan", "secret")
+        assert system.add_car("Kia", "Rio", 2019, 2000, ivan) is None
+
+        prices = [4000, 1500, 3000, 2500]
+        car_ids = [system.add_car("Kia", f"M{n}", 2020 + n, price, admin) for n, price in enumerate(prices)]
+        # Автомобили разложены по обоим шардам, id уникальны
+        assert len(set(car_ids)) == 4 and {car_id % 2 for car_id in car_ids} == {0, 1}
+
+        start = date.today() + timedelta(days=1)
+        period = (start.isoformat(), (start + timedelta(days=2)).isoformat())
+        assert system.rent_cars([(car_ids[0], *period), (car_ids[1], *period), (car_ids[0], *period)],
+                                ivan) == [8000, 3000, None]
+        assert system.quote(car_ids[2], *period) == 6000
+
+        available = system.get_available_cars(*period)
+        assert [car.id for car in available] == sorted([car_ids[2], car_ids[3]])
+        page = system.search_available(*period, sort="-price", limit=1, offset=1)
+        assert [car.daily_price for car in page] == [2500]
+        with pytest.raises(ValueError):
+            system.search_available(*period, sort="color")
+
+        rentals = system.get_user_rentals(ivan)
+        assert sorted(rental.car_id for rental in rentals) == sorted(car_ids[:2])
+        assert system.cancel_rental(rentals[0].id, admin) is False
+        assert system.cancel_rental(rentals[0].id, ivan) is True
+        assert len(system.get_available_cars(*period)) == 3
+    finally:
+        system.close()
+
+    # Данные шардов сохраняются, а другое число шардов для той же папки запрещено
+    with pytest.raises(ValueError):
+        ShardedRentalSystem(data_dir, shards=3, password_iterations=1000)
+    reopened = ShardedRentalSystem(data_dir, shards=2, password_iterations=1000, journal=True)
+    try:
+        session = reopened.start_session("ivan", "secret")
+        assert len(reopened.get_user_rentals(session)) == 2
+    finally:
+        reopened.close()
+
+
+def test_branch_partitioning(tmp_path):
+    system = ShardedRentalSystem(str(tmp_path), branches=["Москва", "Казань"], password_iterations=1000)
+    try:
+        system.register_user("admin", "admin123", "admin")
+        admin = system.start_session("admin", "admin123")
+        car_id = system.add_car("Lada", "Vesta", 2021, 1500, admin, branch="Казань")
+        assert system.branch_of(car_id) == "Казань"
+        with pytest.raises(ValueError):
+            system.add_car("Lada", "Vesta", 2021, 1500, admin, branch="Сочи")
+    finally:
+        system.close()
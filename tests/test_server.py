@@ -0,0 +1,162 @@
+import asyncio
+import json
+import time
+from datetime import date, timedelta
+
+from car_rental import CarRentalSystem
+from rental_server import RentalServer
+
+
+async def _request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    data = await reader.readexactly(int(headers["content-length"]))
+    return status, json.loads(data)
+
+
+def test_http_api_flow(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    start = date.today() + timedelta(days=1)
+    end = start + timedelta(days=2)
+
+    async def scenario():
+        server = RentalServer(system)
+        host, port = await server.start("127.0.0.1", 0)
+        admin = await asyncio.open_connection(host, port)
+        user = await asyncio.open_connection(host, port)
+        try:
+            assert (await _request(*admin, "POST", "/login",
+                                   {"username": "admin", "password": "admin123"}))[0] == 200
+            assert (await _request(*admin, "POST", "/admin/cars",
+                                   {"brand": "Ford", "model": "Focus", "year": 2019,
+                                    "daily_price": 2200}))[0] == 201
+
+            # Сессии разных соединений независимы
+            assert (await _request(*user, "POST", "/register",
+                                   {"username": "user1", "password": "pass1"}))[0] == 201
+            assert (await _request(*user, "POST", "/admin/cars", {}))[0] == 401
+            assert (await _request(*user, "POST", "/login",
+                                   {"username": "user1", "password": "pass1"}))[0] == 200
+
+            rent = {"car_id": 1, "start_date": start.isoformat(), "end_date": end.isoformat()}
+            assert await _request(*user, "POST", "/rentals", rent) == (201, {"total_price": 4400})
+            assert (await _request(*user, "POST", "/rentals", rent))[0] == 409
+
+            status, rentals = await _request(*user, "GET", "/rentals")
+            assert [rental["car_id"] for rental in rentals] == [1]
+            assert (await _request(*user, "POST", f"/rentals/{rentals[0]['id']}/cancel"))[0] == 200
+
+            status, page = await _request(*admin, "GET", "/admin/rentals?limit=10")
+            assert page[0]["status"] == "cancelled" and page[0]["car"]["model"] == "Focus"
+            assert (await _request(*admin, "GET", "/missing"))[0] == 404
+
+            # Токен сессии действует и в другом соединении
+            status, login = await _request(*user, "POST", "/login",
+                                           {"username": "admin", "password": "admin123"})
+            other = await asyncio.open_connection(host, port)
+            other[1].write(b"GET /admin/rentals HTTP/1.1\r\nConnection: close\r\n"
+                           b"Authorization: Bearer " + login["token"].encode() + b"\r\n\r\n")
+            assert (await other[0].read()).startswith(b"HTTP/1.1 200")
+            other[1].close()
+        finally:
+            for _, writer in (admin, user):
+                writer.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_reads_do_not_block_event_loop_during_write(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path))
+    system.register_user("admin", "admin123", "admin")
+    save_cars = system.storage.save_cars
+
+    def slow_save_cars():
+        # Медленный диск: запись держит блокировку хранилища
+        time.sleep(1)
+        save_cars()
+
+    system.storage.save_cars = slow_save_cars
+    start = date.today() + timedelta(days=1)
+    period = f"start={start.isoformat()}&end={(start + timedelta(days=2)).isoformat()}"
+
+    async def scenario():
+        server = RentalServer(system)
+        host, port = await server.start("127.0.0.1", 0)
+        connections = [await asyncio.open_connection(host, port) for _ in range(2)]
+        try:
+            assert (await _request(*connections[0], "POST", "/login",
+                                   {"username": "admin", "password": "admin123"}))[0] == 200
+            write = asyncio.ensure_future(_request(
+                *connections[0], "POST", "/admin/cars",
+                {"brand": "Ford", "model": "Focus", "year": 2019, "daily_price": 2200}
+            ))
+            await asyncio.sleep(0.2)
+            # Чтение ждет блокировку хранилища в пуле потоков, а не в цикле событий
+            read = asyncio.ensure_future(_request(*connections[1], "GET", f"/cars/available?{period}"))
+            await asyncio.sleep(0.05)
+
+            started = time.perf_counter()
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n")
+            assert (await reader.read()).startswith(b"HTTP/1.1 200")
+            writer.close()
+            assert time.perf_counter() - started < 0.5
+            assert not write.done()
+
+            assert (await write)[0] == 201
+            status, cars = await read
+            assert status == 200 and [car["model"] for car in cars] == ["Focus"]
+        finally:
+            for _, writer in connections:
+                writer.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_bad_input_and_internal_errors(tmp_path):
+    system = CarRentalSystem(data_dir=str(tmp_path), password_iterations=1000)
+    system.register_user("admin", "admin123", "admin")
+
+    async def scenario():
+        server = RentalServer(system)
+
+        async def broken(request, session):
+            raise RuntimeError("секретная подробность")
+
+        server.routes[("GET", "broken")] = broken
+        host, port = await server.start("127.0.0.1", 0)
+        connection = await asyncio.open_connection(host, port)
+        try:
+            # Текст исключения не уходит клиенту
+            status, payload = await _request(*connection, "GET", "/broken")
+            assert status == 500 and "секретная" not in payload["error"]
+
+            assert (await _request(*connection, "POST", "/login",
+                                   {"username": "admin", "password": "admin123"}))[0] == 200
+            assert (await _request(*connection, "GET", "/admin/rentals?offset=-1"))[0] == 400
+            assert (await _request(*connection, "GET", "/cars/available?offset=-5"))[0] == 400
+
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"POST /login HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+            assert (await reader.read()).startswith(b"HTTP/1.1 400")
+            writer.close()
+        finally:
+            connection[1].close()
+            await server.stop()
+
+    asyncio.run(scenario())